@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Hot-path benchmarks for edcipsi / edcipsi-gen.
+
+Synthetic TriRhombus Heisenberg/XXZ models are generated with
+edcipsi_gen.lattice.build_interall at several cluster sizes; random
+basis subsets of several sizes are then fed to each kernel.
+
+    python bench/bench_hotpaths.py --out bench_output.json
+    python bench/bench_hotpaths.py --quick --baseline bench/baseline.json
+    python bench/bench_hotpaths.py --save-baseline bench/baseline.json
+
+Results are JSON: {"meta": {...}, "results": {case_key: {"min": s, "median": s, ...}}}.
+With --baseline, every case is compared by min time and the script exits
+with status 1 if any case is slower than --tolerance (default 1.25x).
+"""
+from __future__ import annotations
+import argparse, json, math, os, platform, random, statistics, sys, tempfile, time
+from contextlib import redirect_stdout
+import numpy as np
+
+from edcipsi_gen.lattice import build_interall
+from edcipsi_gen.writers import write_greentwo
+from edcipsi.io import read_interall, read_greentwo_def, canonicalize_terms
+from edcipsi.hbuilder import build_subspace_matrix, build_subspace_matrix_blocked
+from edcipsi.cipsi import connected_amplitudes, run_cipsi_once
+from edcipsi.observables import expect_greentwo
+from edcipsi.fulled import run_full_ed
+from edcipsi.nbkernels import NUMBA_OK, pack_terms_arrays, _h_matvec_nb
+
+# (Lx, Ly) clusters and basis sizes for the full and --quick sweeps
+SIZES_FULL  = [(3, 3), (4, 4), (4, 5)]
+BASIS_FULL  = [1000, 4000]
+SIZES_QUICK = [(3, 3), (4, 4)]
+BASIS_QUICK = [500]
+
+def _J(jxy: float, jz: float) -> np.ndarray:
+    return np.diag([jxy, jxy, jz]).astype(complex)
+
+def model_items(model: str):
+    """Nearest-neighbour bonds of the triangular lattice."""
+    J = _J(1.0, 1.0) if model == "heisenberg" else _J(1.0, 0.5)
+    return [(1, 0, 0, J), (0, 1, 0, J), (1, -1, 0, J)]
+
+def random_basis(N: int, size: int, rng: random.Random):
+    """Distinct Sz=0 determinants (capped at the sector dimension)."""
+    size = min(size, math.comb(N, N // 2))
+    seen = {}
+    while len(seen) < size:
+        b = 0
+        for p in rng.sample(range(N), N // 2):
+            b |= 1 << p
+        seen[b] = None
+    return list(seen)
+
+def timeit(fn, repeat: int):
+    ts = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); ts.append(time.perf_counter() - t0)
+    return {"min": min(ts), "median": statistics.median(ts), "repeat": repeat}
+
+def bench_case(Lx, Ly, model, B, repeat, workdir, results, procs):
+    N = Lx * Ly
+    tag = f"{model}/N{N}"
+    a1, a2 = (1.0, 0.0), (0.5, math.sqrt(3) / 2.0)
+    items = model_items(model)
+    inter = os.path.join(workdir, f"interall_{model}_{N}.def")
+    green2 = os.path.join(workdir, f"greentwo_{N}.def")
+
+    key = f"build_interall/{tag}"
+    if key not in results:
+        results[key] = timeit(lambda: build_interall(Lx, Ly, items, inter, a1=a1, a2=a2), repeat)
+        write_greentwo(Lx, Ly, green2, include_spinflip=True)
+    with redirect_stdout(open(os.devnull, "w")):
+        diag_terms, bilinear_terms = read_interall(inter)
+    diag_terms, bilinear_terms, _ = canonicalize_terms(diag_terms, bilinear_terms)   # as cli.main does
+    ops2 = read_greentwo_def(green2)
+    key = f"full_ed_sector/{tag}"
+    if NUMBA_OK and key not in results and N <= 20:
+        # exact Sz=0 reference (the number CIPSI accuracy is measured against)
+        def full_ed():
+            with redirect_stdout(open(os.devnull, "w")):
+                return run_full_ed(N, diag_terms, bilinear_terms, sector_Sz=0.5 * (N % 2))
+        results[key] = timeit(full_ed, 1)
+
+    rng = random.Random(1234 + N + B)
+    basis = random_basis(N, B, rng)
+    tag = f"{tag}/B{len(basis)}"
+    vec = np.array([complex(rng.gauss(0, 1), rng.gauss(0, 1)) for _ in basis])
+    vec /= np.linalg.norm(vec)
+
+    quiet = dict(verbose=False)
+    results[f"connected_amplitudes/{tag}"] = timeit(
+        lambda: connected_amplitudes(basis, vec, bilinear_terms), repeat)
+    results[f"build_subspace_matrix/{tag}"] = timeit(
+        lambda: build_subspace_matrix(basis, N, diag_terms, bilinear_terms), repeat)
+    results[f"build_subspace_matrix_half/{tag}"] = timeit(
+        lambda: build_subspace_matrix(basis, N, diag_terms, bilinear_terms, half=True), repeat)
+    if NUMBA_OK:
+        results[f"build_subspace_matrix_numpy/{tag}"] = timeit(
+            lambda: build_subspace_matrix(basis, N, diag_terms, bilinear_terms, nb_build=False), repeat)
+    # the process-pool builders (what --build-blocked does without Numba)
+    py = dict(quiet, nb_build=False)
+    results[f"build_blocked_serial/{tag}"] = timeit(
+        lambda: build_subspace_matrix_blocked(basis, N, diag_terms, bilinear_terms, block_size=1024, procs=0, **py), repeat)
+    if procs > 0:
+        results[f"build_blocked_procs{procs}/{tag}"] = timeit(
+            lambda: build_subspace_matrix_blocked(basis, N, diag_terms, bilinear_terms, block_size=1024, procs=procs, **py), repeat)
+    H = build_subspace_matrix(basis, N, diag_terms, bilinear_terms)
+    results[f"csr_matvec/{tag}"] = timeit(lambda: H @ vec, max(repeat, 5))
+    if NUMBA_OK:
+        packed = pack_terms_arrays(diag_terms, bilinear_terms)
+        basis_arr = np.array(basis, dtype=np.int64)
+        order = np.argsort(basis_arr)
+        sorted_bits = basis_arr[order]
+        xr = vec.real.copy(); xi = vec.imag.copy()
+        mv = lambda: _h_matvec_nb(xr, xi, basis_arr, sorted_bits, order, *packed)
+        t0 = time.perf_counter(); mv()
+        results.setdefault("_h_matvec_nb/first_call", {"min": time.perf_counter() - t0, "median": None, "repeat": 1})
+        results[f"_h_matvec_nb/{tag}"] = timeit(mv, max(repeat, 5))
+    results[f"expect_greentwo/{tag}"] = timeit(lambda: expect_greentwo(basis, vec, N, ops2), repeat)
+
+    engines = {"python": {}, "blocked": dict(build_blocked=True, build_procs=procs)}
+    if NUMBA_OK:
+        engines["numba"] = dict(accel_matvec=True)
+    for name, eng in engines.items():
+        def one_cycle():
+            with redirect_stdout(open(os.devnull, "w")):
+                run_cipsi_once(N, diag_terms, bilinear_terms,
+                               grand_canonical=False, seeds=len(basis), cycles=1, add_per_cycle=max(1, len(basis) // 4),
+                               prune=1 << N, eps=1e-8, hb_gamma=None, hb_sorted=False,
+                               max_abs_coeff=max((abs(t[8]) for t in bilinear_terms), default=0.0),
+                               threads=None, accel_matvec=eng.get("accel_matvec", False), nb_parallel=False,
+                               build_blocked=eng.get("build_blocked", False), block_size=1024,
+                               build_procs=eng.get("build_procs", 0),
+                               seed_mode="random", seed_pool=0, sector_Sz=None, rng=random.Random(7))
+        results[f"cipsi_cycle_{name}/{tag}"] = timeit(one_cycle, 1)
+
+def compare(results, baseline, tolerance):
+    worse = []
+    print(f"{'case':64s} {'base[s]':>10s} {'now[s]':>10s} {'ratio':>7s}")
+    for key in sorted(results):
+        if key not in baseline or not baseline[key].get("min"):
+            continue
+        b = baseline[key]["min"]; n = results[key]["min"]
+        r = n / b if b > 0 else float("inf")
+        flag = "  <-- slower" if r > tolerance else ""
+        print(f"{key:64s} {b:10.4f} {n:10.4f} {r:7.2f}{flag}")
+        if r > tolerance:
+            worse.append(key)
+    return worse
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="edcipsi hot-path benchmarks")
+    ap.add_argument("--quick", action="store_true", help="small sizes only")
+    ap.add_argument("--models", nargs="+", default=["heisenberg", "xxz"], choices=["heisenberg", "xxz"])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--procs", type=int, default=2, help="process count for the blocked builder (0=skip)")
+    ap.add_argument("--out", type=str, default="bench_output.json")
+    ap.add_argument("--baseline", type=str, default=None, help="compare against this JSON")
+    ap.add_argument("--save-baseline", type=str, default=None, help="also write results here")
+    ap.add_argument("--tolerance", type=float, default=1.25, help="max allowed now/baseline ratio")
+    args = ap.parse_args(argv)
+
+    sizes = SIZES_QUICK if args.quick else SIZES_FULL
+    bases = BASIS_QUICK if args.quick else BASIS_FULL
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        for model in args.models:
+            for (Lx, Ly) in sizes:
+                for B in bases:
+                    print(f"[bench] {model} {Lx}x{Ly} B={B}", file=sys.stderr)
+                    bench_case(Lx, Ly, model, B, args.repeat, work, results, args.procs)
+
+    doc = {"meta": {"host": platform.node(), "python": platform.python_version(),
+                    "numpy": np.__version__, "numba": NUMBA_OK, "cpus": os.cpu_count(),
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+           "results": results}
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=1, sort_keys=True)
+        print(f"[bench] wrote {path}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)["results"]
+        worse = compare(results, base, args.tolerance)
+        if worse:
+            print(f"[bench] {len(worse)} case(s) slower than {args.tolerance}x baseline", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,16 @@ def build_parser() -> ArgumentParser:
     ap.add_argument("--greentwo", type=str, default="greentwo.def", help="write TwoBodyG definition (greentwo.def) for SzSz/Nq (+S+S-)")
     ap.add_argument("--no-spinflip", dest="no_spinflip", action="store_true", help="omit spin-flip terms (only SzSz & N)")
 
+    # --- grid mode ---
+    ap.add_argument("--grid", action="append", default=None, metavar="NAME=RANGE",
+                    help="Repeatable. Named J entries in --pair/spec (e.g. 'J1', '-0.5*Jz') take the values "
+                         "lo:hi:n, v1,v2,... or v; one run directory per combination")
+    ap.add_argument("--grid-out", type=str, default="grid", help="grid mode: output directory (pNNNN/ per point)")
+    ap.add_argument("--grid-jobs", type=int, default=None, help="grid mode: writer processes (default: all cores)")
+    ap.add_argument("--grid-symlink", action="store_true",
+                    help="grid mode: symlink the shared ModPara/Green files into each point instead of referencing them")
+    ap.add_argument("--grid-plot", action="store_true", help="grid mode: also write GRID_OUT/lattice.png (off by default)")
+
     # --- CIPSI-friendly outputs ---
     ap.add_argument("--for-cipsi", action="store_true", help="emit CIPSI-friendly namelist.def / modpara.def / calcmod.def")
     ap.add_argument("--namelist", type=str, default="namelist.def")
@@ -42,4 +52,6 @@ def build_parser() -> ArgumentParser:
                     help="Write CIPSISeedMode to modpara.def (random|diag)")
     ap.add_argument("--cipsi-seed-pool", type=int, default=None,
                     help="Write CIPSISeedPool to modpara.def (candidate pool size)")
+    ap.add_argument("--cipsi-growth", choices=["fixed","weight","geometric"], default=None,
+                    help="Write CIPSIGrowth to modpara.def (adaptive modes use CIPSIAddPerCycle as a cap)")
     return ap
@@ -18,9 +18,10 @@ def main():
 
     parser = build_parser()
     args = parser.parse_args()
+    symbolic = bool(args.grid)
 
     if args.spec:
-        Lx, Ly, a1, a2, items, outfile, plotfile = parse_spec(args.spec)
+        Lx, Ly, a1, a2, items, outfile, plotfile = parse_spec(args.spec, symbolic=symbolic)
         if args.out != "interall.def":
             outfile = args.out
         if args.plot is not None:
@@ -32,26 +33,20 @@ def main():
         Lx, Ly = args.Lx, args.Ly
         a1 = tuple(args.a1) if args.a1 is not None else (1.0, 0.0)
         a2 = tuple(args.a2) if args.a2 is not None else (0.5, math.sqrt(3)/2.0)
-        items = parse_cli_pairs(args.pair)     # ← ["0 1 0 : 9 numbers"] → [(Rx,Ry,Rz,J(3x3))]
+        items = parse_cli_pairs(args.pair, symbolic=symbolic)     # ← ["0 1 0 : 9 numbers"] → [(Rx,Ry,Rz,J(3x3))]
         outfile = args.out
         plotfile = args.plot if args.plot else f"lattice_{os.path.basename(outfile)}.png"
 
     N = Lx * Ly
 
+    if args.grid:
+        return _main_grid(args, Lx, Ly, a1, a2, items, outfile)
+
     # InterAll
     build_interall(Lx, Ly, items, outfile, a1=a1, a2=a2)
     log.info(f"[OK] wrote InterAll to {outfile}")
 
-    # GreenOne
-    if getattr(args, "greenone", None):
-        write_greenone(Lx, Ly, args.greenone)
-        log.info(f"[OK] wrote OneBodyG to {args.greenone}")
-
-    # GreenTwo
-    if getattr(args, "greentwo", None):
-        include_spin = not getattr(args, "no_spinflip", False)
-        write_greentwo(Lx, Ly, args.greentwo, include_spinflip=include_spin)
-        log.info(f"[OK] wrote TwoBodyG to {args.greentwo} (spinflip={include_spin})")
+    _write_green(args, Lx, Ly, args.greenone, args.greentwo)
 
     # NameList
     nl_loc = args.locspin if args.locspin is not None else None
@@ -60,6 +55,27 @@ def main():
     write_namelist(args.namelist,modpara=args.modpara,interall=outfile,locspin=nl_loc,greenone=nl_g1,greentwo=nl_g2)
     log.info(f"[OK] wrote Namelist to {args.namelist}")
 
+    _write_modpara(args, Lx, Ly, args.modpara)
+
+    # Lattice Plot
+    plot_lattice_and_vectors(Lx, Ly, items, plotfile, a1=a1, a2=a2)
+    log.info(f"[OK] wrote plot to {plotfile}")
+
+    log.info("[run] cli.main() end")
+
+def _write_green(args, Lx, Ly, greenone, greentwo):
+    # GreenOne
+    if greenone:
+        write_greenone(Lx, Ly, greenone)
+        log.info(f"[OK] wrote OneBodyG to {greenone}")
+
+    # GreenTwo
+    if greentwo:
+        include_spin = not getattr(args, "no_spinflip", False)
+        write_greentwo(Lx, Ly, greentwo, include_spinflip=include_spin)
+        log.info(f"[OK] wrote TwoBodyG to {greentwo} (spinflip={include_spin})")
+
+def _write_modpara(args, Lx, Ly, path):
     # ModPara
     # Grand canonical default = True. CLI can flip either way.
     gc = True
@@ -67,20 +83,39 @@ def main():
         gc = False
     if args.cipsi_grand:
         gc = True
-    knobs = cipsi_big_defaults(N, grand=gc)
+    knobs = cipsi_big_defaults(Lx * Ly, grand=gc)
     write_modpara_cipsi(
-        Lx, Ly, path=args.modpara, grand=gc,
+        Lx, Ly, path=path, grand=gc,
         seeds=knobs["seeds"],
         cycles=knobs["cycles"],
         add_per=knobs["add_per_cycle"],
         seed_pool=knobs["seed_pool"],
+        growth=args.cipsi_growth,
     )
-    log.info(f"[OK] wrote ModPara to {args.modpara}")
-
-    # Lattice Plot
-    plot_lattice_and_vectors(Lx, Ly, items, plotfile, a1=a1, a2=a2)
-    log.info(f"[OK] wrote plot to {plotfile}")
+    log.info(f"[OK] wrote ModPara to {path}")
 
+def _main_grid(args, Lx, Ly, a1, a2, items, outfile):
+    """--grid: shared ModPara/Green files in --grid-out, one pNNNN/ per coupling point."""
+    from .grid import parse_grid, check_names, run_grid
+    try:
+        axes = parse_grid(args.grid)
+        check_names(items, axes)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(2)
+    root = os.path.abspath(args.grid_out)
+    os.makedirs(root, exist_ok=True)
+    shared = lambda p: os.path.join(root, os.path.basename(p)) if p else None
+    files = dict(modpara=shared(args.modpara), greenone=shared(args.greenone), greentwo=shared(args.greentwo),
+                 locspin=os.path.abspath(args.locspin) if args.locspin else None)
+    _write_green(args, Lx, Ly, files["greenone"], files["greentwo"])
+    _write_modpara(args, Lx, Ly, files["modpara"])
+    run_grid(root, Lx, Ly, items, axes, files, interall_name=os.path.basename(outfile),
+             symlink=args.grid_symlink, jobs=args.grid_jobs, log=log)
+    if args.grid_plot:
+        plotfile = os.path.join(root, "lattice.png")
+        plot_lattice_and_vectors(Lx, Ly, items, plotfile, a1=a1, a2=a2)
+        log.info(f"[OK] wrote plot to {plotfile}")
     log.info("[run] cli.main() end")
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+# edcipsi_gen/grid.py
+"""Grid mode: one run directory per point of a coupling grid, in one process.
+
+--pair / spec J entries may be names ("J1", "-Jz", "0.5*K") whose values come
+from --grid NAME=RANGE (lo:hi:n inclusive, v1,v2,..., or one value); every
+combination is a point. The bonds of each pair vector are built once; a point
+only evaluates its J matrices (16 coefficients per pair) and formats InterAll.
+ModPara and the Green-function files do not depend on J: they are written once
+into the grid directory and referenced from each pNNNN/namelist.def (or
+symlinked with --grid-symlink). manifest.txt is an edcipsi-batch manifest,
+grid.tsv lists the parameters of every directory.
+"""
+from __future__ import annotations
+import itertools, os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+import numpy as np
+from .lattice import pair_bonds, coeff_table, interall_header
+from .writers import write_namelist
+
+def parse_range(spec: str) -> np.ndarray:
+    """'0:1:11' → linspace(0, 1, 11); '0.5,1,2' → those; '0.3' → [0.3]."""
+    s = spec.strip()
+    if ":" in s:
+        lo, hi, n = s.split(":")
+        return np.linspace(float(lo), float(hi), int(n))
+    return np.array([float(t) for t in s.replace(" ", "").split(",") if t], dtype=float)
+
+def parse_grid(specs: List[str]) -> Dict[str, np.ndarray]:
+    axes: Dict[str, np.ndarray] = {}
+    for g in specs:
+        name, sep, rng = g.partition("=")
+        name = name.strip()
+        if not sep or not name:
+            raise ValueError(f"--grid expects NAME=RANGE, got {g!r}")
+        axes[name] = parse_range(rng)
+        if axes[name].size == 0:
+            raise ValueError(f"--grid {name}: empty range {rng!r}")
+    return axes
+
+def item_names(items) -> List[str]:
+    names = []
+    for (_, _, _, J) in items:
+        if isinstance(J, tuple):
+            names += [v[1] for v in J if isinstance(v, tuple) and v[1] not in names]
+    return names
+
+def check_names(items, axes: Dict[str, np.ndarray]) -> None:
+    used = item_names(items)
+    missing = [n for n in used if n not in axes]
+    unused = [n for n in axes if n not in used]
+    if missing or unused:
+        raise ValueError(f"--grid: J names without a range: {missing}; ranges not used by any J: {unused}")
+
+def eval_items(items, values: Dict[str, float]):
+    """Items with named J entries → numeric items for one grid point."""
+    out = []
+    for (Rx, Ry, Rz, J) in items:
+        if isinstance(J, tuple):
+            vals = [v[0] * values[v[1]] if isinstance(v, tuple) else v for v in J]
+            J = np.array(vals, dtype=complex).reshape(3, 3)
+        out.append((Rx, Ry, Rz, J))
+    return out
+
+class InterAllFormatter:
+    """InterAll text of one topology for many J values (same bytes as lattice.write_interall).
+
+    The site/spin columns of a line only depend on the bond and the (a, b, g, d)
+    slot, so they are formatted once per slot; a point formats 2 numbers per slot."""
+    def __init__(self, bonds):
+        self.bonds = bonds
+        self._pre: Dict[tuple, List[Tuple[str, str]]] = {}
+
+    def _prefixes(self, k: int, a: int, b: int, g: int, d: int):
+        key = (k, a, b, g, d)
+        if key not in self._pre:
+            self._pre[key] = [(f"{i} {a} {i} {b} {j} {g} {j} {d} ", f"{j} {d} {j} {g} {i} {b} {i} {a} ")
+                              for (i, j) in self.bonds[k]]
+        return self._pre[key]
+
+    def text(self, items) -> Tuple[str, int]:
+        out: List[str] = []
+        for k, (Rx, Ry, Rz, J) in enumerate(items):
+            slots = [(self._prefixes(k, a, b, g, d),
+                      "{: .15g} {: .15g}\n".format(float(c.real), float(c.imag)),
+                      "{: .15g} {: .15g}\n".format(float(c.real), float(-c.imag)))
+                     for (a, b, g, d, c) in coeff_table(J)]
+            for n in range(len(self.bonds[k])):
+                for (pre, cs, ccs) in slots:
+                    fwd, conj = pre[n]
+                    out.append(fwd + cs); out.append(conj + ccs)
+        return interall_header(len(out)) + "".join(out), len(out)
+
+# ---- worker state: set once per process ----------------------------------------
+_W: dict = {}
+
+def _init(state: dict):
+    _W.clear(); _W.update(state)
+    _W["fmt"] = InterAllFormatter(state["bonds"])
+
+def _write_point(task: Tuple[str, Dict[str, float]]) -> int:
+    pdir, values = task
+    os.makedirs(pdir, exist_ok=True)
+    interall = os.path.join(pdir, _W["interall"])
+    text, nterms = _W["fmt"].text(eval_items(_W["items"], values))
+    with open(interall, "w", encoding="utf-8") as f:
+        f.write(text)
+    shared = dict(_W["shared"])
+    if _W["symlink"]:
+        for key, src in shared.items():
+            if src is None:
+                continue
+            dst = os.path.join(pdir, os.path.basename(src))
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            os.symlink(os.path.relpath(src, pdir), dst)
+            shared[key] = dst
+    write_namelist(os.path.join(pdir, "namelist.def"), modpara=shared["modpara"], interall=interall,
+                   locspin=shared["locspin"], greenone=shared["greenone"], greentwo=shared["greentwo"])
+    return nterms
+
+def run_grid(root: str, Lx: int, Ly: int, items, axes: Dict[str, np.ndarray], shared: dict,
+             interall_name: str = "interall.def", symlink: bool = False, jobs: int | None = None, log=None):
+    """Write root/pNNNN/{interall.def,namelist.def} for every point → list of (dir, values)."""
+    check_names(items, axes)
+    names = list(axes)
+    points = [dict(zip(names, map(float, vals))) for vals in itertools.product(*(axes[n] for n in names))]
+    width = max(4, len(str(len(points) - 1)))
+    tasks = [(os.path.join(root, f"p{k:0{width}d}"), v) for k, v in enumerate(points)]
+    state = dict(bonds=[pair_bonds(Lx, Ly, Rx, Ry) for (Rx, Ry, Rz, J) in items], items=items,
+                 interall=interall_name, shared=shared, symlink=symlink)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(tasks)))
+    if jobs == 1:
+        _init(state)
+        nterms = list(map(_write_point, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init, initargs=(state,)) as ex:
+            nterms = list(ex.map(_write_point, tasks, chunksize=max(1, len(tasks) // (8 * jobs))))
+
+    with open(os.path.join(root, "grid.tsv"), "w", encoding="utf-8") as f:
+        f.write("\t".join(["dir"] + names + ["NInterAll"]) + "\n")
+        for (pdir, v), n in zip(tasks, nterms):
+            f.write("\t".join([os.path.basename(pdir)] + [f"{v[k]:.12g}" for k in names] + [str(n)]) + "\n")
+    with open(os.path.join(root, "manifest.txt"), "w", encoding="utf-8") as f:
+        f.write(f"# edcipsi-batch manifest: {len(tasks)} grid point(s), parameters in grid.tsv\n")
+        for pdir, _ in tasks:
+            f.write(f"{os.path.basename(pdir)}/namelist.def\n")
+    if log is not None:
+        log.info(f"[OK] grid: {len(tasks)} point(s) over {', '.join(f'{n}[{axes[n].size}]' for n in names)} "
+                 f"-> {root} ({jobs} process(es))")
+    return tasks
@@ -3,7 +3,6 @@ import math
 from dataclasses import dataclass
 from typing import Iterable, Tuple, List
 import numpy as np
-import matplotlib.pyplot as plt
 
 # Pauli
 sigma_x = np.array([[0+0j, 1+0j],[1+0j, 0+0j]], dtype=complex)
@@ -35,34 +34,49 @@ def coeff_from_J(alpha:int, beta:int, gamma:int, delta:int, J: np.ndarray) -> co
             val += 0.25 * J[a,b] * PAULI[a][alpha,beta] * PAULI[b][gamma,delta]
     return val
 
-def build_interall(Lx:int, Ly:int, items, outfile:str, a1:tuple, a2:tuple):
-    tri = TriRhombus(Lx, Ly, a1=a1, a2=a2)
+def pair_bonds(Lx:int, Ly:int, Rx:int, Ry:int) -> List[Tuple[int,int]]:
+    """Oriented bonds (i, i+R) of one pair vector; a self-inverse R (R ≡ -R) only once per bond."""
+    tri = TriRhombus(Lx, Ly)
+    selfinv = is_self_inverse(Rx, Ry, Lx, Ly)
+    bonds = []
+    for (_, x, y) in tri.all_sites():
+        i = tri.idx(x, y)
+        j = tri.idx(x + Rx, y + Ry)  # 2DなのでRzは無視
+        if not selfinv or i < j:
+            bonds.append((i, j))
+    return bonds
+
+def interall_entries(bonds, items):
+    """bonds[k] = pair_bonds of items[k] → InterAll entries (pair, site, coefficient order)."""
     all_entries = []
-    for (Rx, Ry, Rz, J) in items:
-        selfinv = is_self_inverse(Rx, Ry, Lx, Ly)
-        for (_, x, y) in tri.all_sites():
-            i = tri.idx(x, y)
-            j = tri.idx(x + Rx, y + Ry)  # 2DなのでRzは無視
-            if selfinv:
-                if i < j:
-                    all_entries.extend(entries_for_oriented_bond(i, j, J, add_conj=True))
-            else:
-                all_entries.extend(entries_for_oriented_bond(i, j, J, add_conj=True))
+    for bl, (Rx, Ry, Rz, J) in zip(bonds, items):
+        table = coeff_table(J)
+        for (i, j) in bl:
+            all_entries.extend(entries_for_oriented_bond(i, j, J, add_conj=True, table=table))
+    return all_entries
+
+def interall_header(n:int) -> str:
+    return ("======================\n"
+            f"NInterAll {n}\n"
+            "======================\n"
+            "========zInterAll=====\n"
+            "======================\n")
 
+def write_interall(outfile:str, all_entries) -> None:
     with open(outfile, "w", encoding="utf-8") as f:
-        f.write("======================\n")
-        f.write(f"NInterAll {len(all_entries)}\n")
-        f.write("======================\n")
-        f.write("========zInterAll=====\n")
-        f.write("======================\n")
-        for e in all_entries:
-            f.write("{:d} {:d} {:d} {:d} {:d} {:d} {:d} {:d} {: .15g} {: .15g}\n".format(*e))
+        f.write(interall_header(len(all_entries)))
+        f.write("".join("{:d} {:d} {:d} {:d} {:d} {:d} {:d} {:d} {: .15g} {: .15g}\n".format(*e) for e in all_entries))
+
+def build_interall(Lx:int, Ly:int, items, outfile:str, a1:tuple, a2:tuple):
+    bonds = [pair_bonds(Lx, Ly, Rx, Ry) for (Rx, Ry, Rz, J) in items]
+    write_interall(outfile, interall_entries(bonds, items))
 
 def is_self_inverse(Rx: int, Ry: int, Lx: int, Ly: int) -> bool:
     return ((2*Rx) % Lx == 0) and ((2*Ry) % Ly == 0)
 
-def entries_for_oriented_bond(i:int, j:int, J: np.ndarray, add_conj: bool):
-    entries = []
+def coeff_table(J: np.ndarray):
+    """Nonzero (a, b, g, d, c) of one bond for coupling matrix J (same for every bond of a pair)."""
+    table = []
     for a in (0,1):
         for b in (0,1):
             for g in (0,1):
@@ -70,13 +84,20 @@ def entries_for_oriented_bond(i:int, j:int, J: np.ndarray, add_conj: bool):
                     c = coeff_from_J(a,b,g,d,J)
                     if abs(c) < EPS:
                         continue
-                    entries.append((i,a, i,b, j,g, j,d, float(c.real), float(c.imag)))
-                    if add_conj:
-                        cc = complex(c.real, -c.imag)
-                        entries.append((j,d, j,g, i,b, i,a, float(cc.real), float(cc.imag)))
+                    table.append((a, b, g, d, c))
+    return table
+
+def entries_for_oriented_bond(i:int, j:int, J: np.ndarray, add_conj: bool, table=None):
+    entries = []
+    for (a, b, g, d, c) in (coeff_table(J) if table is None else table):
+        entries.append((i,a, i,b, j,g, j,d, float(c.real), float(c.imag)))
+        if add_conj:
+            cc = complex(c.real, -c.imag)
+            entries.append((j,d, j,g, i,b, i,a, float(cc.real), float(cc.imag)))
     return entries
 
 def plot_lattice_and_vectors(Lx:int, Ly:int, items, png_path:str, a1:Tuple[float,float], a2:Tuple[float,float], annotate_sites=True):
+    import matplotlib.pyplot as plt  # プロット時のみ読み込む
     tri = TriRhombus(Lx, Ly, a1=a1, a2=a2)
     xs, ys, labels = [], [], []
     for (i,x,y) in tri.all_sites():
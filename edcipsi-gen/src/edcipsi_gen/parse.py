@@ -1,8 +1,32 @@
 # edcipsi_gen/parse.py
 from __future__ import annotations
-import os, math
+import os, math, re
 import numpy as np
 
+# grid mode: a J entry may be a name, optionally signed/scaled ("J1", "-Jz", "0.5*K")
+_SYM = re.compile(r"^([+-]?)(?:(\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)\*)?([A-Za-z_]\w*)$")
+
+def parse_J_entry(t: str, symbolic: bool = False):
+    """'1.0', '0.5i' → complex; with symbolic=True also 'J1', '-0.5*Jz' → (factor, name).
+    With symbolic=True a bare 'i'/'j'/'J' is a name (write '1i' for the imaginary unit)."""
+    m = _SYM.match(t) if symbolic else None
+    if m is not None:
+        sign, num, name = m.groups()
+        return ((-1.0 if sign == "-" else 1.0) * float(num or 1.0), name)
+    try:
+        return complex(t.replace('i','j'))
+    except ValueError:
+        raise ValueError(f"bad J entry {t!r}" + ("" if symbolic else " (named couplings need --grid)")) from None
+
+def _J_matrix(toks, symbolic: bool = False):
+    """9 entries → 3x3 complex array; a tuple of the 9 entries if any of them is named."""
+    vals = [parse_J_entry(t, symbolic) for t in toks]
+    if any(isinstance(v, tuple) for v in vals):
+        return tuple(vals)
+    return np.array([[vals[0], vals[1], vals[2]],
+                     [vals[3], vals[4], vals[5]],
+                     [vals[6], vals[7], vals[8]]], dtype=complex)
+
 def _strip(line: str) -> str: return line.split("#", 1)[0].strip()
 
 def _try_parse_two_floats(s: str):
@@ -27,7 +51,7 @@ def _try_parse_tagged_vec(s: str, tag: str):
         return float(toks[1]), float(toks[2])
     return None
 
-def parse_spec(path: str):
+def parse_spec(path: str, symbolic: bool = False):
     with open(path, "r", encoding="utf-8") as f:
         raw = f.read().splitlines()
     lines = [s for s in (_strip(x) for x in raw) if s]
@@ -68,11 +92,7 @@ def parse_spec(path: str):
         if len(toks) != 12:
             raise ValueError("Each R/J line must have 12 numbers.")
         Rx,Ry,Rz = (int(toks[0]), int(toks[1]), int(toks[2]))
-        vals = [complex(t.replace('i','j')) for t in toks[3:]]
-        J = np.array([[vals[0], vals[1], vals[2]],
-                      [vals[3], vals[4], vals[5]],
-                      [vals[6], vals[7], vals[8]]], dtype=complex)
-        items.append((Rx,Ry,Rz,J))
+        items.append((Rx,Ry,Rz,_J_matrix(toks[3:], symbolic)))
 
     outfile = next(it)
     try:
@@ -82,18 +102,15 @@ def parse_spec(path: str):
 
     return Lx, Ly, a1, a2, items, outfile, plotfile
 
-def parse_cli_pairs(pairs: list):
+def parse_cli_pairs(pairs: list, symbolic: bool = False):
     items = []
     for s in pairs:
         if ":" not in s:
             raise ValueError("Each --pair must be 'Rx Ry Rz : 9 J entries'")
         left, right = s.split(":", 1)
         Rx,Ry,Rz = (int(t) for t in left.strip().split())
-        nums = [complex(t.replace('i','j')) for t in right.strip().split()]
+        nums = right.strip().split()
         if len(nums) != 9: raise ValueError("J must have 9 numbers.")
-        J = np.array([[nums[0], nums[1], nums[2]],
-                      [nums[3], nums[4], nums[5]],
-                      [nums[6], nums[7], nums[8]]], dtype=complex)
-        items.append((Rx,Ry,Rz,J))
+        items.append((Rx,Ry,Rz,_J_matrix(nums, symbolic)))
     return items
 
@@ -74,7 +74,8 @@ def write_modpara_cipsi(Lx:int, Ly:int, path:str,
                         grand:bool=True, seeds:int=32, cycles:int=20,
                         add_per:int=100, prune:int|None=None, eps:float=1e-6,
                         sector_sz:float|None=None, rng:int|None=1337,
-                        seed_mode:str|None=None, seed_pool:int|None=None) -> None:
+                        seed_mode:str|None=None, seed_pool:int|None=None,
+                        growth:str|None=None) -> None:
     """modpara.def（整形出力）。
     - CIPSISeedMode は未指定なら 'diag'
     - CIPSISeedPool は未指定なら default_seed_pool() で決定
@@ -105,6 +106,8 @@ def write_modpara_cipsi(Lx:int, Ly:int, path:str,
         # 常に出力
         f.write(_line("CIPSISeedMode",       seed_mode))
         f.write(_line("CIPSISeedPool",       int(seed_pool)))
+        if growth is not None:
+            f.write(_line("CIPSIGrowth",     growth))
         # if rng is not None:
         #     f.write(_line("CIPSIRandomSeed", int(rng)))
 
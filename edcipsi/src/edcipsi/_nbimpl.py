@@ -0,0 +1,583 @@
+"""Numba kernels behind nbkernels (imported on first use; see nbkernels.__getattr__)."""
+from __future__ import annotations
+import numpy as np
+import numba as nb
+
+@nb.njit(cache=True)
+def _diag_energy_bit_nb(bit, di, dsi, dk, dsk, dcr, dci):
+    e_real = 0.0
+    e_imag = 0.0
+    L = di.shape[0]
+    for t in range(L):
+        ui = (bit >> di[t]) & 1
+        uk = (bit >> dk[t]) & 1
+        n_i = ui if dsi[t] == 0 else (1 - ui)
+        n_k = uk if dsk[t] == 0 else (1 - uk)
+        prod = n_i * n_k
+        e_real += dcr[t] * prod
+        e_imag += dci[t] * prod
+    return e_real, e_imag
+
+@nb.njit(cache=True)
+def _apply_local_nb(bit, site, s_from, s_to):
+    up = (bit >> site) & 1
+    if s_to == s_from:
+        n = up if s_to == 0 else (1 - up)
+        return (1 if n != 0 else 0), bit
+    need_up = 1 if s_from == 0 else 0
+    if up != need_up:
+        return 0, bit
+    set_up = 1 if s_to == 0 else 0
+    newbit = (bit | (1 << site)) if set_up == 1 else (bit & ~(1 << site))
+    return 1, newbit
+
+@nb.njit(cache=True)
+def _binsearch(sorted_bits, target):
+    lo = 0
+    hi = sorted_bits.shape[0]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = sorted_bits[mid]
+        if v < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < sorted_bits.shape[0] and sorted_bits[lo] == target:
+        return lo
+    return -1
+
+@nb.njit(cache=True)
+def _h_matvec_nb(xr, xi, basis_bits, sorted_bits, order,
+                 di, dsi, dk, dsk, dcr, dci,
+                 bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh):
+    B = basis_bits.shape[0]
+    yr = np.zeros(B, dtype=np.float64)
+    yi = np.zeros(B, dtype=np.float64)
+
+    # diagonal part
+    for i in range(B):
+        b = basis_bits[i]
+        de_r, de_i = _diag_energy_bit_nb(b, di, dsi, dk, dsk, dcr, dci)
+        xr_i = xr[i]; xi_i = xi[i]
+        yr[i] += de_r * xr_i - de_i * xi_i
+        yi[i] += de_r * xi_i + de_i * xr_i
+
+    # off-diagonal part
+    T = bi.shape[0]
+    for i in range(B):
+        b = basis_bits[i]
+        xr_i = xr[i]; xi_i = xi[i]
+        for t in range(T):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    pos = _binsearch(sorted_bits, s2)
+                    if pos >= 0:
+                        j = order[pos]  # sorted position -> basis index
+                        cr = bcr[t]; ci = bci[t]
+                        yr[j] += cr * xr_i - ci * xi_i
+                        yi[j] += cr * xi_i + ci * xr_i
+            if bh[t] == 0:
+                continue
+            # Hermitian partner: (i: si->sj) then (k: sk->sl), coefficient conj(c)
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 == 0:
+                continue
+            pos = _binsearch(sorted_bits, s2)
+            if pos < 0:
+                continue
+            j = order[pos]
+            cr = bcr[t]; ci = -bci[t]
+            yr[j] += cr * xr_i - ci * xi_i
+            yi[j] += cr * xi_i + ci * xr_i
+
+    return yr, yi
+
+# ---- real (float64) variants: 実ハミルトニアン用、虚部の演算を省く ----
+@nb.njit(cache=True)
+def _diag_energy_bit_nb_real(bit, di, dsi, dk, dsk, dcr):
+    e = 0.0
+    for t in range(di.shape[0]):
+        ui = (bit >> di[t]) & 1
+        uk = (bit >> dk[t]) & 1
+        n_i = ui if dsi[t] == 0 else (1 - ui)
+        n_k = uk if dsk[t] == 0 else (1 - uk)
+        e += dcr[t] * (n_i * n_k)
+    return e
+
+@nb.njit(cache=True)
+def _h_matvec_nb_real(x, basis_bits, sorted_bits, order,
+                      di, dsi, dk, dsk, dcr,
+                      bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bh):
+    B = basis_bits.shape[0]
+    y = np.zeros(B, dtype=np.float64)
+    for i in range(B):
+        y[i] += _diag_energy_bit_nb_real(basis_bits[i], di, dsi, dk, dsk, dcr) * x[i]
+    T = bi.shape[0]
+    for i in range(B):
+        b = basis_bits[i]
+        x_i = x[i]
+        for t in range(T):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    pos = _binsearch(sorted_bits, s2)
+                    if pos >= 0:
+                        y[order[pos]] += bcr[t] * x_i
+            if bh[t] == 0:
+                continue
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 == 0:
+                continue
+            pos = _binsearch(sorted_bits, s2)
+            if pos >= 0:
+                y[order[pos]] += bcr[t] * x_i
+    return y
+
+# ---- --nb-parallel: row-wise pull over prange (row r of H = conj of column r), no atomics ----
+# The serial kernels above scatter y[j] += H[j,i]·x[i]; here every thread owns its
+# rows and gathers y[r] = Σ_j H[r,j]·x[j] = Σ conj(H[j,r])·x[j], which needs H
+# Hermitian as a whole (canonical terms, or a Hermitian --raw-terms list).
+@nb.njit(parallel=True, cache=True)
+def _h_matvec_nb_par(xr, xi, basis_bits, sorted_bits, order,
+                     di, dsi, dk, dsk, dcr, dci,
+                     bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh):
+    B = basis_bits.shape[0]
+    yr = np.empty(B, dtype=np.float64)
+    yi = np.empty(B, dtype=np.float64)
+    T = bi.shape[0]
+    for r in nb.prange(B):
+        b = basis_bits[r]
+        de_r, de_i = _diag_energy_bit_nb(b, di, dsi, dk, dsk, dcr, dci)
+        ar = de_r * xr[r] - de_i * xi[r]
+        ai = de_r * xi[r] + de_i * xr[r]
+        for t in range(T):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    pos = _binsearch(sorted_bits, s2)
+                    if pos >= 0:
+                        j = order[pos]
+                        cr = bcr[t]; ci = -bci[t]          # H[r,j] = conj(c)
+                        ar += cr * xr[j] - ci * xi[j]
+                        ai += cr * xi[j] + ci * xr[j]
+            if bh[t] == 0:
+                continue
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 == 0:
+                continue
+            pos = _binsearch(sorted_bits, s2)
+            if pos < 0:
+                continue
+            j = order[pos]
+            cr = bcr[t]; ci = bci[t]                       # partner: H[r,j] = c
+            ar += cr * xr[j] - ci * xi[j]
+            ai += cr * xi[j] + ci * xr[j]
+        yr[r] = ar
+        yi[r] = ai
+    return yr, yi
+
+@nb.njit(parallel=True, cache=True)
+def _h_matvec_nb_real_par(x, basis_bits, sorted_bits, order,
+                          di, dsi, dk, dsk, dcr,
+                          bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bh):
+    B = basis_bits.shape[0]
+    y = np.empty(B, dtype=np.float64)
+    T = bi.shape[0]
+    for r in nb.prange(B):
+        b = basis_bits[r]
+        acc = _diag_energy_bit_nb_real(b, di, dsi, dk, dsk, dcr) * x[r]
+        for t in range(T):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    pos = _binsearch(sorted_bits, s2)
+                    if pos >= 0:
+                        acc += bcr[t] * x[order[pos]]
+            if bh[t] == 0:
+                continue
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 == 0:
+                continue
+            pos = _binsearch(sorted_bits, s2)
+            if pos >= 0:
+                acc += bcr[t] * x[order[pos]]
+        y[r] = acc
+    return y
+
+# ---- open-addressing hash index (matfree lookup="hash"; see solver.matfree_operator) ----
+# Fibonacci hashing into a power-of-two table of >= 2B slots, linear probing;
+# empty slots hold -1 (basis bitstrings are >= 0).
+_HASH_MUL = np.uint64(0x9E3779B97F4A7C15)
+
+@nb.njit(cache=True)
+def _hash_slot(b, shift):
+    return np.int64((np.uint64(b) * _HASH_MUL) >> np.uint64(shift))
+
+@nb.njit(cache=True)
+def _hash_build_nb(basis_bits, log2size):
+    size = 1 << log2size
+    mask = size - 1
+    shift = 64 - log2size
+    keys = np.full(size, -1, dtype=np.int64)
+    vals = np.empty(size, dtype=np.int64)
+    for i in range(basis_bits.shape[0]):
+        h = _hash_slot(basis_bits[i], shift)
+        while keys[h] != -1:
+            h = (h + 1) & mask
+        keys[h] = basis_bits[i]
+        vals[h] = i
+    return keys, vals
+
+@nb.njit(cache=True)
+def _hash_find(keys, vals, shift, target):
+    mask = keys.shape[0] - 1
+    h = _hash_slot(target, shift)
+    while True:
+        k = keys[h]
+        if k == target:
+            return vals[h]
+        if k == -1:
+            return -1
+        h = (h + 1) & mask
+
+@nb.njit(cache=True)
+def _h_matvec_nb_hash(xr, xi, basis_bits, keys, vals, shift,
+                      di, dsi, dk, dsk, dcr, dci,
+                      bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh):
+    """_h_matvec_nb with the hash index instead of the binary search."""
+    B = basis_bits.shape[0]
+    yr = np.zeros(B, dtype=np.float64)
+    yi = np.zeros(B, dtype=np.float64)
+    for i in range(B):
+        de_r, de_i = _diag_energy_bit_nb(basis_bits[i], di, dsi, dk, dsk, dcr, dci)
+        xr_i = xr[i]; xi_i = xi[i]
+        yr[i] += de_r * xr_i - de_i * xi_i
+        yi[i] += de_r * xi_i + de_i * xr_i
+    T = bi.shape[0]
+    for i in range(B):
+        b = basis_bits[i]
+        xr_i = xr[i]; xi_i = xi[i]
+        for t in range(T):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    j = _hash_find(keys, vals, shift, s2)
+                    if j >= 0:
+                        cr = bcr[t]; ci = bci[t]
+                        yr[j] += cr * xr_i - ci * xi_i
+                        yi[j] += cr * xi_i + ci * xr_i
+            if bh[t] == 0:
+                continue
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 == 0:
+                continue
+            j = _hash_find(keys, vals, shift, s2)
+            if j < 0:
+                continue
+            cr = bcr[t]; ci = -bci[t]
+            yr[j] += cr * xr_i - ci * xi_i
+            yi[j] += cr * xi_i + ci * xr_i
+    return yr, yi
+
+@nb.njit(cache=True)
+def _h_matvec_nb_real_hash(x, basis_bits, keys, vals, shift,
+                           di, dsi, dk, dsk, dcr,
+                           bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bh):
+    B = basis_bits.shape[0]
+    y = np.zeros(B, dtype=np.float64)
+    for i in range(B):
+        y[i] += _diag_energy_bit_nb_real(basis_bits[i], di, dsi, dk, dsk, dcr) * x[i]
+    T = bi.shape[0]
+    for i in range(B):
+        b = basis_bits[i]
+        x_i = x[i]
+        for t in range(T):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    j = _hash_find(keys, vals, shift, s2)
+                    if j >= 0:
+                        y[j] += bcr[t] * x_i
+            if bh[t] == 0:
+                continue
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 == 0:
+                continue
+            j = _hash_find(keys, vals, shift, s2)
+            if j >= 0:
+                y[j] += bcr[t] * x_i
+    return y
+
+# ---- direct CSR assembly: count pass → prefix sum (caller) → fill pass ----
+# Terms must be Hermitian-closed (hbuilder.hermitian_terms), so row i = conj(column i)
+# and each row is generated from its own determinant. Rows are split into chunks
+# with one scratch buffer per chunk; entries of a row are sorted by column
+# (insertion sort, rows are short) and duplicates summed.
+_ROW_CHUNK = 256
+
+@nb.njit(cache=True)
+def _row_entries_nb(r, b, sorted_bits, order, di, dsi, dk, dsk, dcr, dci,
+                    bi, bsi, bsj, bk, bsk, bsl, bcr, bci, bh, half, cols, vr, vi):
+    """Entries (col, Re, Im) of row r of H into the buffers, sorted by col → count (unmerged)."""
+    er, ei = _diag_energy_bit_nb(b, di, dsi, dk, dsk, dcr, dci)
+    cols[0] = r; vr[0] = er; vi[0] = -ei
+    n = 1
+    for t in range(bi.shape[0]):
+        ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+        if ok1 != 0:
+            ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+            if ok2 != 0:
+                pos = _binsearch(sorted_bits, s2)
+                if pos >= 0:
+                    j = order[pos]
+                    if not (half and j < r):
+                        cols[n] = j; vr[n] = bcr[t]; vi[n] = -bci[t]   # row = conj(column)
+                        n += 1
+        if bh[t] == 0:
+            continue
+        ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+        if ok1 == 0:
+            continue
+        ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+        if ok2 == 0:
+            continue
+        pos = _binsearch(sorted_bits, s2)
+        if pos >= 0:
+            j = order[pos]
+            if not (half and j < r):
+                cols[n] = j; vr[n] = bcr[t]; vi[n] = bci[t]
+                n += 1
+    for p in range(1, n):
+        c = cols[p]; a = vr[p]; z = vi[p]
+        q = p - 1
+        while q >= 0 and cols[q] > c:
+            cols[q+1] = cols[q]; vr[q+1] = vr[q]; vi[q+1] = vi[q]
+            q -= 1
+        cols[q+1] = c; vr[q+1] = a; vi[q+1] = z
+    return n
+
+@nb.njit(parallel=True, cache=True)
+def _csr_count_nb(lo, hi, basis_bits, sorted_bits, order,
+                  di, dsi, dk, dsk, dcr, dci,
+                  bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh, half):
+    """Distinct columns of rows [lo,hi) → counts (hi-lo,) int64."""
+    counts = np.zeros(hi - lo, dtype=np.int64)
+    W = 1 + 2 * bi.shape[0]
+    nchunk = (hi - lo + _ROW_CHUNK - 1) // _ROW_CHUNK
+    for ch in nb.prange(nchunk):
+        cols = np.empty(W, dtype=np.int64); vr = np.empty(W); vi = np.empty(W)
+        for r in range(lo + ch * _ROW_CHUNK, min(hi, lo + (ch + 1) * _ROW_CHUNK)):
+            n = _row_entries_nb(r, basis_bits[r], sorted_bits, order, di, dsi, dk, dsk, dcr, dci,
+                                bi, bsi, bsj, bk, bsk, bsl, bcr, bci, bh, half, cols, vr, vi)
+            u = 1
+            for p in range(1, n):
+                if cols[p] != cols[p-1]:
+                    u += 1
+            counts[r - lo] = u
+    return counts
+
+@nb.njit(parallel=True, cache=True)
+def _csr_fill_nb(lo, hi, basis_bits, sorted_bits, order,
+                 di, dsi, dk, dsk, dcr, dci,
+                 bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh, half,
+                 indptr, indices, data):
+    """Rows [lo,hi) into indices/data at indptr[r-lo] (indptr from the counts of _csr_count_nb)."""
+    W = 1 + 2 * bi.shape[0]
+    nchunk = (hi - lo + _ROW_CHUNK - 1) // _ROW_CHUNK
+    for ch in nb.prange(nchunk):
+        cols = np.empty(W, dtype=np.int64); vr = np.empty(W); vi = np.empty(W)
+        for r in range(lo + ch * _ROW_CHUNK, min(hi, lo + (ch + 1) * _ROW_CHUNK)):
+            n = _row_entries_nb(r, basis_bits[r], sorted_bits, order, di, dsi, dk, dsk, dcr, dci,
+                                bi, bsi, bsj, bk, bsk, bsl, bcr, bci, bh, half, cols, vr, vi)
+            q = indptr[r - lo]
+            indices[q] = cols[0]; data[q] = complex(vr[0], vi[0])
+            for p in range(1, n):
+                if cols[p] != cols[p-1]:
+                    q += 1
+                    indices[q] = cols[p]; data[q] = complex(vr[p], vi[p])
+                else:
+                    data[q] += complex(vr[p], vi[p])
+
+@nb.njit(parallel=True, cache=True)
+def _csr_fill_nb_real(lo, hi, basis_bits, sorted_bits, order,
+                      di, dsi, dk, dsk, dcr, dci,
+                      bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh, half,
+                      indptr, indices, data):
+    W = 1 + 2 * bi.shape[0]
+    nchunk = (hi - lo + _ROW_CHUNK - 1) // _ROW_CHUNK
+    for ch in nb.prange(nchunk):
+        cols = np.empty(W, dtype=np.int64); vr = np.empty(W); vi = np.empty(W)
+        for r in range(lo + ch * _ROW_CHUNK, min(hi, lo + (ch + 1) * _ROW_CHUNK)):
+            n = _row_entries_nb(r, basis_bits[r], sorted_bits, order, di, dsi, dk, dsk, dcr, dci,
+                                bi, bsi, bsj, bk, bsk, bsl, bcr, bci, bh, half, cols, vr, vi)
+            q = indptr[r - lo]
+            indices[q] = cols[0]; data[q] = vr[0]
+            for p in range(1, n):
+                if cols[p] != cols[p-1]:
+                    q += 1
+                    indices[q] = cols[p]; data[q] = vr[p]
+                else:
+                    data[q] += vr[p]
+
+@nb.njit(parallel=True, cache=True)
+def _csr_matvec_nb(indptr, indices, data, x, y, bounds):
+    """y += A x for CSR A; one prange iteration per row partition in `bounds`."""
+    for p in nb.prange(bounds.shape[0] - 1):
+        for r in range(bounds[p], bounds[p+1]):
+            acc = y[r]
+            for q in range(indptr[r], indptr[r+1]):
+                acc += data[q] * x[indices[q]]
+            y[r] = acc
+    return y
+
+@nb.njit(cache=True)
+def _csr_herm_matvec_nb(indptr, indices, data, x, y):
+    """y += H x with H Hermitian, stored as upper-triangle CSR (one pass over U)."""
+    for r in range(indptr.shape[0] - 1):
+        acc = y[r]
+        xr = x[r]
+        for q in range(indptr[r], indptr[r+1]):
+            c = indices[q]
+            acc += data[q] * x[c]
+            if c != r:
+                y[c] += np.conj(data[q]) * xr
+        y[r] = acc
+    return y
+
+@nb.njit(parallel=True, cache=True)
+def _csr_herm_matvec_nb_par(indptr, indices, data, x, y, bounds):
+    """_csr_herm_matvec_nb over prange, one iteration per row partition in `bounds`.
+
+    The scattered U^H part of partition p only reaches rows >= bounds[p]; each
+    partition collects it in its own buffer, summed into y at the end.
+    """
+    P = bounds.shape[0] - 1
+    n = y.shape[0]
+    buf = np.zeros((P, n), dtype=y.dtype)
+    for p in nb.prange(P):
+        yp = buf[p]
+        for r in range(bounds[p], bounds[p+1]):
+            acc = yp[r]
+            xr = x[r]
+            for q in range(indptr[r], indptr[r+1]):
+                c = indices[q]
+                acc += data[q] * x[c]
+                if c != r:
+                    yp[c] += np.conj(data[q]) * xr
+            yp[r] = acc
+    for r in nb.prange(n):
+        acc = y[r]
+        for p in range(P):
+            if bounds[p] > r:
+                break
+            acc += buf[p, r]
+        y[r] = acc
+    return y
+
+# ---- full ED on a whole Sz sector (fulled.py): combinadic rank instead of index lookups ----
+@nb.njit(cache=True)
+def _rank_nb(b, C, full):
+    """Position of b among the sector states in increasing order: Σ_j C(p_j, j) over set bits p_1<p_2<...."""
+    if full:
+        return b
+    r = 0; k = 0; p = 0
+    while b:
+        if b & 1:
+            k += 1
+            r += C[p, k]
+        b >>= 1; p += 1
+    return r
+
+@nb.njit(cache=True)
+def _sector_states_nb(n_up, count):
+    """All states with n_up set bits in increasing order (Gosper's hack)."""
+    out = np.empty(count, dtype=np.int64)
+    v = (np.int64(1) << n_up) - 1
+    for i in range(count):
+        out[i] = v
+        if v == 0:
+            break
+        c = v & -v
+        r = v + c
+        v = (((r ^ v) >> 2) // c) | r
+    return out
+
+@nb.njit(parallel=True, cache=True)
+def _sector_matvec_nb(x, states, C, full, hd,
+                      bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh):
+    """y = H x on the complete sector; row-wise pull (row r = conj(column r)), no atomics.
+
+    hd: the (real) diagonal of H, computed once. Terms must be Hermitian-closed
+    and Sz-conserving within the sector (fulled.sector_terms).
+    """
+    B = states.shape[0]
+    y = np.empty(B, dtype=np.complex128)
+    for r in nb.prange(B):
+        b = states[r]
+        acc = hd[r] * x[r]
+        for t in range(bi.shape[0]):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    acc += complex(bcr[t], -bci[t]) * x[_rank_nb(s2, C, full)]
+            if bh[t] == 0:
+                continue
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 != 0:
+                acc += complex(bcr[t], bci[t]) * x[_rank_nb(s2, C, full)]
+        y[r] = acc
+    return y
+
+@nb.njit(parallel=True, cache=True)
+def _sector_matvec_nb_real(x, states, C, full, hd,
+                           bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bh):
+    B = states.shape[0]
+    y = np.empty(B, dtype=np.float64)
+    for r in nb.prange(B):
+        b = states[r]
+        acc = hd[r] * x[r]
+        for t in range(bi.shape[0]):
+            ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
+            if ok1 != 0:
+                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
+                if ok2 != 0:
+                    acc += bcr[t] * x[_rank_nb(s2, C, full)]
+            if bh[t] == 0:
+                continue
+            ok1, s1 = _apply_local_nb(b, bi[t], bsi[t], bsj[t])
+            if ok1 == 0:
+                continue
+            ok2, s2 = _apply_local_nb(s1, bk[t], bsk[t], bsl[t])
+            if ok2 != 0:
+                acc += bcr[t] * x[_rank_nb(s2, C, full)]
+        y[r] = acc
+    return y
@@ -0,0 +1,135 @@
+"""Persistent basis → external connectivity for the CIPSI amplitude pass.
+
+Which determinants a basis determinant b connects to, and through which term
+coefficients, depends only on b, and most of the basis survives a cycle.
+AmplitudeCache stores one entry (row of b, target column, coefficient) per term
+hit, unreduced so that Heat-Bath screening can still act per term. Entries of
+new determinants are generated once (vectorized over the new determinants from
+the occupation-indexed termtable.TermTable), those of pruned determinants are
+dropped as soon as they leave the basis (rows and columns renumbered), and the
+amplitudes of a cycle are M = C·c: one weighted bincount over the stored entries
+instead of a sweep of every term over every determinant.
+"""
+from __future__ import annotations
+from typing import Dict, Optional
+import numpy as np
+from .termtable import TermTable
+from .utils import fmt_bytes
+
+class _BitIndex:
+    """Stable ids for bitstrings (id = order of first sight); lookup by binary search."""
+    def __init__(self, bits: Optional[np.ndarray] = None):
+        self.bits = np.empty(0, np.int64) if bits is None else np.asarray(bits, np.int64)   # id → bit
+        self._order = np.argsort(self.bits, kind="stable")
+        self._sorted = self.bits[self._order]
+
+    def __len__(self):
+        return int(self.bits.size)
+
+    def ids(self, q: np.ndarray) -> np.ndarray:
+        """Ids of `q`, assigning new ones to bitstrings not seen before."""
+        out = np.empty(q.size, np.int64)
+        found = np.zeros(q.size, bool)
+        if self._sorted.size:
+            pos = np.searchsorted(self._sorted, q)
+            pos[pos >= self._sorted.size] = 0
+            found = self._sorted[pos] == q
+            out[found] = self._order[pos[found]]
+        if not found.all():
+            u, inv = np.unique(q[~found], return_inverse=True)
+            n0 = self.bits.size
+            out[~found] = n0 + inv
+            self.bits = np.concatenate([self.bits, u])
+            self._order = np.argsort(self.bits, kind="stable")
+            self._sorted = self.bits[self._order]
+        return out
+
+class AmplitudeCache:
+    def __init__(self, bilinear_terms, table: Optional[TermTable] = None):
+        self.table = table or TermTable(bilinear_terms)
+        self.real = self.table.real
+        self.rows = _BitIndex()
+        self.cols = _BitIndex()
+        self.has = np.zeros(0, bool)          # row id → entries stored
+        self.src = np.empty(0, np.int32)
+        self.col = np.empty(0, np.int32)
+        self.val = np.empty(0, np.float64 if self.real else np.complex128)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.src.nbytes + self.col.nbytes + self.val.nbytes + 16 * (len(self.rows) + len(self.cols)))
+
+    def _generate(self, bits: np.ndarray, ids: np.ndarray):
+        r, tgt, val = self.table.connections(bits)
+        if not r.size:
+            return
+        self.src = np.concatenate([self.src, ids[r].astype(np.int32)])
+        self.col = np.concatenate([self.col, self.cols.ids(tgt).astype(np.int32)])
+        self.val = np.concatenate([self.val, val])
+
+    def _compact(self, live: np.ndarray) -> np.ndarray:
+        """Drop the rows that left the basis with their entries and the columns no longer hit → old → new row id."""
+        kept = np.flatnonzero(live)
+        remap = np.full(live.size, -1, np.int64); remap[kept] = np.arange(kept.size)
+        keep = live[self.src]
+        self.src = remap[self.src[keep]].astype(np.int32)
+        self.col, self.val = self.col[keep], self.val[keep]
+        self.rows = _BitIndex(self.rows.bits[kept])
+        self.has = self.has[kept]
+        used = np.unique(self.col)
+        if used.size < len(self.cols):
+            self.cols = _BitIndex(self.cols.bits[used])
+            self.col = np.searchsorted(used, self.col).astype(np.int32)
+        return remap
+
+    def update(self, basis) -> tuple:
+        """Bring the stored rows in line with `basis` → (row ids in basis order, new rows generated)."""
+        bits = np.fromiter(basis, dtype=np.int64, count=len(basis))
+        ids = self.rows.ids(bits)
+        if self.has.size < len(self.rows):
+            self.has = np.concatenate([self.has, np.zeros(len(self.rows) - self.has.size, bool)])
+        live = np.zeros(self.has.size, bool); live[ids] = True
+        if not live.all():
+            ids = self._compact(live)[ids]
+        new = ~self.has[ids]
+        if new.any():
+            self._generate(bits[new], ids[new])
+            self.has[ids[new]] = True
+        return ids, int(new.sum())
+
+    def amplitudes(self, basis, coeffs, hb_gamma=None, max_abs_coeff=None, stats=None) -> Dict[int, complex]:
+        """Same M as cipsi.connected_amplitudes (up to summation order), from the stored connectivity."""
+        ids, n_new = self.update(basis)
+        real = self.real and not np.iscomplexobj(coeffs)
+        c_row = np.zeros(self.has.size, np.float64 if real else np.complex128)
+        c_row[ids] = coeffs
+        a_row = np.abs(c_row)
+        a_src = a_row[self.src]
+        mask = a_src >= 1e-16
+        a_basis = a_row[ids]; a_basis = a_basis[a_basis >= 1e-16]
+        if hb_gamma is not None:
+            if max_abs_coeff and max_abs_coeff > 0:
+                mask &= a_src >= hb_gamma / max_abs_coeff
+                a_basis = a_basis[a_basis >= hb_gamma / max_abs_coeff]
+            mask &= a_src * np.abs(self.val) >= hb_gamma
+        n_try = self.table.n_tried(a_basis, hb_gamma)
+        w = self.val[mask] * c_row[self.src[mask]]
+        cm = self.col[mask]
+        nc = len(self.cols)
+        hit = np.bincount(cm, minlength=nc) > 0
+        mr = np.bincount(cm, weights=w.real, minlength=nc)[hit]
+        keys = self.cols.bits[hit].tolist()
+        if real:
+            M = dict(zip(keys, mr.tolist()))
+        else:
+            mi = np.bincount(cm, weights=w.imag, minlength=nc)[hit]
+            M = dict(zip(keys, (mr + 1j * mi).tolist()))
+        if stats is not None:
+            stats["terms_tried"] = stats.get("terms_tried", 0) + n_try
+            stats["terms_hit"] = stats.get("terms_hit", 0) + int(cm.size)
+            stats["amp_new_rows"] = stats.get("amp_new_rows", 0) + n_new
+        return M
+
+    def describe(self) -> str:
+        return (f"rows={int(self.has.sum())} entries={self.src.size} columns={len(self.cols)} "
+                f"~{fmt_bytes(self.nbytes)}")
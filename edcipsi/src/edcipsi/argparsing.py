@@ -2,7 +2,10 @@
 from argparse import ArgumentParser
 
 def build_parser() -> ArgumentParser:
-    ap = ArgumentParser(description="ED-CIPSI (spin-1/2, HPhi InterAll) with optional Numba Hx and threading.")
+    ap = ArgumentParser(description="ED-CIPSI (spin-1/2, HPhi InterAll) with optional Numba Hx and threading.",
+                        epilog="'edcipsi warmup [--cache-dir DIR]' precompiles the Numba kernels into the shared cache; "
+                               "'edcipsi serve --socket PATH' keeps a warm worker for job streams "
+                               "('edcipsi submit --socket PATH -- namelist.def ...').")
     ap.add_argument("namelist", type=str, help="HPhi-style namelist.def")
     ap.add_argument("--grand-canonical", action="store_true", help="override: do not fix Sz sector")
     ap.add_argument("--seeds", type=int, default=None)
@@ -11,16 +14,57 @@ def build_parser() -> ArgumentParser:
     ap.add_argument("--prune", type=int, default=None)
     ap.add_argument("--eps", type=float, default=None)
     ap.add_argument("--outfile", default=None)
+    ap.add_argument("--outdir", default=None, help="output directory (default: ./output)")
+    ap.add_argument("--full-ed", action="store_true",
+                    help="exact diagonalization of the whole Sz sector (CIPSISectorSz; 2^N if grand canonical "
+                         "or Sz is not conserved) instead of CIPSI; same output files")
 
     # perf
-    ap.add_argument("--threads", type=int, default=None, help="set OMP/MKL thread env vars")
+    ap.add_argument("--threads", type=int, default=None,
+                    help="BLAS/OpenMP and Numba threads (env vars before NumPy loads, then threadpoolctl/"
+                         "numba.set_num_threads at runtime)")
+    ap.add_argument("--phase-threads", type=str, default=None,
+                    help="per-phase thread counts, e.g. eigsh=8,selection=4 (phases: build, eigsh, "
+                         "selection, observables; others use --threads)")
+    ap.add_argument("--worker-threads", type=int, default=1,
+                    help="BLAS/Numba threads inside each --build-procs/--select-procs worker process")
+    ap.add_argument("--engine", choices=["auto","matfree","csr","blocked","ooc"], default=None,
+                    help="Hamiltonian representation; auto picks per cycle from a cost model "
+                         "(default: from --accel-matvec/--build-blocked)")
+    ap.add_argument("--mem-budget", type=str, default=None,
+                    help="RAM budget, e.g. 16G: caps --engine auto and enables the memory governor "
+                         "(default: CIPSIMemBudget, else 80%% of MemAvailable for --engine auto only)")
+    ap.add_argument("--mem-governor", action="store_true",
+                    help="adapt engine/add_per_cycle/pruning to the budget (implied by --mem-budget; "
+                         "default budget: 80%% of MemAvailable)")
+    ap.add_argument("--ooc-dir", type=str, default=None,
+                    help="scratch directory for the out-of-core CSR of --engine ooc; use node-local NVMe "
+                         "(default: $TMPDIR)")
+    ap.add_argument("--scipy-spmv", action="store_true",
+                    help="use SciPy's single-threaded CSR matvec instead of the Numba parallel one")
     ap.add_argument("--accel-matvec", action="store_true", help="use Numba LinearOperator H·x if available")
     ap.add_argument("--nb-parallel", action="store_true",
-                    help="parallelize Numba matvec with OpenMP (prange+atomics)")
+                    help="parallelize the Numba matrix-free matvec over rows (prange, row-wise pull, no atomics)")
+    ap.add_argument("--raw-terms", action="store_true",
+                    help="use InterAll terms as listed (no duplicate merging / Hermitian-pair folding)")
+    ap.add_argument("--complex", action="store_true",
+                    help="always use complex128 arithmetic, even if InterAll is real")
     ap.add_argument("--build-blocked", action="store_true",
                     help="build CSR H in row blocks (memory-friendly; can parallelize)")
+    ap.add_argument("--numpy-build", action="store_true",
+                    help="assemble CSR with the NumPy/process-pool builders instead of the threaded Numba kernels")
     ap.add_argument("--block-size", type=int, default=4096,
                     help="rows per block when building CSR")
+    ap.add_argument("--lookup", choices=["bsearch","hash"], default="bsearch",
+                    help="basis index of the matrix-free matvec: binary search or open-addressing hash table")
+    ap.add_argument("--autotune", action="store_true",
+                    help="time the engine/lookup/thread/block-size candidates on the basis once it has "
+                         ">= 2048 rows and keep the fastest; results are stored per machine and problem "
+                         "size ($EDCIPSI_CACHE_DIR/autotune.json) and reused")
+    ap.add_argument("--autotune-refresh", action="store_true",
+                    help="with --autotune: measure again even if a stored result exists")
+    ap.add_argument("--csr-half", action="store_true",
+                    help="store only the upper triangle of the assembled CSR (half memory, Hermitian matvec)")
     # Heat-Bath style branch preselection
     ap.add_argument("--hb-preselect", action="store_true",
                     help="enable Heat-Bath style preselection by |c_a|*|alpha_t| >= Gamma")
@@ -28,11 +72,46 @@ def build_parser() -> ArgumentParser:
                     help="Gamma threshold for preselection; default auto: sqrt(eps)*max|alpha_t|")
     # PT2 estimation
     ap.add_argument("--pt2", action="store_true",
-                    help="compute Epstein–Nesbet PT2 from connected amplitudes")
+                    help="report Epstein–Nesbet PT2 of the final basis (from its selection pass, or one amplitude pass after the last additions)")
+    ap.add_argument("--pt2-recompute", action="store_true",
+                    help="with --pt2: regenerate the connected amplitudes of the final basis instead")
     ap.add_argument("--level-shift", type=float, default=0.0,
                     help="optional level shift added to denominators in PT2 (stabilization)")
     ap.add_argument("--build-procs", type=int, default=0,
                     help="use N processes to build blocks in parallel (0=serial)")
+    ap.add_argument("--select-procs", type=int, default=0,
+                    help="hash-partitioned selection over N local processes (0=in-process)")
+    ap.add_argument("--no-amp-cache", action="store_true",
+                    help="re-derive the basis->external connections every cycle instead of keeping them "
+                         "(less memory, slower amplitude pass)")
+    ap.add_argument("--no-metrics", action="store_true",
+                    help="do not write per-cycle phase timings/counters to output/metrics.jsonl")
+    # adaptive per-cycle growth (add_per_cycle becomes a cap)
+    ap.add_argument("--growth", choices=["fixed","weight","geometric"], default=None,
+                    help="per-cycle additions: fixed=add_per_cycle, weight=capture --growth-frac of the "
+                         "selection weight, geometric=grow basis by --growth-factor")
+    ap.add_argument("--growth-frac", type=float, default=None, help="target captured weight fraction (weight mode)")
+    ap.add_argument("--growth-factor", type=float, default=None, help="basis growth factor per cycle (geometric mode)")
+    ap.add_argument("--growth-stop", type=float, default=None,
+                    help="stop when the weight captured by a cycle falls below this (adaptive modes)")
+    # convergence monitor (E_var vs E_PT2 extrapolation)
+    ap.add_argument("--conv-tol", type=float, default=None,
+                    help="stop once the extrapolated energy changes by less than this between cycles")
+    ap.add_argument("--conv-pt2-tol", type=float, default=None,
+                    help="stop once the per-cycle E_PT2 changes by less than this between cycles")
+    ap.add_argument("--conv-window", type=int, default=4, help="cycles used in the E_var vs E_PT2 linear fit")
+    # dynamical structure factors (continued-fraction Lanczos on the expanded basis)
+    ap.add_argument("--dynamics", type=str, default=None,
+                    help="compute S^a(q,omega) for a in this comma list of z,+,- (writes output/sqw_*.dat)")
+    ap.add_argument("--dyn-lattice", type=str, default=None, help="cluster shape LxxLy, e.g. 4x4 (default: Nsite x 1)")
+    ap.add_argument("--dyn-q", type=str, default="all",
+                    help="integer momenta 'm1,m2;m1,m2;...' in units of 2pi/L, or 'all'")
+    ap.add_argument("--dyn-omega", type=float, nargs=3, default=None, metavar=("WMIN","WMAX","NW"),
+                    help="frequency grid (default: 0 .. top of the Lanczos spectrum, >= 2 points per eta)")
+    ap.add_argument("--dyn-eta", type=float, default=0.05, help="Lorentzian broadening")
+    ap.add_argument("--dyn-iter", type=int, default=200, help="Lanczos steps per (op, q)")
+    ap.add_argument("--dyn-expand", type=int, default=1,
+                    help="times the S^a_q|psi0> support is expanded by H-connected determinants")
     # CIPSISeedMode
     ap.add_argument("--seed-mode", choices=["random","diag"], default=None)
     ap.add_argument("--seed-pool", type=int, default=None)
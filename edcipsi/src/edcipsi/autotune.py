@@ -0,0 +1,236 @@
+"""--autotune: measure the solve configurations on the real basis, keep the fastest.
+
+The cost model of --engine auto (engine.py) uses fixed per-operation constants;
+the real ratios depend on the CPU, its caches and the Hamiltonian. At the first
+solve whose basis has at least MIN_ROWS determinants, every candidate
+
+  csr      Numba build × Numba thread counts (without --threads), or the NumPy
+           builders × --block-size {1024, 4096, 16384} × --build-procs (blocked)
+  matfree  binary-search vs hash-table basis lookup
+
+builds H on the first SAMPLE_ROWS basis determinants (the earliest selected,
+strongly connected among themselves, so the in-basis hit rate is close to that
+of the whole basis) and times a few matvecs. The predicted solve time
+(build + EIGSH_MATVECS matvecs, scaled to the full basis) ranks them; CSR
+candidates whose projected matrix exceeds the memory budget are dropped. The
+winner is used for the rest of the run and stored in <cache dir>/autotune.json
+(next to the Numba cache, see nbkernels.default_cache_dir) under the machine
+(CPU model, cores, Numba threads) and the problem size (N, operator directions,
+real/complex, log2 of the basis size), so later runs reuse it without measuring.
+"""
+from __future__ import annotations
+import io, json, math, os, platform, time
+from contextlib import redirect_stdout
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+import numpy as np
+from . import nbkernels as nbk
+from .engine import EIGSH_MATVECS, EIGSH_NCV
+from .io import hamiltonian_dtype, n_directions
+from .utils import fmt_bytes
+
+MIN_ROWS = 2048          # tune once the basis is at least this large
+SAMPLE_ROWS = 16384      # rows the candidates are measured on
+BLOCK_SIZES = (1024, 4096, 16384)
+REPS = 3                 # timed matvecs per candidate
+
+@dataclass
+class TuneConfig:
+    engine: str = "csr"              # csr | blocked | matfree
+    lookup: str = "bsearch"          # matfree basis index: bsearch | hash
+    threads: Optional[int] = None    # Numba threads (None: leave as is)
+    block_size: int = 4096
+    build_procs: int = 0
+
+    def describe(self) -> str:
+        if self.engine == "matfree":
+            return f"matfree lookup={self.lookup}"
+        s = f"{self.engine} block_size={self.block_size}"
+        if self.build_procs:
+            s += f" procs={self.build_procs}"
+        if self.threads:
+            s += f" threads={self.threads}"
+        return s
+
+def default_path() -> str:
+    return os.path.join(os.path.dirname(nbk.default_cache_dir()), "autotune.json")
+
+def machine_key() -> str:
+    model = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    impl = nbk.load_kernels()
+    nth = impl.nb.config.NUMBA_NUM_THREADS if impl is not None else 0
+    return f"{model}|cores={os.cpu_count()}|numba={nth}"
+
+def _powers_of_two(n: int) -> List[int]:
+    out = [1]
+    while out[-1] * 2 <= n:
+        out.append(out[-1] * 2)
+    if out[-1] != n:
+        out.append(n)
+    return out
+
+class AutoTuner:
+    """Per-run tuner: config(basis) → TuneConfig once tuned (or found on disk), else None."""
+    def __init__(self, N, diag_terms, bilinear_terms, engine=None, nb_build=True, csr_half=False,
+                 block_size=4096, build_procs=0, tune_threads=True, mem_budget=None, refresh=False,
+                 path=None):
+        self.N = N
+        self.diag, self.bil = diag_terms, bilinear_terms
+        self.engine = None if engine in (None, "auto") else engine
+        self.nb_build = bool(nb_build and nbk.NUMBA_OK)
+        self.csr_half = csr_half
+        self.block_size, self.build_procs = block_size, build_procs
+        self.tune_threads = tune_threads
+        self.mem_budget = mem_budget
+        self.refresh = refresh
+        self.path = path or default_path()
+        self.real = hamiltonian_dtype(diag_terms, bilinear_terms) is np.float64
+        self.chosen: Optional[TuneConfig] = None
+
+    # ---- persistence ---------------------------------------------------------------
+    def key(self, B: int) -> str:
+        prob = (f"N={self.N}|T={n_directions(self.bil)}|{'real' if self.real else 'complex'}"
+                f"|B=2^{int(math.log2(max(B, 1)))}")
+        opts = f"engine={self.engine or 'any'}|{'nb' if self.nb_build else 'np'}|half={int(self.csr_half)}"
+        return f"{machine_key()}|{prob}|{opts}"
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, key: str, cfg: TuneConfig, table: list) -> None:
+        db = self._load()
+        db[key] = dict(config=asdict(cfg), measured=table, time=time.strftime("%Y-%m-%d %H:%M:%S"))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(db, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[Autotune] could not store the result in {self.path}: {e}")
+
+    # ---- candidates --------------------------------------------------------------------
+    def candidates(self) -> List[TuneConfig]:
+        engines = [self.engine] if self.engine else (["csr", "matfree"] if nbk.NUMBA_OK else ["csr"])
+        cores = os.cpu_count() or 1
+        out: List[TuneConfig] = []
+        for eng in engines:
+            if eng == "matfree":
+                if nbk.NUMBA_OK:
+                    out += [TuneConfig("matfree", lookup=lk) for lk in ("bsearch", "hash")]
+            elif eng == "csr" and self.nb_build:
+                impl = nbk.load_kernels()
+                nth = [None]
+                if self.tune_threads and impl is not None:
+                    nth = _powers_of_two(impl.nb.config.NUMBA_NUM_THREADS)
+                out += [TuneConfig("csr", threads=t, block_size=self.block_size) for t in nth]
+            else:
+                procs = [p for p in (2, 4, 8, 16, 32) if p <= cores]
+                if eng == "blocked":
+                    procs = [0] + procs
+                for bs in BLOCK_SIZES:
+                    if eng == "csr":
+                        out.append(TuneConfig("csr", block_size=bs))
+                    out += [TuneConfig("blocked", block_size=bs, build_procs=p) for p in procs]
+        return out
+
+    def _operator(self, cfg: TuneConfig, basis):
+        """→ (operator, nnz or None), built the way solver.solve_ground builds it."""
+        from .solver import matfree_operator, as_operator
+        from .hbuilder import build_subspace_matrix, build_subspace_matrix_blocked
+        if cfg.engine == "matfree":
+            return matfree_operator(basis, self.diag, self.bil, lookup=cfg.lookup), None
+        if cfg.engine == "blocked":
+            H = build_subspace_matrix_blocked(basis, self.N, self.diag, self.bil, block_size=cfg.block_size,
+                                              procs=cfg.build_procs, verbose=False, nb_build=self.nb_build)
+        else:
+            H = build_subspace_matrix(basis, self.N, self.diag, self.bil, half=self.csr_half,
+                                      block_size=cfg.block_size, nb_build=self.nb_build)
+        return as_operator(H), int(H.nnz)
+
+    def _measure(self, cfg: TuneConfig, sample, B: int) -> dict:
+        impl = nbk.load_kernels()
+        prev = None
+        if cfg.threads and impl is not None:
+            prev = impl.nb.get_num_threads()
+            impl.nb.set_num_threads(cfg.threads)
+        try:
+            with redirect_stdout(io.StringIO()):
+                # compile / load the kernels of this candidate outside the timing
+                op, _ = self._operator(cfg, sample[:64])
+                op @ np.ones(op.shape[0], dtype=op.dtype)
+                t0 = time.perf_counter()
+                op, nnz = self._operator(cfg, sample)
+                t_build = time.perf_counter() - t0
+                x = np.random.default_rng(0).standard_normal(op.shape[0]).astype(op.dtype)
+                op @ x
+                t0 = time.perf_counter()
+                for _ in range(REPS):
+                    op @ x
+                t_mv = (time.perf_counter() - t0) / REPS
+        finally:
+            if prev is not None:
+                impl.nb.set_num_threads(prev)
+        scale = B / len(sample)
+        row = dict(config=cfg.describe(), build=t_build, matvec=t_mv,
+                   predicted=scale * (t_build + EIGSH_MATVECS * t_mv))
+        if nnz is not None:
+            item = 8 if self.real else 16
+            row["bytes"] = int(nnz * scale * (item + 4) + EIGSH_NCV * B * item)
+        return row
+
+    def tune(self, basis) -> TuneConfig:
+        B = len(basis)
+        sample = list(basis[:SAMPLE_ROWS])
+        print(f"[Autotune] measuring {len(self.candidates())} configuration(s) on {len(sample)}/{B} rows "
+              f"(predicted solve = build + {EIGSH_MATVECS} matvecs, scaled to B)")
+        table = []; best = None
+        for cfg in self.candidates():
+            try:
+                row = self._measure(cfg, sample, B)
+            except Exception as e:
+                print(f"[Autotune]   {cfg.describe():<34} failed: {e}")
+                continue
+            over = self.mem_budget is not None and row.get("bytes", 0) > self.mem_budget
+            mem = f" ~{fmt_bytes(row['bytes'])}" if "bytes" in row else ""
+            print(f"[Autotune]   {cfg.describe():<34} build {row['build']:.3f}s  matvec {1e3*row['matvec']:.2f}ms"
+                  f"  -> {row['predicted']:.3f}s{mem}" + ("  over budget" if over else ""))
+            table.append(row)
+            if not over and (best is None or row["predicted"] < best[1]):
+                best = (cfg, row["predicted"])
+        cfg = best[0] if best is not None else TuneConfig(self.engine or "csr", block_size=self.block_size,
+                                                          build_procs=self.build_procs)
+        self._store(self.key(B), cfg, table)
+        return cfg
+
+    def config(self, basis) -> Optional[TuneConfig]:
+        if self.chosen is not None:
+            return self.chosen
+        B = len(basis)
+        key = self.key(B)
+        hit = None if self.refresh else self._load().get(key)
+        if hit is not None:
+            self.chosen = TuneConfig(**hit["config"])
+            print(f"[Autotune] {self.chosen.describe()} (stored {hit.get('time', '?')} in {self.path})")
+        elif B < MIN_ROWS:
+            return None
+        else:
+            self.chosen = self.tune(basis)
+            print(f"[Autotune] -> {self.chosen.describe()} for the rest of the run (stored in {self.path})")
+        if self.chosen.threads:
+            impl = nbk.load_kernels()
+            if impl is not None:
+                impl.nb.set_num_threads(min(self.chosen.threads, impl.nb.config.NUMBA_NUM_THREADS))
+        return self.chosen
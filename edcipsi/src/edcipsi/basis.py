@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import List, Optional
 import random
+import numpy as np
 
 
 def ensure_unique_basis(basis_bits: List[int], where: str = "") -> None:
@@ -24,7 +25,8 @@ def n_on_site(bit: int, site: int, spin: int) -> int:
     return up if spin==0 else (1-up)
 
 def diag_energy_bit(bit: int, diag_terms) -> complex:
-    e = 0.0 + 0.0j
+    # 型は係数に従う（実数化された項なら float）
+    e = 0.0
     for (i,si,k,sk), c in diag_terms.items():
         e += c * (n_on_site(bit,i,si) * n_on_site(bit,k,sk))
     return e
@@ -42,6 +44,46 @@ def apply_local_op(bit: int, site: int, s_from: int, s_to: int):
     newbit = (bit | (1<<site)) if set_up==1 else (bit & ~(1<<site))
     return 1, newbit
 
+# ---- vectorized variants over an int64 array of bits ----------------------------
+def diag_energy_vec(bits: np.ndarray, di, dsi, dk, dsk, dcr, dci, real: bool = False) -> np.ndarray:
+    """diag_energy_bit for every entry of `bits`, using packed diag arrays."""
+    e = np.zeros(bits.shape[0], dtype=np.float64 if real else np.complex128)
+    for t in range(di.shape[0]):
+        ui = (bits >> int(di[t])) & 1
+        uk = (bits >> int(dk[t])) & 1
+        n_i = ui if dsi[t] == 0 else 1 - ui
+        n_k = uk if dsk[t] == 0 else 1 - uk
+        e += (float(dcr[t]) if real else complex(dcr[t], dci[t])) * (n_i * n_k)
+    return e
+
+def apply_local_op_vec(bits: np.ndarray, site: int, s_from: int, s_to: int):
+    """apply_local_op for every entry of `bits` → (ok mask, newbits)."""
+    up = (bits >> int(site)) & 1
+    if s_to == s_from:
+        ok = (up == 1) if s_to == 0 else (up == 0)
+        return ok, bits
+    need_up = 1 if s_from == 0 else 0
+    ok = (up == need_up)
+    mask = np.int64(1) << np.int64(site)
+    newbits = (bits | mask) if s_to == 0 else (bits & ~mask)
+    return ok, newbits
+
+def apply_term_vec(bits: np.ndarray, i: int, si: int, sj: int, k: int, sk: int, sl: int, adjoint: bool = False):
+    """Bilinear term (i,si,·,sj, k,sk,·,sl) on every entry of `bits` → (ok mask, targets).
+
+    Forward: (k: sl→sk) then (i: sj→si). adjoint=True applies the Hermitian
+    conjugate, (i: si→sj) then (k: sk→sl), as flagged canonical terms need.
+    """
+    if adjoint:
+        ok, s1 = apply_local_op_vec(bits, i, si, sj)
+        if not ok.any(): return ok, s1
+        ok2, s2 = apply_local_op_vec(s1, k, sk, sl)
+    else:
+        ok, s1 = apply_local_op_vec(bits, k, sl, sk)
+        if not ok.any(): return ok, s1
+        ok2, s2 = apply_local_op_vec(s1, i, sj, si)
+    return ok & ok2, s2
+
 def pick_low_diag_seeds(N:int, n_keep:int, pool_size:int, diag_terms, gc:bool, target_up:Optional[int], rng:random.Random):
     """E_diag が低い順に n_keep 個ビットを返す。If diag_terms empty, return None."""
     if not diag_terms:
@@ -0,0 +1,177 @@
+"""edcipsi-batch: run many namelists concurrently on one node.
+
+Manifest: one job per line, `path/to/namelist.def [edcipsi flags...]`
+('#' starts a comment). Each job runs `python -m edcipsi.cli` as its own
+process in the namelist's directory, with its own --outdir and
+OMP/MKL/NUMBA thread counts fixed to --threads-per-job, so that
+jobs × threads-per-job ≤ cores. A summary table (summary.tsv) is
+written to the batch output directory once all jobs finish.
+
+    edcipsi-batch scan.txt --jobs 8 --threads-per-job 4 --outdir scan_out -- --pt2
+
+With --daemon SOCKET the jobs are sent to a running `edcipsi serve` instead
+(no per-job interpreter start, kernels and parsed InterAll files stay warm).
+"""
+from __future__ import annotations
+import argparse, asyncio, os, re, shlex, sys, time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                "NUMEXPR_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+@dataclass
+class Job:
+    name: str
+    namelist: str
+    args: List[str]
+    outdir: str = ""
+    status: str = "pending"
+    returncode: Optional[int] = None
+    seconds: float = 0.0
+    result: Dict[str, str] = field(default_factory=dict)
+
+def read_manifest(path: str) -> List[Job]:
+    base = os.path.dirname(os.path.abspath(path))
+    jobs: List[Job] = []
+    seen: Dict[str, int] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            toks = shlex.split(line.split("#", 1)[0])
+            if not toks: continue
+            nl = toks[0] if os.path.isabs(toks[0]) else os.path.join(base, toks[0])
+            # job name from the namelist's directory relative to the manifest (a/b/namelist.def → a_b)
+            rel = os.path.relpath(os.path.dirname(nl), base)
+            name = re.sub(r"[^A-Za-z0-9._-]+", "_", rel).strip("_.") or "job"
+            n = seen.get(name, 0); seen[name] = n + 1
+            if n: name = f"{name}_{n}"
+            jobs.append(Job(name=name, namelist=os.path.normpath(nl), args=toks[1:]))
+    return jobs
+
+def split_cores(cores: int, jobs: Optional[int], threads: Optional[int]):
+    """→ (concurrent jobs, threads per job); unset values are filled so that jobs*threads <= cores."""
+    cores = max(1, cores)
+    if threads is None and jobs is None:
+        threads = 1
+    if threads is None:
+        threads = max(1, cores // max(1, jobs))
+    if jobs is None:
+        jobs = max(1, cores // threads)
+    return max(1, jobs), max(1, threads)
+
+def parse_result(outdir: str) -> Dict[str, str]:
+    """E0 from energy.out, basis size / PT2 from std.out (as printed by cli.main)."""
+    res: Dict[str, str] = {}
+    try:
+        with open(os.path.join(outdir, "energy.out"), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("E0"): res["E0"] = line.split()[1]
+                elif line.startswith("# BasisSize="): res["basis"] = line.split("=", 1)[1].strip()
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(outdir, "std.out"), "r", encoding="utf-8") as f:
+            for line in f:
+                m = re.search(r"E_var\+PT2=(\S+)", line)
+                if m and "[Final PT2]" in line: res["E_var+PT2"] = m.group(1)
+                m = re.search(r"\[Final Extrap\] E_extrap=(\S+)", line)
+                if m: res["E_extrap"] = m.group(1)
+    except OSError:
+        pass
+    return res
+
+async def _run_job(job: Job, threads: int, extra: List[str], sem: asyncio.Semaphore, verbose: bool,
+                   daemon: Optional[str] = None):
+    async with sem:
+        os.makedirs(job.outdir, exist_ok=True)
+        env = dict(os.environ)
+        env.update({k: str(threads) for k in _THREAD_VARS})
+        job_argv = [os.path.basename(job.namelist), "--outdir", job.outdir, "--threads", str(threads), *job.args, *extra]
+        cmd = [sys.executable, "-m", "edcipsi.cli", *job_argv]
+        if verbose:
+            print(f"[Batch] start {job.name}: {' '.join(shlex.quote(c) for c in (job_argv if daemon else cmd))}", flush=True)
+        t0 = time.perf_counter()
+        job.status = "running"
+        if daemon:
+            from .daemon import submit_socket_async
+            res = await submit_socket_async(daemon, {"id": job.name, "cwd": os.path.dirname(job.namelist),
+                                                     "argv": job_argv})
+            job.returncode = 0 if res.get("status") == "ok" else 1
+            if job.returncode:
+                print(f"[Batch] {job.name}: {res.get('error')}", flush=True)
+        else:
+            with open(os.path.join(job.outdir, "console.log"), "wb") as con:
+                proc = await asyncio.create_subprocess_exec(*cmd, cwd=os.path.dirname(job.namelist), env=env,
+                                                            stdout=con, stderr=asyncio.subprocess.STDOUT)
+                job.returncode = await proc.wait()
+        job.seconds = time.perf_counter() - t0
+        job.status = "ok" if job.returncode == 0 else "failed"
+        job.result = parse_result(job.outdir)
+        if verbose:
+            print(f"[Batch] {job.status:6s} {job.name} ({job.seconds:.1f}s) E0={job.result.get('E0', '-')}", flush=True)
+
+async def run_batch(jobs: List[Job], njobs: int, threads: int, extra: List[str], verbose=True,
+                    daemon: Optional[str] = None):
+    sem = asyncio.Semaphore(njobs)
+    await asyncio.gather(*(_run_job(j, threads, extra, sem, verbose, daemon) for j in jobs))
+
+_COLUMNS = ("name", "status", "seconds", "basis", "E0", "E_var+PT2", "E_extrap", "outdir")
+
+def _row(job: Job) -> List[str]:
+    return [job.name, job.status, f"{job.seconds:.2f}", job.result.get("basis", "-"),
+            job.result.get("E0", "-"), job.result.get("E_var+PT2", "-"), job.result.get("E_extrap", "-"), job.outdir]
+
+def write_summary(jobs: List[Job], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\t".join(_COLUMNS) + "\n")
+        for j in jobs:
+            f.write("\t".join(_row(j)) + "\n")
+
+def format_table(jobs: List[Job]) -> str:
+    rows = [list(_COLUMNS[:-1])] + [_row(j)[:-1] for j in jobs]
+    w = [max(len(r[c]) for r in rows) for c in range(len(rows[0]))]
+    return "\n".join("  ".join(r[c].ljust(w[c]) for c in range(len(r))) for r in rows)
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Run a manifest of edcipsi namelists concurrently.",
+                                 epilog="Arguments after '--' are passed to every job.")
+    ap.add_argument("manifest", help="text file: one 'namelist.def [flags...]' per line")
+    ap.add_argument("--jobs", type=int, default=None, help="concurrent jobs (default: cores / threads-per-job)")
+    ap.add_argument("--threads-per-job", type=int, default=None,
+                    help="OMP/MKL/Numba threads per job (default: cores / jobs, or 1)")
+    ap.add_argument("--cores", type=int, default=None, help="cores to use (default: os.cpu_count())")
+    ap.add_argument("--outdir", default="batch_output", help="per-job output goes to OUTDIR/<job name>/")
+    ap.add_argument("--daemon", default=None, metavar="SOCKET",
+                    help="send the jobs to a running 'edcipsi serve --socket SOCKET' (it runs them one at a time)")
+    ap.add_argument("--dry-run", action="store_true", help="print the job plan and exit")
+    return ap
+
+def main(argv=None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    extra: List[str] = []
+    if "--" in argv:
+        i = argv.index("--"); argv, extra = argv[:i], argv[i+1:]
+    args = build_parser().parse_args(argv)
+    cores = args.cores or os.cpu_count() or 1
+    njobs, threads = split_cores(cores, args.jobs, args.threads_per_job)
+    jobs = read_manifest(args.manifest)
+    outroot = os.path.abspath(args.outdir)
+    for j in jobs:
+        j.outdir = os.path.join(outroot, j.name)
+    print(f"[Batch] {len(jobs)} job(s), {njobs} concurrent x {threads} thread(s) on {cores} core(s) -> {outroot}")
+    if args.dry_run:
+        for j in jobs:
+            print(f"  {j.name}: {j.namelist} {' '.join(j.args + extra)}")
+        return 0
+    os.makedirs(outroot, exist_ok=True)
+    t0 = time.perf_counter()
+    asyncio.run(run_batch(jobs, njobs, threads, extra, daemon=args.daemon))
+    summary = os.path.join(outroot, "summary.tsv")
+    write_summary(jobs, summary)
+    print(format_table(jobs))
+    nfail = sum(j.status != "ok" for j in jobs)
+    print(f"[Batch] done in {time.perf_counter()-t0:.1f}s, {len(jobs)-nfail} ok, {nfail} failed; summary -> {summary}")
+    return 1 if nfail else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,56 +2,91 @@ from __future__ import annotations
 from typing import List, Dict, Tuple
 import math, numpy as np
 from collections import defaultdict
-from .basis import apply_local_op, diag_energy_bit
+from .basis import diag_energy_bit
 from .solver import solve_ground
 from .nbkernels import NUMBA_OK
+from .pselect import select_new_configs_mp
+from .metrics import NULL_METRICS
+from .ampcache import AmplitudeCache
+from .termtable import TermTable
 
-def connected_amplitudes(basis_bits, coeffs, bilinear_terms, hb_gamma=None, max_abs_coeff=None, terms_sorted=False):
-    idx_to_bit = list(basis_bits)
-    M = defaultdict(complex)
+def connected_amplitudes(basis_bits, coeffs, bilinear_terms, hb_gamma=None, max_abs_coeff=None, terms_sorted=False,
+                         stats=None, table=None):
+    """M_a = sum_b <a|H|b> c_b (b in the basis, a != b; a may be internal, callers skip those).
+
+    Terms come from the occupation-indexed table (termtable.TermTable), so a
+    determinant only meets the directions that apply to it; with hb_gamma the
+    scan of b stops at the first |c_b|·|c| < Γ (terms_sorted is implied)."""
+    table = table or TermTable(bilinear_terms)
+    M = defaultdict(complex if np.iscomplexobj(coeffs) or not table.real else float)
     whole_a_cut = (hb_gamma / max_abs_coeff) if (hb_gamma is not None and max_abs_coeff and max_abs_coeff>0) else 0.0
-    for i, b in enumerate(idx_to_bit):
+    a_used = []; n_hit = 0
+    for i, b in enumerate(basis_bits):
         ci = coeffs[i]
         abs_ci = abs(ci)
         if abs_ci < 1e-16:
             continue
         if hb_gamma is not None and abs_ci < whole_a_cut:
             continue
-        for (ii,si,jj,sj, kk,sk,ll,sl, c) in bilinear_terms:
-            if hb_gamma is not None and abs_ci * abs(c) < hb_gamma:
-                if terms_sorted: break
-                else: continue
-            ok1, s1 = apply_local_op(b, kk, sl, sk)
-            if not ok1: continue
-            ok2, s2 = apply_local_op(s1, ii, sj, si)
-            if not ok2 or s2 == b: continue
+        a_used.append(abs_ci)
+        conns = table.apply(b, abs_ci, hb_gamma)
+        n_hit += len(conns)
+        for (s2, c) in conns:
             M[s2] += c * ci
+    if stats is not None:
+        stats["terms_tried"] = stats.get("terms_tried", 0) + table.n_tried(np.asarray(a_used, dtype=float), hb_gamma)
+        stats["terms_hit"] = stats.get("terms_hit", 0) + n_hit
     return M
 
-def select_new_configs(E, M_dict, diag_terms, used_set, add_max, eps, delta=1e-12):
+def _pt2_term(m2, denom, level_shift=0.0):
+    """|M_a|^2/(E - H_aa) with the optional level shift; 0 for a vanishing denominator."""
+    if level_shift:
+        denom = denom + (level_shift if denom.real >= 0 else -level_shift)
+    if abs(denom) < 1e-16:
+        return 0.0
+    return m2 / denom
+
+def select_new_configs(E, M_dict, diag_terms, used_set, add_max, eps, delta=1e-12, stats=None, growth=None,
+                       level_shift=0.0):
+    """Top candidates by |M|^2/|E-H_aa|; the same pass accumulates the external-space PT2.
+
+    stats["pt2"]: Epstein–Nesbet PT2 of all external determinants,
+    stats["pt2_rest"]: the part carried by the candidates that were not selected.
+    """
     cands = []
+    n_ext = 0; w_total = 0.0; pt2 = 0.0
     for bit, M in M_dict.items():
         if bit in used_set: continue
+        n_ext += 1
         Haa = diag_energy_bit(bit, diag_terms)
         denom = E - Haa
-        w = (abs(M)**2) / max(abs(denom), delta)
+        m2 = abs(M)**2
+        w = m2 / max(abs(denom), delta)
+        e2 = _pt2_term(m2, denom, level_shift)
+        pt2 += e2
+        w_total += w
         if w >= eps:
-            cands.append((w, bit))
+            cands.append((w, bit, e2))
     cands.sort(key=lambda x: x[0], reverse=True)
-    return [b for (_,b) in cands[:add_max]]
+    n_add = add_max
+    if growth is not None:
+        n_add = growth.count([w for (w,_,_) in cands], w_total, add_max, len(used_set))
+    picked = cands[:n_add]
+    if stats is not None:
+        stats["external"] = n_ext
+        stats["candidates"] = len(cands)
+        stats["pt2"] = float(np.real(pt2))
+        stats["pt2_rest"] = float(np.real(pt2 - sum(e for (_,_,e) in picked)))
+    return [b for (_,b,_) in picked]
 
-def compute_PT2(E, M_dict, diag_terms, level_shift=0.0):
+def compute_PT2(E, M_dict, diag_terms, level_shift=0.0, exclude=None):
+    """Epstein–Nesbet sum_a |M_a|^2/(E - H_aa) → (E_PT2, external determinants); `exclude` (the variational basis) is skipped."""
     total = 0.0; n = 0
     for bit, M in M_dict.items():
-        Hii = diag_energy_bit(bit, diag_terms)
-        denom = (E - Hii)
-        if level_shift:
-            denom = denom + (level_shift if denom.real >= 0 else -level_shift)
-        if abs(denom) < 1e-16:
-            continue
-        total += (abs(M)**2) / denom
+        if exclude is not None and bit in exclude: continue
+        total += _pt2_term(abs(M)**2, E - diag_energy_bit(bit, diag_terms), level_shift)
         n += 1
-    return float(total.real), n
+    return float(np.real(total)), n
 
 def prune_by_coeff(basis_bits, vec, keep_max):
     if len(basis_bits) <= keep_max: return list(basis_bits)
@@ -65,7 +100,15 @@ def run_cipsi_once(N:int, diag_terms, bilinear_terms,
                    hb_gamma:float|None, hb_sorted:bool, max_abs_coeff:float,
                    threads:int|None, accel_matvec:bool, nb_parallel:bool,
                    build_blocked:bool, block_size:int, build_procs:int,
-                   seed_mode:str, seed_pool:int, sector_Sz, rng):
+                   seed_mode:str, seed_pool:int, sector_Sz, rng, select_procs:int=0, metrics=None,
+                   growth=None, engine=None, mem_budget=None, ooc_dir=None, par_spmv=True, csr_half=False,
+                   nb_build=True, monitor=None, level_shift=0.0, governor=None, amp_cache=True,
+                   autotune=None, lookup="bsearch", final_stats=None):
+    """→ (E, vec, basis) of the final solve.
+
+    final_stats (a dict) receives the PT2 of the final basis ("pt2", "external",
+    "e_var", "source"): the last selection pass when the run stopped before adding
+    to it, otherwise one more amplitude pass on the final basis and vector."""
     # 初期基底（あなたの元コードに合わせて簡約）
     basis = []
     used = set()
@@ -99,30 +142,121 @@ def run_cipsi_once(N:int, diag_terms, bilinear_terms,
 
     use_nb = bool(accel_matvec and NUMBA_OK)
     use_nb_parallel = bool(use_nb and nb_parallel)
+    m = metrics or NULL_METRICS
+    requested = engine or ("matfree" if use_nb else "blocked" if build_blocked else "csr")
+    # basis → external connectivity kept across cycles (in-process selection only)
+    table = TermTable(bilinear_terms)
+    print(f"[HB] term table: {table.describe()}")
+    amps = AmplitudeCache(bilinear_terms, table) if amp_cache and not (select_procs and select_procs > 0) else None
+
+    def _solve(cycle):
+        eng, budget, req = engine, mem_budget, requested
+        bs, bp, lk = block_size, build_procs, lookup
+        tuned = autotune.config(basis) if autotune is not None else None
+        if tuned is not None:
+            eng = req = tuned.engine
+            bs, bp, lk = tuned.block_size, tuned.build_procs, tuned.lookup
+            m.set("autotune", tuned.describe())
+        if governor is not None:
+            eng = governor.solve_engine(cycle, basis, diag_terms, bilinear_terms, eng, req)
+            if eng == "auto":
+                budget = governor.solve_budget(len(basis))
+        out = solve_ground(basis, N, diag_terms, bilinear_terms,
+                           use_nb=use_nb, use_nb_parallel=use_nb_parallel,
+                           build_blocked=build_blocked, block_size=bs, build_procs=bp,
+                           metrics=m, engine=eng, mem_budget=budget, ooc_dir=ooc_dir,
+                           par_spmv=par_spmv, csr_half=csr_half, nb_build=nb_build, lookup=lk)
+        if governor is not None:
+            governor.sample("solve", m)
+        return out
+
+    def _select(E, vec, add_max, stats, growth=None):
+        """Amplitudes + selection on the current basis → new determinants (stats: pt2, external, ...)."""
+        if select_procs and select_procs > 0:
+            with m.phase("selection"):
+                return select_new_configs_mp(E, basis, vec, diag_terms, bilinear_terms, add_max, eps,
+                                             select_procs, hb_gamma=hb_gamma, max_abs_coeff=max_abs_coeff,
+                                             stats=stats, growth=growth, level_shift=level_shift)
+        with m.phase("amplitudes"):
+            if amps is not None:
+                M = amps.amplitudes(basis, vec, hb_gamma=hb_gamma, max_abs_coeff=max_abs_coeff, stats=stats)
+                print(f"[AmpCache] +{stats['amp_new_rows']} rows: {amps.describe()}")
+                m.set("amp_cache_bytes", amps.nbytes)
+                if governor is not None:
+                    governor.observe_cache(len(basis), amps.nbytes)
+            else:
+                M = connected_amplitudes(basis, vec, bilinear_terms, hb_gamma=hb_gamma, max_abs_coeff=max_abs_coeff,
+                                         terms_sorted=hb_sorted, stats=stats, table=table)
+        with m.phase("selection"):
+            return select_new_configs(E, M, diag_terms, set(basis), add_max, eps, stats=stats,
+                                      growth=growth, level_shift=level_shift)
 
     # 反復
+    last_pass = None        # the selection pass, if the run stopped before adding to its basis
     for cyc in range(cycles):
-        E, vec = solve_ground(basis, N, diag_terms, bilinear_terms,
-                              use_nb=use_nb, use_nb_parallel=use_nb_parallel,
-                              build_blocked=build_blocked, block_size=block_size, build_procs=build_procs)
+        E, vec = _solve(cyc+1)
         print(f"[Cycle {cyc+1}/{cycles}] Basis={len(basis)}, E0={E:.8f}  E0/site={E.real/N:.6f} (|Im|={abs(E.imag):.2e})")
-        M = connected_amplitudes(basis, vec, bilinear_terms, hb_gamma=hb_gamma, max_abs_coeff=max_abs_coeff, terms_sorted=hb_sorted)
-        new_bits = select_new_configs(E, M, diag_terms, set(basis), add_per_cycle, eps)
+        basis_in = len(basis)
+        stats = {}
+        if governor is not None and amps is not None and not governor.keep_cache(cyc+1, basis_in):
+            amps = None
+        add_max = add_per_cycle if governor is None else governor.add_limit(cyc+1, basis_in, add_per_cycle)
+        new_bits = _select(E, vec, add_max, stats, growth)
+        m.update(stats)
+        if governor is not None:
+            governor.observe_selection(basis_in, stats["external"])
+            governor.sample("selection", m)
+            if add_max == 0:
+                print(f"[Mem] basis at the memory budget (B={basis_in}); stopping")
+                new_bits = []
+        if monitor is not None:
+            monitor.add(cyc+1, basis_in, E.real, stats["pt2"], pt2_rest=stats["pt2_rest"], n_ext=stats["external"])
+            print(f"[Conv] cycle {cyc+1}: {monitor.describe()}")
+            if monitor.e_extrap[-1] is not None:
+                m.set("E_extrap", monitor.e_extrap[-1])
+            if monitor.converged():
+                print(f"[Conv] converged (tol={monitor.tol}, pt2_tol={monitor.pt2_tol}); stopping")
+                new_bits = []
+        if growth is not None and growth.adaptive:
+            print(f"[Growth] mode={growth.mode} add={len(new_bits)} {growth.describe()}")
+            m.set("w_captured", growth.captured); m.set("w_total", growth.total)
+            if growth.should_stop():
+                print(f"[Growth] captured weight below {growth.stop_weight:.1e}; stopping")
+                new_bits = []
         if not new_bits:
+            last_pass = dict(pt2=stats["pt2"], external=stats["external"], e_var=E.real,
+                             source=f"selection pass of cycle {cyc+1}, basis={basis_in}")
+            if governor is not None:
+                governor.end_cycle(cyc+1, len(basis), m)
+            m.end_cycle(cyc+1, basis=basis_in, E=E.real, added=0, pruned=0)
             break
         for b in new_bits:
             if b not in used:
                 used.add(b); basis.append(b)
+        added = len(basis) - basis_in
 
         # prune の前にもう一回だけ軽く固有計算（あなたの元コード同様）
-        E, vec = solve_ground(basis, N, diag_terms, bilinear_terms,
-                              use_nb=use_nb, use_nb_parallel=use_nb_parallel,
-                              build_blocked=build_blocked, block_size=block_size, build_procs=build_procs)
+        E, vec = _solve(cyc+1)
+        pruned = 0
+        if governor is not None:
+            prune = governor.prune_limit(cyc+1, len(basis), prune)
         if len(basis) > prune:
-            basis = prune_by_coeff(basis, vec, prune)
+            with m.phase("prune"):
+                n_before = len(basis)
+                basis = prune_by_coeff(basis, vec, prune)
+                pruned = n_before - len(basis)
+        if governor is not None:
+            governor.end_cycle(cyc+1, len(basis), m)
+        m.end_cycle(cyc+1, basis=basis_in, E=E.real, added=added, pruned=pruned)
 
     # 最終
-    E, vec = solve_ground(basis, N, diag_terms, bilinear_terms,
-                          use_nb=use_nb, use_nb_parallel=use_nb_parallel,
-                          build_blocked=build_blocked, block_size=block_size, build_procs=build_procs)
+    E, vec = _solve("final")
+    if final_stats is not None:
+        if last_pass is not None:
+            final_stats.update(last_pass)
+        else:
+            st = {}
+            _select(E, vec, 0, st)
+            final_stats.update(pt2=st["pt2"], external=st["external"], e_var=E.real,
+                               source=f"final basis={len(basis)}")
     return E, vec, basis
@@ -1,26 +1,25 @@
 from __future__ import annotations
 import os, sys, math, time, atexit, logging, random
+from .threads import early_env, ThreadControl, parse_phase_threads
+early_env(sys.argv[1:])      # before NumPy/SciPy load their BLAS
 import numpy as np
 from .argparsing import build_parser  
-from .utils import TeeWithTimestamp, _log_read
+from .utils import TeeWithTimestamp, _log_read, parse_bytes, available_memory, fmt_bytes
 from .config import read_namelist, read_modpara
-from .io import read_interall, read_greenone_def, read_greentwo_def
+from .io import read_interall, read_greenone_def, read_greentwo_def, interall_is_real, realify_terms, canonicalize_terms
 from .cipsi import run_cipsi_once, compute_PT2
 from .observables import expect_greenone, expect_greentwo
+from .metrics import Metrics
+from .growth import GrowthSchedule
+from .convergence import ConvergenceMonitor
 
 log = logging.getLogger("edcipsi")
 if not log.handlers:
     log.addHandler(logging.StreamHandler())
 log.setLevel(logging.INFO)
 
-def _setup_threads(threads: int | None) -> None:
-    if threads is None: return
-    for k in ("OMP_NUM_THREADS","OPENBLAS_NUM_THREADS","MKL_NUM_THREADS","NUMEXPR_NUM_THREADS"):
-        os.environ[k] = str(threads)
-    print(f"[Threads] Set OMP/MKL threads = {threads}")
-
-def _setup_outdir_and_tee():
-    outdir = os.path.join(os.getcwd(), "output")
+def _setup_outdir_and_tee(outdir: str | None = None, command: str | None = None):
+    outdir = os.path.abspath(outdir) if outdir else os.path.join(os.getcwd(), "output")
     os.makedirs(outdir, exist_ok=True)
     std_path = os.path.join(outdir, "std.out")
     f = open(std_path, "w", encoding="utf-8")
@@ -37,17 +36,77 @@ def _setup_outdir_and_tee():
         except: pass
     atexit.register(_cleanup)
     print("=== Start ED-CIPSI ===")
-    print("Command:", " ".join(sys.argv))
-    return outdir
+    print("Command:", command or " ".join(sys.argv))
+    return outdir, _cleanup
+
+def load_terms(path: str, raw: bool = False, force_complex: bool = False, cache=None):
+    """InterAll → (diag, bilinear) as the solvers take them: canonicalized (unless raw) and
+    realified (unless force_complex or complex). `cache` (daemon.HamiltonianCache) reuses the
+    result of an earlier job with the same file content and flags."""
+    def _build():
+        msgs = []
+        t0 = time.perf_counter()
+        diag_terms, bilinear_terms = read_interall(path)
+        msgs.append(f"[OK] InterAll: diag={len(diag_terms)} bilinear={len(bilinear_terms)} ({time.perf_counter()-t0:.3f}s)")
+        if not raw:
+            diag_terms, bilinear_terms, st = canonicalize_terms(diag_terms, bilinear_terms)
+            msgs.append(f"[Terms] canonical: bilinear {st['in']} -> {st['out']} (merged={st['merged']}, "
+                        f"hermitian pairs={st['pairs']}), diag {st['diag_in']} -> {st['diag_out']}")
+        if not force_complex and interall_is_real(diag_terms, bilinear_terms):
+            diag_terms, bilinear_terms = realify_terms(diag_terms, bilinear_terms)
+            msgs.append("[Real] InterAll has no imaginary parts: float64 build/matvec/eigensolver path")
+        return diag_terms, bilinear_terms, msgs
+    if cache is None:
+        diag_terms, bilinear_terms, msgs = _build()
+    else:
+        (diag_terms, bilinear_terms, msgs), hit = cache.get(("interall", bool(raw), bool(force_complex)), path, _build)
+        if hit:
+            msgs = [f"[Cache] InterAll {os.path.basename(path)}: reusing parsed terms (content hash match)"] + msgs[1:]
+    for line in msgs:
+        print(line)
+    return diag_terms, bilinear_terms
+
+def _read_def(reader, path: str, cache=None):
+    if cache is None:
+        return reader(path)
+    return cache.get((reader.__name__,), path, lambda: reader(path))[0]
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["warmup"]:
+        from .warmup import main as warmup_main
+        return warmup_main(argv[1:])
+    if argv[:1] in (["serve"], ["submit"]):
+        from . import daemon
+        return (daemon.serve_main if argv[0] == "serve" else daemon.submit_main)(argv[1:])
+    run(argv)
 
-def main():
+def run(argv, cache=None, command: str | None = None) -> dict:
+    """One edcipsi job in this process → summary dict (E0, basis, outdir, ...).
+
+    Output goes to the job's --outdir exactly as from the command line; stdout is
+    teed to its std.out for the duration of the call only. `cache` is the daemon's
+    HamiltonianCache (None: parse every input file)."""
     log.info(f"[import] cli loaded: __name__={__name__} __file__={__file__}")
     log.info("[run] cli.main() start")
     parser = build_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    try:
+        phase_threads = parse_phase_threads(args.phase_threads)
+    except ValueError as e:
+        parser.error(str(e))
+    early_env(argv)              # in-process callers of main(); no effect once BLAS is loaded
+    outdir, cleanup = _setup_outdir_and_tee(args.outdir, command)
+    try:
+        return _run(args, parser, outdir, phase_threads, cache)
+    finally:
+        cleanup(); atexit.unregister(cleanup)
 
-    _setup_threads(args.threads)
-    outdir = _setup_outdir_and_tee()
+def _run(args, parser, outdir, phase_threads, cache=None) -> dict:
+    t_start = time.perf_counter()
+    threads = ThreadControl(threads=args.threads, per_phase=phase_threads, workers=args.worker_threads)
+    threads.report()
 
     # 入力
     _log_read(args.namelist)
@@ -59,9 +118,7 @@ def main():
     print(f"[OK] ModPara: Nsite={N}, Grand={mp['CIPSIGrandCanonical']}, Seeds={mp['CIPSISeeds']}, Cycles={mp['CIPSICycles']}")
 
     interall_path = nl["InterAll"]; _log_read(interall_path)
-    t0 = time.perf_counter()
-    diag_terms, bilinear_terms = read_interall(interall_path)
-    print(f"[OK] InterAll: diag={len(diag_terms)} bilinear={len(bilinear_terms)} ({time.perf_counter()-t0:.3f}s)")
+    diag_terms, bilinear_terms = load_terms(interall_path, raw=args.raw_terms, force_complex=args.complex, cache=cache)
 
     greenone_path = nl.get("OneBodyG"); greentwo_path = nl.get("TwoBodyG")
 
@@ -78,34 +135,115 @@ def main():
 
     random.seed(rngseed); np.random.seed(rngseed & 0xFFFFFFFF)
 
+    growth = GrowthSchedule(
+        mode=(args.growth or mp["CIPSIGrowth"]),
+        target_frac=float(args.growth_frac if args.growth_frac is not None else mp["CIPSIGrowthFrac"]),
+        factor=float(args.growth_factor if args.growth_factor is not None else mp["CIPSIGrowthFactor"]),
+        stop_weight=float(args.growth_stop if args.growth_stop is not None else mp["CIPSIGrowthStop"]),
+    )
+    if growth.adaptive:
+        print(f"[Growth] adaptive mode={growth.mode} frac={growth.target_frac} factor={growth.factor} "
+              f"stop={growth.stop_weight:.1e} cap={add_per}")
+    monitor = ConvergenceMonitor(
+        tol=args.conv_tol if args.conv_tol is not None else mp["CIPSIConvTol"],
+        pt2_tol=args.conv_pt2_tol if args.conv_pt2_tol is not None else mp["CIPSIConvPT2Tol"],
+        window=max(2, args.conv_window),
+    )
+    if monitor.stopping:
+        print(f"[Conv] early stop: tol={monitor.tol} pt2_tol={monitor.pt2_tol} window={monitor.window}")
+
     # HBプリセレクション設定
     hb_pre = bool(args.hb_preselect)
-    max_abs_coeff = max((abs(t[-1]) for t in bilinear_terms), default=0.0)
+    max_abs_coeff = max((abs(t[8]) for t in bilinear_terms), default=0.0)
     if hb_pre:
         hb_gamma = float(args.hb_gamma) if args.hb_gamma is not None else math.sqrt(max(eps, 0.0)) * max_abs_coeff
-        bilinear_terms = sorted(bilinear_terms, key=lambda x: abs(x[-1]), reverse=True)
+        bilinear_terms = sorted(bilinear_terms, key=lambda x: abs(x[8]), reverse=True)
         print(f"[HB] Preselection ON: Gamma={hb_gamma:.3e}, max|alpha|={max_abs_coeff:.3e}, terms_sorted=True")
     else:
         hb_gamma = None
         print("[HB] Preselection OFF")
 
+    budget_spec = args.mem_budget or mp["CIPSIMemBudget"]
+    try:
+        mem_budget = parse_bytes(budget_spec) if budget_spec else None
+    except ValueError as e:
+        src = "--mem-budget" if args.mem_budget else "CIPSIMemBudget"
+        parser.error(f"{src}: {e} (expected e.g. 512M, 16G)")
+    if (args.engine == "auto" or args.mem_governor) and mem_budget is None:
+        avail = available_memory()
+        mem_budget = int(0.8 * avail) if avail else None
+    governor = None
+    if (budget_spec or args.mem_governor) and mem_budget:
+        from .memory import MemoryGovernor
+        from .nbkernels import NUMBA_OK
+        governor = MemoryGovernor(budget=mem_budget, numba_ok=NUMBA_OK, procs=args.build_procs,
+                                  selection="shm" if args.select_procs else "dict", min_basis=seeds)
+        print(f"[Mem] governor on: {governor.describe()}")
+    if args.engine is not None:
+        print(f"[Engine] {args.engine}" + (f" mem_budget={fmt_bytes(mem_budget)}" if mem_budget else ""))
+
+    tuner = None
+    if args.autotune and not args.full_ed:
+        if args.engine == "ooc":
+            print("[Autotune] skipped: --engine ooc")
+        else:
+            from .autotune import AutoTuner
+            tuner = AutoTuner(N, diag_terms, bilinear_terms, engine=args.engine, nb_build=not args.numpy_build,
+                              csr_half=args.csr_half, block_size=args.block_size, build_procs=args.build_procs,
+                              tune_threads=args.threads is None and not phase_threads, mem_budget=mem_budget,
+                              refresh=args.autotune_refresh)
+            print(f"[Autotune] on: results per machine/problem size in {tuner.path}")
+
+    metrics = Metrics(os.path.join(outdir, "metrics.jsonl"), enabled=not args.no_metrics, threads=threads)
+    if metrics.enabled:
+        print(f"[Metrics] per-cycle phase timings -> {metrics.path}")
+
     # 実行
-    E, vec, basis = run_cipsi_once(
-        N, diag_terms, bilinear_terms,
-        grand_canonical=gc, seeds=seeds, cycles=cycles, add_per_cycle=add_per, prune=prune_max, eps=eps,
-        hb_gamma=hb_gamma, hb_sorted=hb_pre, max_abs_coeff=max_abs_coeff,
-        threads=args.threads, accel_matvec=args.accel_matvec, nb_parallel=args.nb_parallel,
-        build_blocked=args.build_blocked, block_size=args.block_size, build_procs=args.build_procs,
-        seed_mode=seed_mode, seed_pool=seed_pool, sector_Sz=mp.get("CIPSISectorSz"), rng=random
-    )
+    if args.full_ed:
+        from .fulled import run_full_ed, sector_expect_greenone, sector_expect_greentwo
+        E, vec, basis = run_full_ed(N, diag_terms, bilinear_terms, grand_canonical=gc,
+                                    sector_Sz=mp.get("CIPSISectorSz"), metrics=metrics)
+    else:
+        final = {}
+        E, vec, basis = run_cipsi_once(
+            N, diag_terms, bilinear_terms,
+            grand_canonical=gc, seeds=seeds, cycles=cycles, add_per_cycle=add_per, prune=prune_max, eps=eps,
+            hb_gamma=hb_gamma, hb_sorted=hb_pre, max_abs_coeff=max_abs_coeff,
+            threads=args.threads, accel_matvec=args.accel_matvec, nb_parallel=args.nb_parallel,
+            build_blocked=args.build_blocked, block_size=args.block_size, build_procs=args.build_procs,
+            seed_mode=seed_mode, seed_pool=seed_pool, sector_Sz=mp.get("CIPSISectorSz"), rng=random,
+            select_procs=args.select_procs, metrics=metrics, growth=growth,
+            engine=args.engine, mem_budget=mem_budget, ooc_dir=args.ooc_dir,
+            par_spmv=not args.scipy_spmv, csr_half=args.csr_half, nb_build=not args.numpy_build,
+            monitor=monitor, level_shift=args.level_shift,
+            governor=governor, amp_cache=not args.no_amp_cache,
+            autotune=tuner, lookup=args.lookup,
+            final_stats=final if args.pt2 and not args.pt2_recompute else None,
+        )
 
     print(f"[Final] Basis={len(basis)}, E0={E:.12f}  E0/site={(E.real)/N:.12f}")
-    if args.pt2:
-        M_final = {}  # 簡潔に：必要なら cipsi.connected_amplitudes を呼んで PT2 を再計算
-        from .cipsi import connected_amplitudes
-        M_final = connected_amplitudes(basis, vec, bilinear_terms, hb_gamma=hb_gamma, max_abs_coeff=max_abs_coeff, terms_sorted=hb_pre)
-        Ept2_final, npt2_final = compute_PT2(E, M_final, diag_terms, level_shift=args.level_shift)
-        print(f"[Final PT2] terms={npt2_final}  E_PT2={Ept2_final:+.6e}  E_var+PT2={E.real+Ept2_final:.12f}  per-site={(E.real+Ept2_final)/N:.12f}")
+    result = {"N": N, "basis": len(basis), "E0": float(E.real)}
+    if args.pt2 and args.full_ed:
+        print("[Final PT2] skipped: --full-ed diagonalizes the whole sector (E_PT2 = 0)")
+    elif args.pt2:
+        if args.pt2_recompute:
+            from .cipsi import connected_amplitudes
+            with metrics.phase("pt2"):
+                M_final = connected_amplitudes(basis, vec, bilinear_terms, hb_gamma=hb_gamma, max_abs_coeff=max_abs_coeff, terms_sorted=hb_pre)
+                Ept2_final, npt2_final = compute_PT2(E, M_final, diag_terms, level_shift=args.level_shift, exclude=set(basis))
+            Evar_pt2, src = E.real, f"final basis={len(basis)}, regenerated"
+        else:
+            # PT2 of the final basis: its selection pass, or one amplitude pass after the last additions
+            Ept2_final, npt2_final = final["pt2"], final["external"]
+            Evar_pt2, src = final["e_var"], final["source"]
+        print(f"[Final PT2] terms={npt2_final}  E_PT2={Ept2_final:+.6e}  E_var+PT2={Evar_pt2+Ept2_final:.12f}  per-site={(Evar_pt2+Ept2_final)/N:.12f}  ({src})")
+        result["E_var+PT2"] = float(Evar_pt2 + Ept2_final)
+
+    extrap = monitor.summary()
+    if extrap:
+        print(f"[Final Extrap] {extrap}")
+        metrics.set("E_extrap", monitor.extrapolate()[0])
+        result["E_extrap"] = float(monitor.extrapolate()[0])
 
     # 出力
     energy_path = os.path.join(outdir, "energy.out")
@@ -117,8 +255,10 @@ def main():
         fE.write(f"E0 {E.real:.16e} {E.imag:.3e}\n")
 
     if greenone_path is not None:
-        ops1 = read_greenone_def(greenone_path)
-        vals1 = expect_greenone(basis, vec, ops1)
+        ops1 = _read_def(read_greenone_def, greenone_path, cache)
+        with metrics.phase("observables"):
+            vals1 = (sector_expect_greenone(basis, vec, N, ops1) if args.full_ed else
+                     expect_greenone(basis, vec, ops1))
         with open(green1_path, "w", encoding="utf-8") as f1:
             for ((i,si,j,sj), v) in zip(ops1, vals1):
                 f1.write(f"{i:5d}{si:5d}{j:5d}{sj:5d} {v.real: .10f} {v.imag: .10f}\n")
@@ -126,24 +266,48 @@ def main():
         open(green1_path, "w", encoding="utf-8").close()
 
     if greentwo_path is not None:
-        ops = read_greentwo_def(greentwo_path)
-        vals = expect_greentwo(basis, vec, N, ops)
+        ops = _read_def(read_greentwo_def, greentwo_path, cache)
+        with metrics.phase("observables"):
+            vals = (sector_expect_greentwo(basis, vec, N, ops) if args.full_ed else
+                    expect_greentwo(basis, vec, N, ops))
         with open(green2_path, "w", encoding="utf-8") as fG:
             for ((i,si,j,sj,k,sk,l,sl), v) in zip(ops, vals):
                 fG.write(f"{i:5d}{si:5d}{j:5d}{sj:5d}{k:5d}{sk:5d}{l:5d}{sl:5d} {v.real: .10f} {v.imag: .10f}\n")
     else:
         open(green2_path, "w", encoding="utf-8").close()
 
+    if args.dynamics:
+        from .dynamics import run_dynamics, OPS
+        ops = tuple(o.strip() for o in args.dynamics.split(",") if o.strip())
+        bad = [o for o in ops if o not in OPS]
+        if bad:
+            parser.error(f"--dynamics: unknown operator(s) {bad}; choose from {','.join(OPS)}")
+        dyn_engine = args.engine or ("matfree" if args.accel_matvec else "blocked" if args.build_blocked else "csr")
+        with metrics.phase("dynamics"):
+            run_dynamics(E, basis, vec, N, diag_terms, bilinear_terms, outdir, ops=ops, lattice=args.dyn_lattice,
+                         momenta=args.dyn_q, omega=args.dyn_omega, eta=args.dyn_eta, n_iter=args.dyn_iter,
+                         expand=args.dyn_expand, engine=dyn_engine, metrics=metrics,
+                         operator_kwargs=dict(use_nb_parallel=args.nb_parallel, block_size=args.block_size,
+                                              build_procs=args.build_procs, ooc_dir=args.ooc_dir,
+                                              par_spmv=not args.scipy_spmv, csr_half=args.csr_half,
+                                              nb_build=not args.numpy_build,
+                                              mem_budget=mem_budget))
+
     if args.outfile:
         with open(args.outfile, "w", encoding="utf-8") as f:
             f.write(f"# N={N}\n# BasisSize={len(basis)}\n")
             f.write(f"E0 {E.real:.16e} {E.imag:.3e}\n")
 
+    metrics.end_cycle("final", basis=len(basis), E=E.real)
+    metrics.close()
+
     done_msg = f"[DONE] Wrote energy to {energy_path}"
     if greentwo_path is not None: done_msg += f" and greentwo to {green2_path}"
     if greenone_path is not None: done_msg += f" and greenone to {green1_path}"
     print(done_msg)
     log.info("[run] cli.main() end")
+    result.update(outdir=outdir, energy=energy_path, seconds=round(time.perf_counter() - t_start, 3))
+    return result
 
 if __name__ == "__main__":
     main()
@@ -36,6 +36,13 @@ def read_modpara(path: str) -> Dict[str, float | int | bool | str]:
         "CIPSIRandomSeed": int(mp.get("CIPSIRandomSeed", "1337")),
         "CIPSISeedMode": mp.get("CIPSISeedMode", "random").lower(),
         "CIPSISeedPool": int(mp.get("CIPSISeedPool", "0")),
+        "CIPSIGrowth": mp.get("CIPSIGrowth", "fixed").lower(),
+        "CIPSIGrowthFrac": float(mp.get("CIPSIGrowthFrac", "0.9")),
+        "CIPSIGrowthFactor": float(mp.get("CIPSIGrowthFactor", "1.5")),
+        "CIPSIGrowthStop": float(mp.get("CIPSIGrowthStop", "1e-7")),
+        "CIPSIConvTol": float(mp["CIPSIConvTol"]) if "CIPSIConvTol" in mp else None,
+        "CIPSIConvPT2Tol": float(mp["CIPSIConvPT2Tol"]) if "CIPSIConvPT2Tol" in mp else None,
+        "CIPSIMemBudget": mp.get("CIPSIMemBudget", None),
     }
     if out["CIPSISectorSz"] is not None:
         try:
@@ -0,0 +1,82 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import numpy as np
+
+@dataclass
+class ConvergenceMonitor:
+    """E_var / E_PT2 history over CIPSI cycles with the usual linear extrapolation.
+
+    E_var is fitted as a + b*E_PT2 over the last `window` cycles; a is the
+    extrapolated (E_PT2 → 0) energy. The run is converged once the
+    extrapolated energy moved by less than `tol`, or E_PT2 moved by less than
+    `pt2_tol`, between consecutive cycles (None disables a criterion).
+    Cycles whose E_PT2 is not finite or exceeds |E_var| (a near-degenerate
+    denominator E - H_aa blowing up one term) are left out of the fit.
+    """
+    tol: Optional[float] = None
+    pt2_tol: Optional[float] = None
+    window: int = 4
+    min_cycles: int = 2
+    cycles: List[int] = field(default_factory=list)
+    basis: List[int] = field(default_factory=list)
+    e_var: List[float] = field(default_factory=list)
+    e_pt2: List[float] = field(default_factory=list)
+    e_extrap: List[Optional[float]] = field(default_factory=list)
+    pt2_rest: List[Optional[float]] = field(default_factory=list)   # PT2 left in the unselected candidates
+    n_ext: List[int] = field(default_factory=list)
+
+    @property
+    def stopping(self) -> bool:
+        return self.tol is not None or self.pt2_tol is not None
+
+    def add(self, cycle, basis_size: int, e_var: float, e_pt2: float,
+            pt2_rest: Optional[float] = None, n_ext: int = 0) -> None:
+        self.cycles.append(cycle); self.basis.append(int(basis_size))
+        self.e_var.append(float(e_var)); self.e_pt2.append(float(e_pt2))
+        self.pt2_rest.append(pt2_rest); self.n_ext.append(int(n_ext))
+        if not self.sane(len(self.cycles) - 1):
+            print(f"[Conv] warning: cycle {cycle}: E_PT2={float(e_pt2):+.6e} exceeds |E_var|={abs(float(e_var)):.6e} "
+                  f"(near-degenerate denominator); left out of the extrapolation")
+        fit = self.extrapolate()
+        self.e_extrap.append(fit[0] if fit else None)
+
+    def sane(self, k: int) -> bool:
+        """Cycle k usable for the fit: finite E_PT2 no larger in magnitude than E_var."""
+        e2 = self.e_pt2[k]
+        return bool(np.isfinite(e2)) and abs(e2) <= abs(self.e_var[k])
+
+    def extrapolate(self) -> Optional[Tuple[float, float, int]]:
+        """→ (E_extrap, slope, points) from the sane cycles of the last `window`, or None with < 2 distinct points."""
+        ks = [k for k in range(max(0, len(self.cycles) - self.window), len(self.cycles)) if self.sane(k)]
+        x = np.array([self.e_pt2[k] for k in ks]); y = np.array([self.e_var[k] for k in ks])
+        if x.size < 2 or np.ptp(x) <= 1e-14 * max(1.0, float(np.abs(x).max())):
+            return None
+        b, a = np.polyfit(x, y, 1)
+        return float(a), float(b), int(x.size)
+
+    def converged(self) -> bool:
+        if not self.stopping or len(self.cycles) < self.min_cycles:
+            return False
+        if self.pt2_tol is not None and abs(self.e_pt2[-1] - self.e_pt2[-2]) < self.pt2_tol:
+            return True
+        ex = self.e_extrap[-2:]
+        if self.tol is not None and len(ex) == 2 and None not in ex and abs(ex[1] - ex[0]) < self.tol:
+            return True
+        return False
+
+    def describe(self) -> str:
+        s = (f"E_var={self.e_var[-1]:.12f} E_PT2={self.e_pt2[-1]:+.6e} "
+             f"E_var+PT2={self.e_var[-1] + self.e_pt2[-1]:.12f}")
+        if self.pt2_rest[-1] is not None:
+            s += f" PT2_rest={self.pt2_rest[-1]:+.6e}"
+        if self.e_extrap[-1] is not None:
+            s += f" E_extrap={self.e_extrap[-1]:.12f}"
+        return s
+
+    def summary(self) -> Optional[str]:
+        fit = self.extrapolate()
+        if fit is None:
+            return None
+        a, b, n = fit
+        return f"E_extrap={a:.12f} (linear fit of E_var vs E_PT2 over {n} cycles, slope={b:.4f})"
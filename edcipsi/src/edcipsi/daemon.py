@@ -0,0 +1,322 @@
+"""edcipsi serve / submit: a long-lived warm worker for streams of small jobs.
+
+Every `edcipsi` process pays for interpreter startup, imports, loading the Numba
+cache and parsing InterAll. `edcipsi serve` pays that once: it warms the kernels,
+then runs jobs one after another in-process (cli.run, same outputs as the command
+line) and keeps the parsed, canonicalized terms and Green-function definitions in
+an LRU cache keyed by the SHA-256 of the file content, so a sweep over seeds,
+sectors or flags on one lattice parses it once.
+
+Jobs come in through a local Unix socket (one JSON object per line, one JSON
+reply per job on the same connection) and/or a spool directory (SPOOL/incoming/
+*.json are claimed by an atomic rename, results go to SPOOL/done/<id>.json;
+several daemons can share one spool). A job is
+    {"id": "j1", "cwd": "/path/to/run", "argv": ["namelist.def", "--outdir", "o1", ...]}
+and {"cmd": "ping" | "stats" | "shutdown"} controls the daemon.
+
+    edcipsi serve --socket /tmp/edcipsi.sock [--spool DIR] [--threads 4]
+    edcipsi submit --socket /tmp/edcipsi.sock -- namelist.def --seed 3 --outdir out3
+    edcipsi-batch scan.txt --daemon /tmp/edcipsi.sock
+"""
+from __future__ import annotations
+import argparse, hashlib, io, json, os, socket, sys, time, traceback, uuid
+from collections import OrderedDict
+from contextlib import contextmanager, redirect_stderr
+from typing import Callable, Dict, Optional
+
+class HamiltonianCache:
+    """LRU of parsed input files keyed by (kind, sha256(content)); values are shared, not copied."""
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max(1, int(max_entries))
+        self._d: "OrderedDict[tuple, object]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, kind: tuple, path: str, build: Callable[[], object]):
+        """→ (value, hit). The file is hashed on every call, parsed only on a miss."""
+        with open(path, "rb") as f:
+            key = (kind, hashlib.sha256(f.read()).hexdigest())
+        if key in self._d:
+            self._d.move_to_end(key); self.hits += 1
+            return self._d[key], True
+        val = build(); self.misses += 1
+        self._d[key] = val
+        while len(self._d) > self.max_entries:
+            self._d.popitem(last=False)
+        return val, False
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._d), "hits": self.hits, "misses": self.misses}
+
+@contextmanager
+def _thread_state():
+    """Give every job the daemon's BLAS/Numba thread counts back (--threads of one job must not leak)."""
+    from .threads import _threadpoolctl
+    tp = _threadpoolctl()
+    lim = tp.threadpool_limits(limits=None) if tp is not None else None
+    nb = sys.modules.get("numba")
+    prev = nb.get_num_threads() if nb is not None else None
+    try:
+        yield
+    finally:
+        if lim is not None:
+            lim.restore_original_limits()
+        if prev is not None:
+            nb.set_num_threads(prev)
+        elif "numba" in sys.modules:            # loaded by this job: back to Numba's default
+            nb = sys.modules["numba"]
+            nb.set_num_threads(nb.config.NUMBA_NUM_THREADS)
+
+def run_job(job: dict, cache: HamiltonianCache) -> dict:
+    """Run one job in this process → result dict (status ok/error, E0, basis, outdir, ...)."""
+    from . import cli
+    jid = str(job.get("id") or uuid.uuid4().hex[:12])
+    argv = [str(a) for a in job.get("argv") or []]
+    out = {"id": jid, "status": "ok"}
+    prev_cwd = os.getcwd(); err = io.StringIO()
+    t0 = time.perf_counter()
+    try:
+        os.chdir(job.get("cwd") or prev_cwd)
+        with _thread_state(), redirect_stderr(err):
+            out.update(cli.run(argv, cache=cache, command="edcipsi serve job " + jid + ": " + " ".join(argv)))
+    except SystemExit as e:                 # argparse
+        msg = err.getvalue().strip().splitlines()
+        out.update(status="error", error=msg[-1] if msg else f"exit {e.code}")
+    except Exception as e:
+        out.update(status="error", error=f"{type(e).__name__}: {e}")
+        traceback.print_exc()
+    finally:
+        os.chdir(prev_cwd)
+    out["wall"] = round(time.perf_counter() - t0, 3)
+    return out
+
+class Daemon:
+    def __init__(self, socket_path: Optional[str], spool: Optional[str], cache_entries: int = 16,
+                 poll: float = 0.5, max_jobs: int = 0):
+        self.socket_path = os.path.abspath(socket_path) if socket_path else None
+        self.spool = os.path.abspath(spool) if spool else None
+        self.cache = HamiltonianCache(cache_entries)
+        self.poll = poll
+        self.max_jobs = max_jobs
+        self.jobs = self.failed = 0
+        self.t_start = time.time()
+        self.stop = False
+        self._srv: Optional[socket.socket] = None
+
+    # ---- jobs ------------------------------------------------------------------
+    def _job(self, job: dict) -> dict:
+        res = run_job(job, self.cache)
+        self.jobs += 1; self.failed += res["status"] != "ok"
+        tail = f"E0={res['E0']:.12f} basis={res['basis']}" if res["status"] == "ok" else res["error"]
+        print(f"[Daemon] job {res['id']} {res['status']} ({res['wall']:.2f}s) {tail}", flush=True)
+        if self.max_jobs and self.jobs >= self.max_jobs:
+            self.stop = True
+        return res
+
+    def _control(self, msg: dict) -> dict:
+        cmd = msg.get("cmd")
+        if cmd == "shutdown":
+            self.stop = True
+        if cmd in ("ping", "stats", "shutdown"):
+            return {"status": "ok", "cmd": cmd, "pid": os.getpid(), "jobs": self.jobs, "failed": self.failed,
+                    "uptime": round(time.time() - self.t_start, 1), "cache": self.cache.stats()}
+        return {"status": "error", "error": f"unknown cmd {cmd!r}"}
+
+    def handle(self, msg: dict) -> dict:
+        return self._control(msg) if "cmd" in msg else self._job(msg)
+
+    # ---- Unix socket -----------------------------------------------------------
+    def _open_socket(self):
+        path = self.socket_path
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                raise SystemExit(f"[Daemon] {path}: another daemon is listening")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path)         # stale socket of a dead daemon
+            finally:
+                probe.close()
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(path); os.chmod(path, 0o600)
+        s.listen(16); s.settimeout(self.poll)
+        self._srv = s
+
+    def _serve_connection(self, conn: socket.socket):
+        conn.settimeout(None)
+        with conn, conn.makefile("rb") as rf, conn.makefile("wb") as wf:
+            for line in rf:
+                if not line.strip():
+                    continue
+                try:
+                    res = self.handle(json.loads(line))
+                except (ValueError, TypeError, AttributeError) as e:
+                    res = {"status": "error", "error": f"bad request: {e}"}
+                try:
+                    wf.write((json.dumps(res) + "\n").encode()); wf.flush()
+                except OSError:
+                    return          # client went away; the job's files are written anyway
+                if self.stop:
+                    return
+
+    def _accept(self):
+        try:
+            conn, _ = self._srv.accept()
+        except socket.timeout:
+            return
+        self._serve_connection(conn)
+
+    # ---- spool directory -------------------------------------------------------
+    def _spool_once(self) -> bool:
+        inc = os.path.join(self.spool, "incoming")
+        for name in sorted(n for n in os.listdir(inc) if n.endswith(".json")):
+            claimed = os.path.join(self.spool, "running", f"{name[:-5]}.{os.getpid()}.json")
+            try:
+                os.rename(os.path.join(inc, name), claimed)
+            except FileNotFoundError:
+                continue            # taken by another daemon
+            try:
+                with open(claimed, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+                job.setdefault("id", name[:-5])
+                res = self.handle(job)
+            except ValueError as e:
+                res = {"id": name[:-5], "status": "error", "error": f"bad job file: {e}"}
+            _write_json(os.path.join(self.spool, "done", f"{res.get('id', name[:-5])}.json"), res)
+            os.unlink(claimed)
+            return True
+        return False
+
+    # ---- main loop -------------------------------------------------------------
+    def serve(self):
+        if self.spool:
+            for d in ("incoming", "running", "done"):
+                os.makedirs(os.path.join(self.spool, d), exist_ok=True)
+        if self.socket_path:
+            self._open_socket()
+        where = " ".join(f"{k}={v}" for k, v in (("socket", self.socket_path), ("spool", self.spool)) if v)
+        print(f"[Daemon] pid={os.getpid()} listening on {where}", flush=True)
+        try:
+            while not self.stop:
+                if self._srv is not None:
+                    self._accept()
+                if self.spool and not self.stop and not self._spool_once() and self._srv is None:
+                    time.sleep(self.poll)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self._srv is not None:
+                self._srv.close()
+                try: os.unlink(self.socket_path)
+                except OSError: pass
+        st = self.cache.stats()
+        print(f"[Daemon] stopped after {self.jobs} job(s) ({self.failed} failed); "
+              f"cache entries={st['entries']} hits={st['hits']} misses={st['misses']}", flush=True)
+
+def _write_json(path: str, obj: dict):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+# ---- client ----------------------------------------------------------------------
+def submit_socket(path: str, msg: dict, timeout: Optional[float] = None) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall((json.dumps(msg) + "\n").encode())
+        with s.makefile("rb") as rf:
+            line = rf.readline()
+    if not line:
+        return {"id": msg.get("id"), "status": "error", "error": "daemon closed the connection"}
+    return json.loads(line)
+
+async def submit_socket_async(path: str, msg: dict) -> dict:
+    import asyncio
+    reader, writer = await asyncio.open_unix_connection(path, limit=1 << 20)
+    try:
+        writer.write((json.dumps(msg) + "\n").encode()); await writer.drain()
+        line = await reader.readline()
+    finally:
+        writer.close()
+    if not line:
+        return {"id": msg.get("id"), "status": "error", "error": "daemon closed the connection"}
+    return json.loads(line)
+
+def submit_spool(spool: str, msg: dict, wait: bool = True, timeout: Optional[float] = None,
+                 poll: float = 0.2) -> Optional[dict]:
+    jid = msg.setdefault("id", uuid.uuid4().hex[:12])
+    inc = os.path.join(spool, "incoming")
+    os.makedirs(inc, exist_ok=True)
+    _write_json(os.path.join(inc, f"{jid}.json"), msg)
+    if not wait:
+        return None
+    done = os.path.join(spool, "done", f"{jid}.json")
+    t0 = time.time()
+    while not os.path.exists(done):
+        if timeout is not None and time.time() - t0 > timeout:
+            return {"id": jid, "status": "error", "error": f"no result after {timeout:g}s (still queued?)"}
+        time.sleep(poll)
+    with open(done, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ---- entry points ----------------------------------------------------------------
+def serve_main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="edcipsi serve",
+                                 description="Warm worker: run edcipsi jobs from a Unix socket and/or a spool directory.")
+    ap.add_argument("--socket", default=None, help="Unix socket path to listen on")
+    ap.add_argument("--spool", default=None, help="spool directory (incoming/, running/, done/)")
+    ap.add_argument("--threads", type=int, default=None, help="BLAS/Numba threads of the daemon (jobs may lower it)")
+    ap.add_argument("--cache-entries", type=int, default=16, help="parsed input files kept (LRU)")
+    ap.add_argument("--poll", type=float, default=0.5, help="seconds between spool scans")
+    ap.add_argument("--max-jobs", type=int, default=0, help="exit after this many jobs (0 = run until shutdown)")
+    ap.add_argument("--no-warmup", action="store_true", help="do not precompile/load the Numba kernels at start")
+    args = ap.parse_args(argv)
+    if not args.socket and not args.spool:
+        ap.error("give --socket and/or --spool")
+    from .threads import ThreadControl
+    ThreadControl(threads=args.threads).report()
+    if not args.no_warmup:
+        from .warmup import warmup
+        t = warmup(verbose=False)
+        print(f"[Daemon] kernels warm ({t:.2f}s)", flush=True)
+    Daemon(args.socket, args.spool, cache_entries=args.cache_entries, poll=args.poll,
+           max_jobs=args.max_jobs).serve()
+    return 0
+
+def submit_main(argv=None) -> int:
+    argv = list(argv or [])
+    job_argv = []
+    if "--" in argv:
+        i = argv.index("--"); argv, job_argv = argv[:i], argv[i+1:]
+    ap = argparse.ArgumentParser(prog="edcipsi submit", description="Send one job (or a control command) to edcipsi serve.",
+                                 epilog="Arguments after '--' are the job's edcipsi command line.")
+    ap.add_argument("--socket", default=None)
+    ap.add_argument("--spool", default=None)
+    ap.add_argument("--id", default=None, help="job id (default: random)")
+    ap.add_argument("--cmd", choices=["ping", "stats", "shutdown"], default=None)
+    ap.add_argument("--no-wait", action="store_true", help="spool: queue the job and return")
+    ap.add_argument("--timeout", type=float, default=None, help="seconds to wait for the result")
+    args = ap.parse_args(argv)
+    if bool(args.socket) == bool(args.spool):
+        ap.error("give exactly one of --socket / --spool")
+    if args.cmd:
+        if not args.socket:
+            ap.error("--cmd needs --socket")
+        msg = {"cmd": args.cmd}
+    elif job_argv:
+        msg = {"argv": job_argv, "cwd": os.getcwd()}
+        if args.id: msg["id"] = args.id
+    else:
+        ap.error("nothing to submit: give --cmd or a job after '--'")
+    if args.socket:
+        try:
+            res = submit_socket(args.socket, msg, timeout=args.timeout)
+        except OSError as e:
+            res = {"id": msg.get("id"), "status": "error", "error": f"cannot reach daemon at {args.socket}: {e}"}
+    else:
+        res = submit_spool(args.spool, msg, wait=not args.no_wait, timeout=args.timeout)
+        if res is None:
+            print(json.dumps({"id": msg["id"], "status": "queued"}))
+            return 0
+    print(json.dumps(res))
+    return 0 if res.get("status") == "ok" else 1
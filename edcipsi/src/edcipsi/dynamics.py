@@ -0,0 +1,177 @@
+"""Dynamical spin structure factors S^a(q,ω) by continued-fraction Lanczos.
+
+|φ> = S^a_q |ψ0> is formed on the determinants the CIPSI ground state reaches,
+that space is expanded once (or `expand` times) by the determinants H connects
+to, and a Lanczos recursion started from |φ> on it gives
+
+    G(z) = <φ|φ> / (z - a0 - b1^2 / (z - a1 - b2^2 / (...)))
+    S^a(q,ω) = -Im G(ω + E0 + iη) / π
+
+with S^a_q = N^{-1/2} Σ_j exp(-i q·r_j) S^a_j, a ∈ {z, +, -}. Momenta are
+integers (m1, m2): q·r_j = 2π (m1 x/Lx + m2 y/Ly) for site j = x + Lx*y, the
+numbering edcipsi-gen uses. The expanded space and its H are built once per
+operator and shared by all q.
+"""
+from __future__ import annotations
+import os, time
+from typing import List, Tuple
+import numpy as np
+from .nbkernels import pack_terms_arrays
+from .pselect import generate_slice
+from .metrics import NULL_METRICS
+
+OPS = ("z", "+", "-")
+
+def parse_lattice(spec, N: int) -> Tuple[int, int]:
+    """'LxxLy' (e.g. '4x4') → (Lx, Ly); None → an N-site chain."""
+    if not spec:
+        return N, 1
+    Lx, Ly = (int(t) for t in str(spec).lower().split("x"))
+    if Lx * Ly != N:
+        raise ValueError(f"--dyn-lattice {spec}: Lx*Ly={Lx*Ly} != Nsite={N}")
+    return Lx, Ly
+
+def parse_momenta(spec, Lx: int, Ly: int) -> List[Tuple[int, int]]:
+    """'all' → every (m1, m2) of the cluster; 'm1,m2;m1,m2;...' → that list."""
+    if spec is None or str(spec).strip().lower() == "all":
+        return [(m1, m2) for m2 in range(Ly) for m1 in range(Lx)]
+    qs = []
+    for tok in str(spec).replace(" ", "").split(";"):
+        if not tok: continue
+        m = [int(t) for t in tok.split(",")]
+        qs.append((m[0] % Lx, (m[1] if len(m) > 1 else 0) % Ly))
+    return qs
+
+def site_phases(Lx: int, Ly: int, q: Tuple[int, int]) -> np.ndarray:
+    """exp(-i q·r_j) / sqrt(N) for j = x + Lx*y."""
+    x = np.tile(np.arange(Lx), Ly); y = np.repeat(np.arange(Ly), Lx)
+    return np.exp(-2j * np.pi * (q[0] * x / Lx + q[1] * y / Ly)) / np.sqrt(Lx * Ly)
+
+def spin_targets(bits: np.ndarray, op: str, N: int) -> np.ndarray:
+    """Sorted determinants reached by S^a_j from `bits` for any site j (q-independent)."""
+    if op == "z":
+        return np.unique(bits)
+    out = []
+    for j in range(N):
+        up = (bits >> j) & 1
+        flip = (up == 0) if op == "+" else (up == 1)
+        out.append(bits[flip] ^ (np.int64(1) << np.int64(j)))
+    return np.unique(np.concatenate(out)) if out else np.empty(0, np.int64)
+
+def apply_spin_q(bits: np.ndarray, vec: np.ndarray, op: str, phases: np.ndarray, space: np.ndarray) -> np.ndarray:
+    """S^a_q |ψ> as a vector on the sorted determinant array `space`."""
+    out = np.zeros(space.size, dtype=np.complex128)
+    vec = np.asarray(vec, dtype=np.complex128)
+    if op == "z":
+        amp = np.zeros(bits.size, dtype=np.complex128)
+        for j, ph in enumerate(phases):
+            amp += ph * (((bits >> j) & 1) - 0.5)    # bit set = ↑ (spin 0)
+        np.add.at(out, np.searchsorted(space, bits), amp * vec)
+        return out
+    for j, ph in enumerate(phases):
+        up = (bits >> j) & 1
+        ok = (up == 0) if op == "+" else (up == 1)
+        if not ok.any(): continue
+        tgt = bits[ok] ^ (np.int64(1) << np.int64(j))
+        np.add.at(out, np.searchsorted(space, tgt), ph * vec[ok])
+    return out
+
+def expand_space(bits: np.ndarray, packed, rounds: int = 1) -> np.ndarray:
+    """Add the determinants H connects to `bits`, `rounds` times → sorted int64 array."""
+    bits = np.unique(np.asarray(bits, dtype=np.int64))
+    for _ in range(max(0, rounds)):
+        u, _, _ = generate_slice(bits, np.ones(bits.size), packed)
+        bits = np.union1d(bits, u)
+    return bits
+
+def lanczos_coefficients(Hop, v0: np.ndarray, n_iter: int = 200, tol: float = 1e-8):
+    """Lanczos from v0 (no reorthogonalization) → (a[0..n-1], b[1..n-1], <v0|v0>)."""
+    norm2 = float(np.vdot(v0, v0).real)
+    a: List[float] = []; b: List[float] = []
+    if norm2 <= 1e-14:           # S^a_q|ψ0> vanishes (selection rule / symmetry)
+        return np.zeros(0), np.zeros(0), 0.0
+    v = v0 / np.sqrt(norm2); v_prev = np.zeros_like(v); beta = 0.0
+    for n in range(max(1, min(n_iter, v.size))):
+        w = np.asarray(Hop @ v).reshape(-1)
+        alpha = float(np.vdot(v, w).real)
+        a.append(alpha)
+        w = w - alpha * v - beta * v_prev
+        beta = float(np.linalg.norm(w))
+        if beta < tol * max(1.0, abs(alpha)) or n == min(n_iter, v.size) - 1:   # invariant subspace found
+            break
+        b.append(beta)
+        v_prev, v = v, w / beta
+    return np.array(a), np.array(b), norm2
+
+def continued_fraction(a: np.ndarray, b: np.ndarray, norm2: float, z: np.ndarray) -> np.ndarray:
+    """G(z) = norm2 / (z - a0 - b1^2/(z - a1 - ...)), evaluated bottom-up."""
+    z = np.asarray(z, dtype=np.complex128)
+    if a.size == 0:
+        return np.zeros_like(z)
+    g = z - a[-1]
+    for k in range(a.size - 2, -1, -1):
+        g = z - a[k] - b[k] ** 2 / g
+    return norm2 / g
+
+def tridiag_levels(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    T = np.diag(a) + np.diag(b, 1) + np.diag(b, -1)
+    return np.linalg.eigvalsh(T) if a.size else np.zeros(0)
+
+def run_dynamics(E0, basis, vec, N, diag_terms, bilinear_terms, outdir, ops=("z",), lattice=None,
+                 momenta="all", omega=None, eta=0.05, n_iter=200, expand=1, engine="csr",
+                 operator_kwargs=None, metrics=None):
+    """S^a(q,ω) for every op in `ops` and q in `momenta` → outdir/sqw_<op>.dat (+ _cf.dat)."""
+    from .solver import hamiltonian_operator, resolve_engine
+    m = metrics or NULL_METRICS
+    kw = dict(operator_kwargs or {})
+    Lx, Ly = parse_lattice(lattice, N)
+    qs = parse_momenta(momenta, Lx, Ly)
+    bits = np.asarray(basis, dtype=np.int64)
+    vec = np.asarray(vec)
+    packed = pack_terms_arrays(diag_terms, bilinear_terms)
+    E0 = float(np.real(E0))
+    results = {}
+    for op in ops:
+        t0 = time.perf_counter()
+        space = expand_space(spin_targets(bits, op, N), packed, expand)
+        eng = resolve_engine(engine, space, diag_terms, bilinear_terms, kw.get("mem_budget"),
+                             kw.get("build_procs", 0), m) if engine == "auto" else engine
+        print(f"[Dyn] S^{op}: basis {bits.size} -> {space.size} after {expand} expansion(s), engine={eng}")
+        Hop, close = hamiltonian_operator(space, N, diag_terms, bilinear_terms, eng, metrics=m,
+                                          **{k: v for k, v in kw.items() if k != "mem_budget"})
+        try:
+            for q in qs:
+                v0 = apply_spin_q(bits, vec, op, site_phases(Lx, Ly, q), space)
+                a, b, norm2 = lanczos_coefficients(Hop, v0, n_iter)
+                results[(op, q)] = (a, b, norm2)
+                print(f"[Dyn] S^{op} q=({q[0]},{q[1]}): <S(q)>={norm2:.10f} lanczos={a.size}")
+        finally:
+            close()
+        print(f"[Dyn] S^{op} done in {time.perf_counter()-t0:.2f}s")
+
+    if omega is None:
+        top = max((tridiag_levels(a, b).max() for (a, b, _) in results.values() if a.size), default=E0 + 1.0)
+        wmax = max(top - E0, 0.0) + 5 * eta
+        omega = (0.0, wmax, max(401, int(2 * wmax / eta) + 1))     # ≥ 2 points per η
+    wmin, wmax, nw = float(omega[0]), float(omega[1]), int(omega[2])
+    w = np.linspace(wmin, wmax, nw)
+    paths = []
+    for op in ops:
+        tag = {"z": "z", "+": "plus", "-": "minus"}[op]
+        path = os.path.join(outdir, f"sqw_{tag}.dat"); cf_path = os.path.join(outdir, f"sqw_{tag}_cf.dat")
+        with open(path, "w", encoding="utf-8") as f, open(cf_path, "w", encoding="utf-8") as fc:
+            f.write(f"# S^{op}(q,omega) = -Im G(omega+E0+i*eta)/pi  E0={E0:.12f} eta={eta} lattice={Lx}x{Ly}\n"
+                    f"# m1 m2 omega S ReG ImG\n")
+            fc.write(f"# Lanczos coefficients of S^{op}_q|psi0>: m1 m2 n a_n b_n (b_0 = 0); norm2 = <S(q)>\n")
+            for q in qs:
+                a, b, norm2 = results[(op, q)]
+                G = continued_fraction(a, b, norm2, w + E0 + 1j * eta)
+                for wi, g in zip(w, G):
+                    f.write(f"{q[0]:4d}{q[1]:4d} {wi: .8f} {-g.imag/np.pi: .10e} {g.real: .10e} {g.imag: .10e}\n")
+                f.write("\n\n")
+                fc.write(f"# q=({q[0]},{q[1]}) norm2={norm2:.16e} n={a.size}\n")
+                for n in range(a.size):
+                    fc.write(f"{q[0]:4d}{q[1]:4d}{n:6d} {a[n]: .16e} {(b[n-1] if n else 0.0): .16e}\n")
+        paths.append(path)
+    print(f"[Dyn] omega=[{wmin:g},{wmax:g}] n={nw} eta={eta}; wrote {', '.join(paths)}")
+    return results
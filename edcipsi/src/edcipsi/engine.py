@@ -0,0 +1,168 @@
+"""Cost model for picking the Hamiltonian representation per cycle (--engine auto).
+
+Candidates:
+  matfree : Numba matrix-free H·x (no matrix; every matvec re-decodes all terms)
+  csr     : assembled in-memory CSR (direct two-pass build: threaded Numba kernels, else
+            NumPy, or the blocked builder with --build-procs; fast matvec, costs memory)
+  ooc     : memmapped CSR on scratch disk (ooc.py; RAM holds one block/chunk, matvec reads nnz bytes)
+nnz is estimated from the basis size B, the bilinear term count T (operator
+applications: a Hermitian-flagged term counts twice) and the
+fraction of (row, term) pairs that land inside the basis, sampled on a few
+hundred rows. The cheapest candidate whose peak memory fits the budget wins.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from .basis import apply_term_vec
+from .nbkernels import pack_terms_arrays, num_threads
+from .io import hamiltonian_dtype, n_directions
+from .utils import fmt_bytes
+
+ENGINES = ("auto", "matfree", "csr", "blocked", "ooc")
+
+# rough per-operation costs [s] on one core (see bench/bench_hotpaths.py)
+COST = {
+    "decode": 5e-8,    # matrix-free: per (row, term) per matvec
+    "build": 9e-8,     # vectorized CSR build (--build-procs>0): per (row, term), per process
+    "build_direct": 1.8e-7, # direct two-pass CSR build (hbuilder.build_subspace_csr): per (row, term), both passes
+    "build_nb": 6e-8,  # Numba count/fill kernels (hbuilder.csr_rows_nb): per (row, term), both passes, per thread
+    "coo2csr": 1.3e-7, # COO→CSR + Hermitian symmetrization: per nnz
+    "spmv": 2.5e-9,    # CSR matvec: per nnz
+    "disk": 5e-10,     # scratch read/write: per byte (~2 GB/s local NVMe)
+}
+OOC_BLOCK_ROWS = 4096
+OOC_CHUNK_NNZ = 1 << 22
+EIGSH_MATVECS = 80   # typical Lanczos matvecs per eigsh call
+EIGSH_NCV = 20       # Lanczos vectors held by ARPACK
+
+@dataclass
+class EngineEstimate:
+    B: int
+    T: int
+    hit_rate: float
+    nnz: int
+    itemsize: int
+    procs: int
+    numba_ok: bool
+    threads: int = 1
+
+    @property
+    def csr_bytes(self) -> int:
+        return self.nnz * (self.itemsize + 4) + (self.B + 1) * 4
+
+    @property
+    def csr_peak_bytes(self) -> int:
+        if self.procs <= 0 or self.numba_ok:
+            # direct assembly: final arrays + one row block of keys/data
+            per_row = max(1.0, self.nnz / max(self.B, 1))
+            blk = int(min(OOC_BLOCK_ROWS, self.B) * per_row) * (24 + self.itemsize)
+            return self.csr_bytes + blk + self.lanczos_bytes
+        # blocked builder: COO arrays + H, H^H and their sum while symmetrizing, + Lanczos vectors
+        coo = self.nnz * (8 + self.itemsize)
+        return coo + 3 * self.csr_bytes + self.lanczos_bytes
+
+    @property
+    def matfree_bytes(self) -> int:
+        return 3 * 8 * self.B + self.lanczos_bytes
+
+    @property
+    def lanczos_bytes(self) -> int:
+        return EIGSH_NCV * self.B * self.itemsize
+
+    @property
+    def t_matfree(self) -> float:
+        return EIGSH_MATVECS * self.B * self.T * COST["decode"]
+
+    @property
+    def t_csr(self) -> float:
+        if self.numba_ok:
+            build = self.B * self.T * COST["build_nb"] / max(self.threads, 1)
+        else:
+            per_rt = COST["build"] / self.procs if self.procs > 0 else COST["build_direct"]
+            build = self.B * self.T * per_rt + self.nnz * COST["coo2csr"]
+        return build + EIGSH_MATVECS * self.nnz * COST["spmv"]
+
+    @property
+    def ooc_bytes(self) -> int:
+        # one row block of COO + its CSR while building, two streamed chunks while solving
+        per_row = max(1.0, self.nnz / max(self.B, 1))
+        blk = int(min(OOC_BLOCK_ROWS, self.B) * per_row * 2) * (8 + self.itemsize) * 2
+        chunks = 2 * min(OOC_CHUNK_NNZ, self.nnz) * (4 + self.itemsize)
+        return 3 * 8 * self.B + max(blk, chunks) + self.lanczos_bytes
+
+    @property
+    def t_ooc(self) -> float:
+        # Hermitian-closed terms generated row-wise, written once, read every matvec
+        if self.numba_ok:
+            build = self.B * self.T * COST["build_nb"] / max(self.threads, 1)
+        else:
+            build = self.B * self.T * COST["build"] / max(self.procs, 1) + self.nnz * COST["coo2csr"]
+        disk = self.csr_bytes * COST["disk"]
+        return build + disk + EIGSH_MATVECS * (self.nnz * COST["spmv"] + disk)
+
+    def peak_bytes(self, engine: str) -> int:
+        return {"matfree": self.matfree_bytes, "ooc": self.ooc_bytes}.get(engine, self.csr_peak_bytes)
+
+    def seconds(self, engine: str) -> float:
+        return {"matfree": self.t_matfree, "ooc": self.t_ooc}.get(engine, self.t_csr)
+
+    def describe(self) -> str:
+        return (f"B={self.B} T={self.T} hit={self.hit_rate:.3g} nnz~{self.nnz} "
+                f"csr={fmt_bytes(self.csr_bytes)} (peak {fmt_bytes(self.csr_peak_bytes)}, ~{self.t_csr:.2g}s) "
+                f"matfree={fmt_bytes(self.matfree_bytes)} (~{self.t_matfree:.2g}s) "
+                f"ooc={fmt_bytes(self.ooc_bytes)} (~{self.t_ooc:.2g}s)")
+
+def sample_hit_rate(basis_bits, bilinear_terms, sample: int = 256, seed: int = 0, packed=None) -> float:
+    """Distinct in-basis off-diagonal entries per (row, term), on a random row sample.
+
+    Duplicate (row, column) hits from different terms are merged, as in the assembled CSR.
+    """
+    B = len(basis_bits); T = n_directions(bilinear_terms)
+    if B == 0 or T == 0:
+        return 0.0
+    basis_arr = np.fromiter(basis_bits, dtype=np.int64, count=B)
+    sorted_bits = np.sort(basis_arr)
+    if B > sample:
+        rows = basis_arr[np.random.default_rng(seed).choice(B, size=sample, replace=False)]
+    else:
+        rows = basis_arr
+    (_,_,_,_,_,_, bi,bsi,bj,bsj,bk,bsk,bl,bsl,_,_,bh) = packed or pack_terms_arrays({}, bilinear_terms)
+    keys = []
+    for t in range(bi.shape[0]):
+        for adj in ((False, True) if bh[t] else (False,)):
+            ok, s2 = apply_term_vec(rows, bi[t], bsi[t], bsj[t], bk[t], bsk[t], bsl[t], adjoint=adj)
+            if not ok.any(): continue
+            src = np.nonzero(ok)[0]
+            tgt = s2[src]
+            pos = np.searchsorted(sorted_bits, tgt); pos[pos >= B] = 0
+            hit = sorted_bits[pos] == tgt
+            keys.append(src[hit].astype(np.int64) * B + pos[hit])
+    hits = np.unique(np.concatenate(keys)).size if keys else 0
+    return hits / float(rows.size * T)
+
+def estimate_engine_costs(basis_bits, diag_terms, bilinear_terms, procs: int = 0,
+                          numba_ok: bool = True, sample: int = 256) -> EngineEstimate:
+    B = len(basis_bits); T = n_directions(bilinear_terms)
+    hit = sample_hit_rate(basis_bits, bilinear_terms, sample=sample)
+    itemsize = np.dtype(hamiltonian_dtype(diag_terms, bilinear_terms)).itemsize
+    nnz = int(B * (1.0 + hit * T))
+    threads = num_threads() if numba_ok else 1
+    return EngineEstimate(B=B, T=T, hit_rate=hit, nnz=nnz, itemsize=itemsize, procs=procs, numba_ok=numba_ok,
+                          threads=threads)
+
+def choose_engine(basis_bits, diag_terms, bilinear_terms, mem_budget: Optional[int],
+                  procs: int = 0, numba_ok: bool = True):
+    """→ (engine, estimate, reason). Fastest candidate that fits; smallest footprint if none fits."""
+    est = estimate_engine_costs(basis_bits, diag_terms, bilinear_terms, procs=procs, numba_ok=numba_ok)
+    cands = ["csr"] + (["matfree"] if numba_ok else [])
+    if mem_budget is not None and est.csr_peak_bytes > mem_budget:
+        cands.append("ooc")  # disk only when the in-memory CSR does not fit
+    fits = [e for e in cands if mem_budget is None or est.peak_bytes(e) <= mem_budget]
+    if fits:
+        eng = min(fits, key=est.seconds)
+        reason = "fastest within budget"
+    else:
+        eng = min(cands, key=est.peak_bytes)
+        reason = "nothing fits budget; smallest footprint"
+    return eng, est, reason
@@ -0,0 +1,162 @@
+"""Full exact diagonalization of a whole Sz sector (--full-ed): the reference for CIPSI.
+
+The sector with n_up up spins is enumerated completely, in increasing order, so
+the index of a determinant is its combinadic rank
+    rank(b) = Σ_j C(p_j, j)   (p_1 < p_2 < ... the set bits of b)
+and H·x needs neither a hash table nor a binary search. Terms that change Sz
+cannot connect two states of the sector; if the Hamiltonian has any, or the run
+is grand canonical, the whole 2^N space is used instead (rank(b) = b). The
+lowest eigenpair comes from eigsh on the matrix-free Numba operator
+(without Numba: the CSR builder on the enumerated states).
+"""
+from __future__ import annotations
+import time
+from math import comb
+from typing import Optional
+import numpy as np
+from . import nbkernels as nbk
+from .basis import apply_local_op_vec, diag_energy_vec
+from .hbuilder import hermitian_terms, build_subspace_matrix
+from .io import hamiltonian_dtype
+from .metrics import NULL_METRICS
+from .utils import fmt_bytes
+
+def binomial_table(N: int) -> np.ndarray:
+    """C[n, k] = binomial(n, k) for 0 ≤ n, k ≤ N (int64)."""
+    C = np.zeros((N + 1, N + 2), dtype=np.int64)
+    for n in range(N + 1):
+        C[n, 0] = 1
+        for k in range(1, n + 1):
+            C[n, k] = C[n-1, k-1] + C[n-1, k]
+    return C
+
+def sector_up(N: int, grand_canonical: bool, sector_Sz=None) -> Optional[int]:
+    """Number of up spins of the sector (as run_cipsi_once seeds it); None = whole space."""
+    if grand_canonical:
+        return None
+    if sector_Sz is None:
+        return N // 2
+    return max(0, min(N, int(round(float(sector_Sz) + N / 2))))
+
+def sector_size(N: int, n_up: Optional[int]) -> int:
+    return 1 << N if n_up is None else comb(N, n_up)
+
+def sector_states(N: int, n_up: Optional[int]) -> np.ndarray:
+    """All states of the sector in increasing order (= rank order)."""
+    if n_up is None:
+        return np.arange(1 << N, dtype=np.int64)
+    count = comb(N, n_up)
+    if nbk.NUMBA_OK and nbk.load_kernels() is not None:
+        return nbk._sector_states_nb(n_up, count)
+    # ビット n を上から足していく: 0 のもの (< 2^n) が先、1 のものが後 → 常に昇順
+    rows = {0: np.zeros(1, dtype=np.int64)}
+    for n in range(N):
+        lo = max(0, n_up - (N - n - 1))
+        rows = {k: np.concatenate([rows.get(k, np.empty(0, np.int64)),
+                                   rows[k-1] | (np.int64(1) << n) if k - 1 in rows else np.empty(0, np.int64)])
+                for k in range(lo, min(n + 1, n_up) + 1)}
+    return rows[n_up]
+
+def rank_vec(bits: np.ndarray, C: np.ndarray, N: int, full: bool) -> np.ndarray:
+    """Combinadic rank of every entry of `bits` (all in the sector)."""
+    if full:
+        return np.asarray(bits, dtype=np.int64)
+    r = np.zeros(bits.shape[0], dtype=np.int64)
+    k = np.zeros(bits.shape[0], dtype=np.int64)
+    for p in range(N):
+        on = (bits >> p) & 1
+        k += on
+        r += on * C[p, k]
+    return r
+
+def _dn(ops) -> int:
+    """Change of the up count by a chain of |s_to><s_from| (s=0 is ↑)."""
+    return sum(int(s_to == 0) - int(s_from == 0) for (_, s_from, s_to) in ops)
+
+def sector_terms(diag_terms, bilinear_terms):
+    """Hermitian-closed terms, and whether every term conserves Sz."""
+    diag_h, bil_h = hermitian_terms(diag_terms, bilinear_terms)
+    conserving = all(_dn([(t[4], t[7], t[5]), (t[0], t[3], t[1])]) == 0 for t in bil_h)
+    return diag_h, bil_h, conserving
+
+def sector_operator(states, N, diag_h, bil_h, full: bool, dtype, metrics=None):
+    """Numba matrix-free H·x on the complete sector (rows pulled in parallel, rank arithmetic)."""
+    from scipy.sparse.linalg import LinearOperator
+    m = metrics or NULL_METRICS
+    (di,dsi,dk,dsk,dcr,dci, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh) = nbk.pack_terms_arrays(diag_h, bil_h)
+    C = binomial_table(N)
+    hd = diag_energy_vec(states, di,dsi,dk,dsk,dcr,dci, real=True)   # Hermitian-closed: real diagonal
+    if dtype is np.float64:
+        kern = nbk._sector_matvec_nb_real
+        def _hx(x):
+            return kern(np.ascontiguousarray(x, dtype=np.float64), states, C, full,
+                        hd, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bh)
+        def _matvec(v):
+            m.add("matvecs")
+            v = np.asarray(v).reshape(-1)
+            return _hx(v.real) + 1j*_hx(v.imag) if np.iscomplexobj(v) else _hx(v)
+    else:
+        kern = nbk._sector_matvec_nb
+        def _matvec(v):
+            m.add("matvecs")
+            x = np.ascontiguousarray(np.asarray(v).reshape(-1), dtype=np.complex128)
+            return kern(x, states, C, full, hd, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh)
+    return LinearOperator((states.size, states.size), matvec=_matvec, dtype=dtype)
+
+def run_full_ed(N, diag_terms, bilinear_terms, grand_canonical=False, sector_Sz=None, metrics=None):
+    """Ground state of the whole sector → (E0, vec, states) like run_cipsi_once (basis = states array)."""
+    from scipy.sparse.linalg import eigsh
+    m = metrics or NULL_METRICS
+    diag_h, bil_h, conserving = sector_terms(diag_terms, bilinear_terms)
+    n_up = sector_up(N, grand_canonical, sector_Sz)
+    if n_up is not None and not conserving:
+        print("[FullED] InterAll does not conserve Sz: diagonalizing the whole 2^N space")
+        n_up = None
+    full = n_up is None
+    dtype = hamiltonian_dtype(diag_terms, bilinear_terms)
+    B = sector_size(N, n_up)
+    itemsize = np.dtype(dtype).itemsize
+    print(f"[FullED] N={N} " + ("space=2^N" if full else f"N_up={n_up} (Sz={n_up - N/2:g})")
+          + f" dim={B} states={fmt_bytes(8*B)} lanczos~{fmt_bytes(22*B*itemsize + 8*B)}")
+    t0 = time.perf_counter()
+    with m.phase("build"):
+        states = sector_states(N, n_up)
+    print(f"[FullED] enumerated {states.size} states in {time.perf_counter()-t0:.2f}s")
+    m.set("basis", int(states.size))
+    if nbk.NUMBA_OK and nbk.load_kernels() is not None:
+        Hop = sector_operator(states, N, diag_h, bil_h, full, dtype, metrics=m)
+        print(f"[FullED] matrix-free rank operator, threads={nbk.num_threads()}")
+    else:
+        with m.phase("build"):
+            Hop = build_subspace_matrix(states, N, diag_h, bil_h, nb_build=False)
+        m.set("nnz", int(Hop.nnz))
+        print(f"[FullED] Numba unavailable: CSR nnz={Hop.nnz}")
+    t0 = time.perf_counter()
+    with m.phase("eigsh"):
+        w, v = eigsh(Hop, k=1, which='SA', tol=1e-10, maxiter=10000)
+    print(f"[FullED] E0={w[0]:.12f} ({time.perf_counter()-t0:.2f}s)")
+    return w[0], v[:, 0], states
+
+# ---- observables on the complete sector (vectorized, rank instead of dict lookups) ----
+def _expect_chain(states, vec, chain, C, N, full):
+    """<ψ| O |ψ> for O = chain applied right to left as in observables.expect_green*."""
+    if not full and _dn(chain) != 0:
+        return 0.0 + 0.0j
+    ok = np.ones(states.size, dtype=bool); s = states
+    for (site, s_from, s_to) in chain:
+        o, s = apply_local_op_vec(s, site, s_from, s_to)
+        ok &= o
+    if not ok.any():
+        return 0.0 + 0.0j
+    src = np.nonzero(ok)[0]
+    tgt = rank_vec(s[src], C, N, full)
+    return complex(np.vdot(vec[tgt], vec[src]))
+
+def sector_expect_greenone(states, vec, N, ops):
+    C = binomial_table(N); full = states.size == 1 << N
+    return [_expect_chain(states, vec, [(j, sj, si)], C, N, full) for (i, si, j, sj) in ops]
+
+def sector_expect_greentwo(states, vec, N, ops):
+    C = binomial_table(N); full = states.size == 1 << N
+    return [_expect_chain(states, vec, [(l, sl, sk), (j, sj, si)], C, N, full)
+            for (i, si, j, sj, k, sk, l, sl) in ops]
@@ -0,0 +1,52 @@
+from __future__ import annotations
+import math
+from dataclasses import dataclass
+import numpy as np
+
+GROWTH_MODES = ("fixed", "weight", "geometric")
+
+@dataclass
+class GrowthSchedule:
+    """How many selected determinants to add per cycle.
+
+    fixed     : add_per_cycle (previous behaviour)
+    weight    : smallest n whose top-n selection weights capture `target_frac`
+                of the total weight sum_a |M_a|^2/|E-H_aa| over the external space
+    geometric : grow the basis by `factor` per cycle
+    In the adaptive modes add_per_cycle is only an upper cap, and the run stops
+    once the weight captured by a cycle drops below `stop_weight`.
+    """
+    mode: str = "fixed"
+    target_frac: float = 0.9
+    factor: float = 1.5
+    stop_weight: float = 1e-7
+    min_add: int = 1
+    # last decision (for logging)
+    captured: float = 0.0
+    total: float = 0.0
+
+    @property
+    def adaptive(self) -> bool:
+        return self.mode != "fixed"
+
+    def count(self, weights_desc, total: float, add_max: int, basis_size: int) -> int:
+        w = np.asarray(weights_desc, dtype=np.float64)
+        if self.mode == "weight" and w.size:
+            cum = np.cumsum(w)
+            n = int(np.searchsorted(cum, self.target_frac * total)) + 1
+        elif self.mode == "geometric":
+            n = int(math.ceil((self.factor - 1.0) * basis_size))
+        else:
+            n = add_max
+        n = max(self.min_add, min(n, add_max, w.size))
+        n = min(n, w.size)
+        self.captured = float(w[:n].sum()) if n else 0.0
+        self.total = float(total)
+        return n
+
+    def should_stop(self) -> bool:
+        return self.adaptive and self.captured < self.stop_weight
+
+    def describe(self) -> str:
+        frac = self.captured / self.total if self.total > 0 else 0.0
+        return f"captured={self.captured:.3e} ({frac:.1%} of {self.total:.3e})"
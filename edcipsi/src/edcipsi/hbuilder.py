@@ -1,32 +1,21 @@
 from __future__ import annotations
 from typing import List, Dict, Tuple
 import numpy as np
-from scipy.sparse import csr_matrix
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from .basis import diag_energy_bit, apply_local_op
+from concurrent.futures import as_completed
+from .basis import diag_energy_bit, apply_local_op, diag_energy_vec, apply_term_vec
+from . import nbkernels as nbk
+from .nbkernels import pack_terms_arrays
+from .io import hamiltonian_dtype, adjoint_term, canonicalize_terms, term_directions
+from .shm import SharedArrays, attach_arrays, detach, export_arrays, take_arrays, discard_segment, process_pool
 
-def build_subspace_matrix(basis_bits: List[int], N:int, diag_terms, bilinear_terms):
-    B = len(basis_bits)
-    index = {b:i for i,b in enumerate(basis_bits)}
-    rows=[]; cols=[]; data=[]
-    for i,b in enumerate(basis_bits):
-        e = diag_energy_bit(b, diag_terms)
-        rows.append(i); cols.append(i); data.append(e)
-    for i,b in enumerate(basis_bits):
-        for (ii,si,jj,sj, kk,sk,ll,sl, c) in bilinear_terms:
-            ok1, s1 = apply_local_op(b, kk, sl, sk)
-            if not ok1: continue
-            ok2, s2 = apply_local_op(s1, ii, sj, si)
-            if not ok2: continue
-            j = index.get(s2, -1)
-            if j < 0: continue
-            rows.append(j); cols.append(i); data.append(c)
-    H = csr_matrix((np.array(data,dtype=np.complex128),
-                    (np.array(rows),np.array(cols))), shape=(B,B))
-    H = (H + H.getH())*0.5
-    return H
+def build_subspace_matrix(basis_bits: List[int], N:int, diag_terms, bilinear_terms,
+                          half: bool = False, block_size: int = 4096, nb_build: bool = True):
+    """(H + H^H)/2 by direct two-pass CSR assembly (see build_subspace_csr)."""
+    return build_subspace_csr(basis_bits, N, diag_terms, bilinear_terms, half=half, block_size=block_size,
+                              nb_build=nb_build)
 
-def _build_range_block(range_start:int, range_end:int, basis_bits, diag_terms, bilinear_terms, index):
+def _build_range_block(range_start:int, range_end:int, basis_bits, diag_terms, bilinear_terms, index,
+                       dtype=np.complex128):
     rows = []; cols = []; data = []
     for i in range(range_start, range_end):
         b = basis_bits[i]
@@ -34,7 +23,7 @@ def _build_range_block(range_start:int, range_end:int, basis_bits, diag_terms, b
         rows.append(i); cols.append(i); data.append(e)
     for i in range(range_start, range_end):
         b = basis_bits[i]
-        for (ii,si,jj,sj, kk,sk,ll,sl, c) in bilinear_terms:
+        for (ii,si,jj,sj, kk,sk,ll,sl, c) in (d for t in bilinear_terms for d in term_directions(t)):
             ok1, s1 = apply_local_op(b, kk, sl, sk)
             if not ok1: continue
             ok2, s2 = apply_local_op(s1, ii, sj, si)
@@ -44,31 +33,238 @@ def _build_range_block(range_start:int, range_end:int, basis_bits, diag_terms, b
             rows.append(j); cols.append(i); data.append(c)
     return (np.array(rows, dtype=np.int32),
             np.array(cols, dtype=np.int32),
-            np.array(data, dtype=np.complex128))
+            np.array(data, dtype=dtype))
+
+def hermitian_terms(diag_terms, bilinear_terms):
+    """Terms of (H + H^H)/2 in canonical form: real diagonal, conjugate pairs as one flagged term.
+
+    Every resulting term is Hermitian-flagged or has a self-adjoint key, so row i
+    equals conj(column i) and row blocks can be generated directly. Hermitian-closed
+    lists (edcipsi-gen output, or already canonical) keep their coefficients.
+    """
+    real = hamiltonian_dtype(diag_terms, bilinear_terms) is np.float64
+    diag_h = {k: (float(c.real) if real else complex(c.real, 0.0)) for k, c in diag_terms.items()}
+    _, canon, _ = canonicalize_terms({}, bilinear_terms)
+    bil_h = []
+    for t in canon:
+        if t[9]:
+            bil_h.append(t)                                    # c O + conj(c) O^H
+        elif tuple(adjoint_term(t)[:8]) == tuple(t[:8]):
+            c = float(t[8].real) if real else complex(t[8].real, 0.0)
+            bil_h.append(t[:8] + (c, False))                   # self-adjoint O: (c + conj c)/2
+        else:
+            bil_h.append(t[:8] + (0.5 * t[8], True))           # unpaired: (c O + conj(c) O^H)/2
+    return diag_h, bil_h
+
+_PACKED_KEYS = ("di","dsi","dk","dsk","dcr","dci", "bi","bsi","bj","bsj","bk","bsk","bl","bsl","bcr","bci","bh")
+
+def _coo_block_packed(lo:int, hi:int, basis_arr, sorted_bits, order, packed, real=False):
+    """Vectorized COO piece for columns [lo,hi) from packed term arrays (binary-search index)."""
+    (di,dsi,dk,dsk,dcr,dci, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh) = packed
+    dtype = np.float64 if real else np.complex128
+    bits = np.asarray(basis_arr[lo:hi], dtype=np.int64)
+    local = np.arange(lo, hi, dtype=np.int32)
+    rows = [local]; cols = [local]; data = [diag_energy_vec(bits, di,dsi,dk,dsk,dcr,dci, real=real)]
+    nB = sorted_bits.shape[0]
+    for t in range(bi.shape[0]):
+        for adj in ((False, True) if bh[t] else (False,)):
+            ok, s2 = apply_term_vec(bits, bi[t], bsi[t], bsj[t], bk[t], bsk[t], bsl[t], adjoint=adj)
+            if not ok.any(): continue
+            src = np.nonzero(ok)[0]
+            tgt = s2[src]
+            pos = np.searchsorted(sorted_bits, tgt)
+            pos[pos >= nB] = 0
+            hit = sorted_bits[pos] == tgt
+            if not hit.any(): continue
+            c = bcr[t] if real else complex(bcr[t], -bci[t] if adj else bci[t])
+            rows.append(order[pos[hit]].astype(np.int32, copy=False))
+            cols.append(local[src[hit]])
+            data.append(np.full(int(hit.sum()), c, dtype=dtype))
+    return (np.concatenate(rows), np.concatenate(cols), np.concatenate(data))
+
+def _row_block_keys(lo:int, hi:int, basis_arr, sorted_bits, order, packed, real, half):
+    """Rows [lo,hi) of Hermitian-closed packed terms → (sorted unique keys (row-lo)*B+col, inverse, data)."""
+    r, c, d = _coo_block_packed(lo, hi, basis_arr, sorted_bits, order, packed, real=real)
+    rows, cols = c, r                      # row i = conj(column i)
+    if not real:
+        d = d.conj()
+    if half:
+        keep = cols >= rows
+        rows, cols, d = rows[keep], cols[keep], d[keep]
+    key = (rows - lo).astype(np.int64) * sorted_bits.shape[0] + cols
+    u, inv = np.unique(key, return_inverse=True)
+    return u, inv, d
 
-def build_subspace_matrix_blocked(basis_bits, N, diag_terms, bilinear_terms, block_size=4096, procs=0, verbose=True):
+def nb_build_ok(nb_build: bool = True) -> bool:
+    return bool(nb_build) and nbk.NUMBA_OK and nbk.load_kernels() is not None
+
+def csr_rows_nb(lo:int, hi:int, basis_arr, sorted_bits, order, packed, real, half=False):
+    """Rows [lo,hi) of Hermitian-closed packed terms as CSR (indptr from 0, int32 indices, data).
+
+    Numba count pass (parallel over row chunks) → prefix sum → parallel fill pass
+    straight into the preallocated arrays; columns sorted, duplicates summed.
+    """
+    counts = nbk._csr_count_nb(lo, hi, basis_arr, sorted_bits, order, *packed, half)
+    indptr = np.zeros(hi - lo + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    del counts
+    nnz = int(indptr[-1])
+    indices = np.empty(nnz, dtype=np.int32)
+    data = np.empty(nnz, dtype=np.float64 if real else np.complex128)
+    fill = nbk._csr_fill_nb_real if real else nbk._csr_fill_nb
+    fill(lo, hi, basis_arr, sorted_bits, order, *packed, half, indptr, indices, data)
+    return indptr, indices, data
+
+def build_subspace_csr(basis_bits, N, diag_terms, bilinear_terms, half=False, block_size=4096, nb_build=True):
+    """Direct two-pass CSR of (H + H^H)/2 from Hermitian-closed terms.
+
+    With Numba (nb_build) both passes run as compiled multithreaded kernels over
+    all rows (csr_rows_nb). Otherwise pass 1 counts the distinct entries per row
+    one row block at a time, pass 2 regenerates each block and fills
+    preallocated int32 indices / data in place, so peak memory is the final
+    matrix plus one block. half=True keeps only the upper triangle and diagonal
+    and returns a HermitianCSR.
+    """
+    from scipy.sparse import csr_matrix
+    dtype = hamiltonian_dtype(diag_terms, bilinear_terms)
+    real = dtype is np.float64
+    packed = pack_terms_arrays(*hermitian_terms(diag_terms, bilinear_terms))
+    basis_arr = np.array(basis_bits, dtype=np.int64)
+    B = basis_arr.size
+    order = np.argsort(basis_arr, kind="stable")
+    sorted_bits = basis_arr[order]
+    if nb_build_ok(nb_build) and B:
+        indptr, indices, data = csr_rows_nb(0, B, basis_arr, sorted_bits, order, packed, real, half)
+        if indptr[-1] < 2**31:
+            indptr = indptr.astype(np.int32)
+        H = csr_matrix((data, indices, indptr), shape=(B, B))
+        H.has_sorted_indices = True
+        return HermitianCSR(H) if half else H
+    ranges = [(s, min(s+block_size, B)) for s in range(0, B, block_size)]
+    counts = np.zeros(B, dtype=np.int64)
+    for (lo, hi) in ranges:
+        u, _, _ = _row_block_keys(lo, hi, basis_arr, sorted_bits, order, packed, real, half)
+        counts[lo:hi] = np.bincount(u // B, minlength=hi - lo)
+    nnz = int(counts.sum())
+    itype = np.int32 if nnz < 2**31 else np.int64
+    indptr = np.zeros(B + 1, dtype=itype)
+    np.cumsum(counts, out=indptr[1:])
+    del counts
+    indices = np.empty(nnz, dtype=np.int32)
+    data = np.empty(nnz, dtype=dtype)
+    for (lo, hi) in ranges:
+        u, inv, d = _row_block_keys(lo, hi, basis_arr, sorted_bits, order, packed, real, half)
+        a, b = int(indptr[lo]), int(indptr[hi])
+        indices[a:b] = u % B
+        if real:
+            data[a:b] = np.bincount(inv, weights=d, minlength=u.size)
+        else:
+            data[a:b].real = np.bincount(inv, weights=d.real, minlength=u.size)
+            data[a:b].imag = np.bincount(inv, weights=d.imag, minlength=u.size)
+    H = csr_matrix((data, indices, indptr), shape=(B, B))
+    H.has_sorted_indices = True
+    return HermitianCSR(H) if half else H
+
+class HermitianCSR:
+    """Hermitian H stored as its upper triangle U (with diagonal): H x = U x + U^H x - diag(U) x."""
+    def __init__(self, U):
+        self.U = U
+        self.shape = U.shape
+        self.dtype = U.dtype
+        self.diag = U.diagonal()
+
+    @property
+    def nnz(self) -> int:
+        return int(self.U.nnz)
+
+    def matvec(self, x):
+        x = np.asarray(x).reshape(-1)
+        if nbk.NUMBA_OK:
+            xc = np.ascontiguousarray(x, dtype=np.result_type(self.dtype, x.dtype))
+            return nbk._csr_herm_matvec_nb(self.U.indptr, self.U.indices, self.U.data, xc, np.zeros_like(xc))
+        # U.T is a CSC view of the same arrays: U^H x = conj(U^T conj(x))
+        return self.U @ x + np.conj(self.U.T @ np.conj(x)) - self.diag * x
+
+    def __matmul__(self, x):
+        return self.matvec(x)
+
+    def full(self):
+        from scipy.sparse import diags
+        return (self.U + self.U.getH() - diags(self.diag)).tocsr()
+
+def _build_range_block_shm(range_start:int, range_end:int, spec, real=False):
+    """Process-pool worker: attach shared basis/index/terms, return the COO piece via shared memory."""
+    shms, a = attach_arrays(spec)
+    try:
+        packed = tuple(a[k] for k in _PACKED_KEYS)
+        r, c, d = _coo_block_packed(range_start, range_end, a["basis"], a["sorted_bits"], a["order"], packed, real=real)
+    finally:
+        del a
+        detach(shms)
+    return export_arrays(r, c, d), int(r.shape[0])
+
+def _build_blocked_shared(basis_bits, diag_terms, bilinear_terms, ranges, procs, verbose=True):
+    """Basis, sorted index and packed terms go to shared memory once; only (start,end,spec) is pickled."""
+    dtype = hamiltonian_dtype(diag_terms, bilinear_terms)
+    real = dtype is np.float64
+    basis_arr = np.array(basis_bits, dtype=np.int64)
+    order = np.argsort(basis_arr, kind="stable")
+    arrays = {"basis": basis_arr, "sorted_bits": basis_arr[order], "order": order}
+    arrays.update(zip(_PACKED_KEYS, pack_terms_arrays(diag_terms, bilinear_terms)))
+    pieces = []
+    with SharedArrays(arrays) as sa:
+        if verbose:
+            print(f"[Build] shared memory: {sa.nbytes/2**20:.1f} MiB for basis/index/terms")
+        with process_pool(procs) as ex:
+            futs = [ex.submit(_build_range_block_shm, s, e, sa.spec, real) for (s,e) in ranges]
+            try:
+                for fut in as_completed(futs):
+                    pieces.append(fut.result())
+            except BaseException:
+                # do not leak worker output segments on failure
+                ex.shutdown(wait=True, cancel_futures=True)
+                for fut in futs:
+                    if fut.done() and not fut.cancelled() and fut.exception() is None:
+                        discard_segment(fut.result()[0][0])
+                raise
+    nnz = sum(n for _, n in pieces)
+    rows = np.empty(nnz, dtype=np.int32)
+    cols = np.empty(nnz, dtype=np.int32)
+    data = np.empty(nnz, dtype=dtype)
+    off = 0
+    for (name, layout), n in pieces:
+        take_arrays(name, layout, outs=(rows[off:off+n], cols[off:off+n], data[off:off+n]))
+        off += n
+    return rows, cols, data
+
+def build_subspace_matrix_blocked(basis_bits, N, diag_terms, bilinear_terms, block_size=4096, procs=0, verbose=True,
+                                  nb_build=True):
+    """(H + H^H)/2; with Numba this is the threaded kernel build, else row blocks over `procs` processes."""
+    dtype = hamiltonian_dtype(diag_terms, bilinear_terms)
     B = len(basis_bits)
-    index = {b:i for i,b in enumerate(basis_bits)}
+    if nb_build_ok(nb_build):
+        if verbose:
+            print(f"[Build] Numba two-pass CSR: B={B}, threads={nbk.num_threads()}")
+        return build_subspace_csr(basis_bits, N, diag_terms, bilinear_terms, nb_build=True)
     ranges = [(s, min(s+block_size, B)) for s in range(0, B, block_size)]
     rows_all = []; cols_all = []; data_all = []
     if procs and len(ranges) > 1:
         if verbose:
             print(f"[Build] Blocked CSR: B={B}, blocks={len(ranges)}, block_size={block_size}, procs={procs}")
-        with ProcessPoolExecutor(max_workers=procs) as ex:
-            futs = [ex.submit(_build_range_block, s, e, basis_bits, diag_terms, bilinear_terms, index) for (s,e) in ranges]
-            for fut in as_completed(futs):
-                r, c, d = fut.result()
-                rows_all.append(r); cols_all.append(c); data_all.append(d)
+        r, c, d = _build_blocked_shared(basis_bits, diag_terms, bilinear_terms, ranges, procs, verbose=verbose)
+        rows_all.append(r); cols_all.append(c); data_all.append(d)
     else:
         if verbose:
             print(f"[Build] Blocked CSR (serial): B={B}, blocks={len(ranges)}, block_size={block_size}")
+        index = {b:i for i,b in enumerate(basis_bits)}
         for (s,e) in ranges:
-            r, c, d = _build_range_block(s, e, basis_bits, diag_terms, bilinear_terms, index)
+            r, c, d = _build_range_block(s, e, basis_bits, diag_terms, bilinear_terms, index, dtype=dtype)
             rows_all.append(r); cols_all.append(c); data_all.append(d)
 
     rows = np.concatenate(rows_all) if rows_all else np.array([], dtype=np.int32)
     cols = np.concatenate(cols_all) if cols_all else np.array([], dtype=np.int32)
-    data = np.concatenate(data_all) if data_all else np.array([], dtype=np.complex128)
+    data = np.concatenate(data_all) if data_all else np.array([], dtype=dtype)
+    from scipy.sparse import csr_matrix
     H = csr_matrix((data, (rows, cols)), shape=(B, B))
     H = (H + H.getH()) * 0.5
     return H
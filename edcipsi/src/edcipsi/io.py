@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import List, Tuple, Dict
 from collections import defaultdict
+import numpy as np
 
 def read_greenone_def(path: str) -> List[tuple]:
     ops = []
@@ -60,3 +61,87 @@ def read_interall(path: str):
     if ignored>0:
         print(f"[INFO] Ignored {ignored} InterAll rows not matching local-local form (i==j,k==l).")
     return diag_terms, bilinear_terms
+
+def interall_is_real(diag_terms, bilinear_terms, tol: float = 0.0) -> bool:
+    """True if every InterAll coefficient has |Im| <= tol (e.g. Heisenberg/XXZ without DM terms)."""
+    return (all(abs(complex(c).imag) <= tol for c in diag_terms.values()) and
+            all(abs(complex(t[8]).imag) <= tol for t in bilinear_terms))
+
+def realify_terms(diag_terms, bilinear_terms):
+    """Drop the (zero) imaginary parts so downstream builders/kernels run in float64."""
+    diag_r: Dict[tuple, float] = defaultdict(float)
+    for k, c in diag_terms.items():
+        diag_r[k] = float(complex(c).real)
+    bil_r = [tuple(t[:8]) + (float(complex(t[8]).real),) + tuple(t[9:]) for t in bilinear_terms]
+    return diag_r, bil_r
+
+def hamiltonian_dtype(diag_terms, bilinear_terms):
+    """np.float64 if the terms were realified (no complex coefficients), else np.complex128."""
+    for c in diag_terms.values():
+        if isinstance(c, (complex, np.complexfloating)): return np.complex128
+    for t in bilinear_terms:
+        if isinstance(t[8], (complex, np.complexfloating)): return np.complex128
+    return np.float64
+
+# ---- canonical terms ----------------------------------------------------------
+# A bilinear term is (ii,si,jj,sj, kk,sk,ll,sl, c[, herm]); herm=True means the
+# term also stands for its Hermitian conjugate, which every builder/kernel applies
+# from the same stored entry. 9-tuples are treated as herm=False.
+
+def adjoint_term(term):
+    """(ii,si,jj,sj, kk,sk,ll,sl, c) → its Hermitian conjugate in the same (apply k, then i) convention."""
+    (ii,si,jj,sj, kk,sk,ll,sl, c) = term[:9]
+    return (kk,sl,ll,sk, ii,sj,jj,si, c.conjugate())
+
+def is_herm(term) -> bool:
+    return len(term) > 9 and bool(term[9])
+
+def term_directions(term):
+    """The 9-tuples a (possibly flagged) term applies: itself, plus its adjoint if herm."""
+    if is_herm(term):
+        return (tuple(term[:9]), adjoint_term(term))
+    return (tuple(term[:9]),)
+
+def expand_hermitian(bilinear_terms) -> List[tuple]:
+    """Flagged terms → explicit term + adjoint 9-tuples (the file-level form)."""
+    return [d for t in bilinear_terms for d in term_directions(t)]
+
+def n_directions(bilinear_terms) -> int:
+    """Number of operator applications per determinant (flagged terms count twice)."""
+    return sum(2 if is_herm(t) else 1 for t in bilinear_terms)
+
+def canonicalize_terms(diag_terms, bilinear_terms, tol: float = 1e-12):
+    """Sum identical operator keys, drop zeros, and keep one flagged representative per conjugate pair.
+
+    Diagonal keys (i,si,k,sk) and (k,sk,i,si) are the same n_i n_k and are merged.
+
+    A pair (O, c) + (O^H, conj c) becomes (O, c, True); the first one in input
+    order is kept. Self-adjoint keys and unpaired terms stay as (O, c, False).
+    → (diag_terms, canonical bilinear list, stats dict)
+    """
+    merged: Dict[tuple, complex] = {}
+    n_in = 0
+    for t in bilinear_terms:
+        for d in term_directions(t):
+            n_in += 1
+            k = tuple(d[:8]); merged[k] = merged.get(k, 0.0) + d[8]
+    out: List[tuple] = []
+    done = set(); pairs = 0
+    for k, c in merged.items():
+        if k in done or abs(c) <= tol:
+            continue
+        done.add(k)
+        ak = adjoint_term(k + (c,))
+        ka = tuple(ak[:8])
+        if ka != k and ka not in done and abs(merged.get(ka, 0.0) - ak[8]) <= tol * max(1.0, abs(c)):
+            done.add(ka)
+            out.append(k + (c, True)); pairs += 1
+        else:
+            out.append(k + (c, False))
+    diag = type(diag_terms)(diag_terms.default_factory) if isinstance(diag_terms, defaultdict) else {}
+    for (i,si,k,sk), c in diag_terms.items():
+        key = min((i,si,k,sk), (k,sk,i,si))      # n_i n_k = n_k n_i
+        diag[key] = diag.get(key, 0.0) + c
+    stats = {"in": n_in, "merged": n_in - len(merged), "pairs": pairs, "out": len(out),
+             "diag_in": len(diag_terms), "diag_out": len(diag)}
+    return diag, out, stats
@@ -0,0 +1,180 @@
+"""Memory governor: keep a CIPSI run under a RAM budget instead of meeting the OOM killer.
+
+The peak of a cycle is modelled from per-determinant footprints, all ∝ B:
+  basis    : basis list + `used` set + eigenvector           (BASIS_BYTES per det)
+  matrix   : engine.EngineEstimate.peak_bytes of the solve engine (sampled per solve)
+  external : connected-amplitude store of the selection        (EXT_BYTES per external det,
+             with n_ext/B taken from the last selection pass)
+  cache    : ampcache.AmplitudeCache, resident through every phase (its nbytes/B after the
+             last amplitude pass)
+Solve and selection do not overlap, so peak ≈ baseline + basis + cache + max(matrix, external).
+When the next step would not fit, the governor, in this order,
+  1. switches the solve engine (csr/blocked → matfree → ooc),
+  2. drops the amplitude cache (amplitudes are then re-derived every cycle),
+  3. lowers add_per_cycle so the grown basis still fits,
+  4. prunes (prune_by_coeff) down to the largest basis that fits.
+Every adaptation is logged as [Mem]. The RSS is sampled after each phase; the
+baseline is re-measured after the first cycle (lazy imports, JIT code) and the
+model is scaled up whenever a later measured peak overshoots the prediction.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from .engine import estimate_engine_costs
+from .utils import fmt_bytes, current_rss, peak_rss
+
+BASIS_BYTES = 112                        # list slot + int object + set slot + complex coefficient
+EXT_BYTES = {"dict": 160, "shm": 80}     # connected_amplitudes dict entry / pselect arrays (incl. routing copies)
+CALIBRATE_MIN = 64 << 20                 # predictions below this are too noisy to rescale the model from
+
+@dataclass
+class MemoryGovernor:
+    budget: int
+    headroom: float = 0.9                # fraction of the budget the model may plan for
+    numba_ok: bool = True
+    procs: int = 0                       # --build-procs (blocked builder peak)
+    selection: str = "dict"              # "dict" (in-process) | "shm" (--select-procs)
+    min_basis: int = 1                   # never prune below this (the seed count)
+    baseline: int = 0                    # RSS before the first cycle (interpreter, terms, ...)
+    scale: float = 1.0                   # measured/predicted correction, ≥ 1
+    ext_per_det: Optional[float] = None
+    cache_per_det: float = 0.0           # AmplitudeCache bytes per basis determinant
+    matrix_per_det: Dict[str, float] = field(default_factory=dict)
+    events: List[str] = field(default_factory=list)
+    _predicted: float = 0.0
+    _peak_seen: int = 0
+    _calibrated: bool = False
+    _inert: bool = False
+
+    def __post_init__(self):
+        if not self.baseline:
+            self.baseline = current_rss() or 0
+        self._peak_seen = peak_rss() or 0
+
+    # ---- model ---------------------------------------------------------------
+    @property
+    def room(self) -> float:
+        """Bytes the basis, matrix and selection may use together."""
+        return max(0.0, self.headroom * self.budget - self.baseline)
+
+    def _ext_bytes(self, B: int) -> float:
+        return (self.ext_per_det or 0.0) * B * EXT_BYTES[self.selection]
+
+    def predict(self, B: int, engine: str) -> float:
+        mat = self.matrix_per_det.get(engine, 0.0) * B
+        return self.scale * ((BASIS_BYTES + self.cache_per_det) * B + max(mat, self._ext_bytes(B)))
+
+    def max_basis(self) -> Optional[int]:
+        """Largest basis whose predicted peak fits, with the leanest engine; None before any estimate."""
+        if not self.matrix_per_det:
+            return None
+        if self.room <= 0:
+            if not self._inert:
+                self._inert = True
+                self._log(f"{self.headroom:.0%} of the budget {fmt_bytes(self.budget)} is below the process baseline "
+                          f"{fmt_bytes(self.baseline)}; no adaptation possible")
+            return None
+        mat = min(self.matrix_per_det.values())
+        per_det = self.scale * (BASIS_BYTES + self.cache_per_det
+                                + max(mat, (self.ext_per_det or 0.0) * EXT_BYTES[self.selection]))
+        return int(self.room / per_det)
+
+    def _log(self, msg: str) -> None:
+        self.events.append(msg)
+        print(f"[Mem] {msg}")
+
+    # ---- decisions -----------------------------------------------------------
+    def solve_engine(self, cycle, basis, diag_terms, bilinear_terms, engine, requested: str):
+        """Engine for this solve: `engine` unchanged if its predicted peak fits, else the fastest one that does."""
+        est = estimate_engine_costs(basis, diag_terms, bilinear_terms, procs=self.procs, numba_ok=self.numba_ok)
+        B = max(est.B, 1)
+        cands = ["csr"] + (["matfree"] if self.numba_ok else []) + ["ooc"]
+        self.matrix_per_det = {e: est.peak_bytes(e) / B for e in cands}
+        if requested == "blocked":
+            self.matrix_per_det["blocked"] = self.matrix_per_det["csr"]
+        cur = "auto" if engine == "auto" else requested
+        need = self.predict(B, "csr" if cur == "auto" else cur)
+        if cur == "auto" or need <= self.room:
+            self._predicted = max(self._predicted, need)
+            return engine
+        fits = [e for e in cands if self.predict(B, e) <= self.room]
+        new = min(fits, key=est.seconds) if fits else min(cands, key=lambda e: self.predict(B, e))
+        self._predicted = max(self._predicted, self.predict(B, new))
+        self._log(f"cycle {cycle}: engine {cur} needs ~{fmt_bytes(need)} > room {fmt_bytes(self.room)} "
+                  f"at B={B} -> {new} (~{fmt_bytes(self.predict(B, new))})"
+                  + ("" if fits else "; nothing fits, smallest footprint"))
+        return engine if new == cur else new
+
+    def keep_cache(self, cycle, B: int) -> bool:
+        """False (logged) when the amplitude cache pushes the selection of a B-determinant basis over the room."""
+        if not self.cache_per_det or self.room <= 0:
+            return True
+        need = self.scale * ((BASIS_BYTES + self.cache_per_det) * B + self._ext_bytes(B))
+        if need <= self.room:
+            return True
+        self._log(f"cycle {cycle}: amplitude cache ~{fmt_bytes(self.scale * self.cache_per_det * B)} puts the "
+                  f"selection at ~{fmt_bytes(need)} > room {fmt_bytes(self.room)} (B={B}); dropping it")
+        self.cache_per_det = 0.0
+        return False
+
+    def add_limit(self, cycle, B: int, add_max: int) -> int:
+        Bmax = self.max_basis()
+        if Bmax is None or B + add_max <= Bmax:
+            return add_max
+        n = max(0, Bmax - B)
+        self._log(f"cycle {cycle}: add_per_cycle {add_max} -> {n} (B={B}, max basis ~{Bmax} for "
+                  f"room {fmt_bytes(self.room)}, ext/det={self.ext_per_det or 0:.1f})")
+        return n
+
+    def prune_limit(self, cycle, B: int, prune: int) -> int:
+        Bmax = self.max_basis()
+        if Bmax is None or B <= min(prune, Bmax):
+            return prune
+        keep = max(self.min_basis, min(prune, Bmax))
+        if keep < min(prune, B):
+            self._log(f"cycle {cycle}: prune {B} -> {keep} determinants (CIPSIPrune={prune}, "
+                      f"max basis ~{Bmax} for room {fmt_bytes(self.room)})")
+        return keep
+
+    def solve_budget(self, B: int) -> int:
+        """Budget handed to --engine auto: what the basis leaves of the room."""
+        return int(max(0.0, self.room - self.scale * (BASIS_BYTES + self.cache_per_det) * B))
+
+    # ---- measurements --------------------------------------------------------
+    def observe_selection(self, B: int, n_ext: int) -> None:
+        self.ext_per_det = n_ext / max(B, 1)
+
+    def observe_cache(self, B: int, nbytes: int) -> None:
+        self.cache_per_det = nbytes / max(B, 1)
+
+    def sample(self, phase: str, metrics=None) -> Optional[int]:
+        rss = current_rss()
+        if rss is not None and metrics is not None:
+            metrics.set(f"rss_{phase}", rss)
+        return rss
+
+    def end_cycle(self, cycle, B: int, metrics=None) -> None:
+        """Compare the cycle's measured peak with the prediction; rescale the model if it overshot."""
+        peak = peak_rss() or 0
+        grown = peak > self._peak_seen
+        self._peak_seen = max(self._peak_seen, peak)
+        if not self._calibrated:
+            # first cycle: lazily imported SciPy/Numba and JIT code stay resident → part of the baseline
+            self._calibrated = True
+            self.baseline = max(self.baseline, (current_rss() or 0) - int(self.scale * BASIS_BYTES * B))
+        elif grown and self._predicted > CALIBRATE_MIN:
+            ratio = (peak - self.baseline) / self._predicted
+            if ratio > 1.0:
+                self.scale = min(self.scale * ratio, 4.0)
+                self._log(f"cycle {cycle}: measured peak {fmt_bytes(peak)} above model; scale -> {self.scale:.2f}")
+        if metrics is not None:
+            metrics.set("rss_peak", peak); metrics.set("mem_scale", self.scale)
+        Bmax = self.max_basis()
+        print(f"[Mem] cycle {cycle}: rss={fmt_bytes(current_rss() or 0)} peak={fmt_bytes(peak)} "
+              f"predicted={fmt_bytes(self.baseline + self._predicted)} budget={fmt_bytes(self.budget)} "
+              f"B={B} max_basis~{Bmax if Bmax is not None else '-'}")
+        self._predicted = 0.0
+
+    def describe(self) -> str:
+        return (f"budget={fmt_bytes(self.budget)} headroom={self.headroom:.0%} baseline={fmt_bytes(self.baseline)} "
+                f"selection={self.selection}")
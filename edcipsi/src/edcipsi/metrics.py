@@ -0,0 +1,84 @@
+from __future__ import annotations
+import json, time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Optional
+
+class Metrics:
+    """Per-cycle phase timers and counters written as one JSON line per cycle.
+
+    Phase times accumulate under "t_<phase>" (seconds), counters under their
+    own name; end_cycle() flushes the current record and starts a new one.
+    A disabled instance (enabled=False or path=None) turns every call into a no-op.
+    With a threads.ThreadControl attached, phase() also switches to that phase's
+    thread counts (even when disabled).
+    """
+    def __init__(self, path: Optional[str] = None, enabled: bool = True, threads=None):
+        self.enabled = bool(enabled and path)
+        self.path = path
+        self.threads = threads
+        self._f = open(path, "w", encoding="utf-8") if self.enabled else None
+        self._rec: Dict[str, Any] = {}
+        self._t0 = time.perf_counter()
+        self._tc = self._t0
+
+    @contextmanager
+    def _timed(self, key: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._rec[key] = self._rec.get(key, 0.0) + (time.perf_counter() - t0)
+
+    def phase(self, name: str):
+        timed = self._timed("t_" + name) if self.enabled else nullcontext()
+        if self.threads is None:
+            return timed
+        return _stacked(self.threads.phase(name), timed)
+
+    def add(self, name: str, n: int | float = 1) -> None:
+        if self.enabled:
+            self._rec[name] = self._rec.get(name, 0) + n
+
+    def set(self, name: str, value: Any) -> None:
+        if self.enabled:
+            self._rec[name] = value
+
+    def update(self, stats: Dict[str, Any]) -> None:
+        if self.enabled:
+            for k, v in stats.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    self.add(k, v)
+                else:
+                    self.set(k, v)
+
+    def end_cycle(self, cycle, **fields) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        rec = {"cycle": cycle, "t_cycle": now - self._tc, "t_elapsed": now - self._t0}
+        rec.update(fields)
+        rec.update(self._rec)
+        self._f.write(json.dumps(rec, default=_json_default) + "\n")
+        self._f.flush()
+        self._rec = {}
+        self._tc = now
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+@contextmanager
+def _stacked(outer, inner):
+    with outer, inner:
+        yield
+
+def _json_default(o):
+    if isinstance(o, complex):
+        return [o.real, o.imag]
+    try:
+        return o.item()  # numpy scalars
+    except Exception:
+        return str(o)
+
+NULL_METRICS = Metrics(enabled=False)
@@ -1,112 +1,76 @@
 from __future__ import annotations
+import os
+from importlib.util import find_spec
 import numpy as np
 
 # ---- Numba Availability ------------------------------------------------------
-try:
-    import numba as nb
-    NUMBA_OK = True
-except Exception:
-    nb = None  # type: ignore
-    NUMBA_OK = False
+# numba itself is imported lazily: the kernels live in _nbimpl and are loaded on
+# first attribute access, so startup, --help and parse errors never pay for it.
+NUMBA_OK = find_spec("numba") is not None
 
-# ---- Kernels (Numba or Stubs) -----------------------------------------------
-if NUMBA_OK:
-    @nb.njit(cache=True)
-    def _diag_energy_bit_nb(bit, di, dsi, dk, dsk, dcr, dci):
-        e_real = 0.0
-        e_imag = 0.0
-        L = di.shape[0]
-        for t in range(L):
-            ui = (bit >> di[t]) & 1
-            uk = (bit >> dk[t]) & 1
-            n_i = ui if dsi[t] == 0 else (1 - ui)
-            n_k = uk if dsk[t] == 0 else (1 - uk)
-            prod = n_i * n_k
-            e_real += dcr[t] * prod
-            e_imag += dci[t] * prod
-        return e_real, e_imag
+# ---- Kernels (lazy) ----------------------------------------------------------
+KERNELS = ("_h_matvec_nb", "_h_matvec_nb_par", "_h_matvec_nb_real", "_h_matvec_nb_real_par",
+           "_hash_build_nb", "_h_matvec_nb_hash", "_h_matvec_nb_real_hash",
+           "_csr_matvec_nb", "_csr_herm_matvec_nb", "_csr_herm_matvec_nb_par", "_csr_count_nb", "_csr_fill_nb", "_csr_fill_nb_real",
+           "_sector_states_nb", "_sector_matvec_nb", "_sector_matvec_nb_real")
 
-    @nb.njit(cache=True)
-    def _apply_local_nb(bit, site, s_from, s_to):
-        up = (bit >> site) & 1
-        if s_to == s_from:
-            n = up if s_to == 0 else (1 - up)
-            return (1 if n != 0 else 0), bit
-        need_up = 1 if s_from == 0 else 0
-        if up != need_up:
-            return 0, bit
-        set_up = 1 if s_to == 0 else 0
-        newbit = (bit | (1 << site)) if set_up == 1 else (bit & ~(1 << site))
-        return 1, newbit
+def default_cache_dir() -> str:
+    """Numba on-disk cache shared by all runs (and nodes, if on a shared filesystem)."""
+    base = os.environ.get("EDCIPSI_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "edcipsi")
+    return os.path.join(base, "numba")
 
-    @nb.njit(cache=True)
-    def _binsearch(sorted_bits, target):
-        lo = 0
-        hi = sorted_bits.shape[0]
-        while lo < hi:
-            mid = (lo + hi) // 2
-            v = sorted_bits[mid]
-            if v < target:
-                lo = mid + 1
-            else:
-                hi = mid
-        if lo < sorted_bits.shape[0] and sorted_bits[lo] == target:
-            return lo
-        return -1
+_impl = None
+_load_hook = None
 
-    @nb.njit(cache=True)
-    def _h_matvec_nb(xr, xi, basis_bits, sorted_bits, invperm,
-                     di, dsi, dk, dsk, dcr, dci,
-                     bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci):
-        B = basis_bits.shape[0]
-        yr = np.zeros(B, dtype=np.float64)
-        yi = np.zeros(B, dtype=np.float64)
-
-        # diagonal part
-        for i in range(B):
-            b = basis_bits[i]
-            de_r, de_i = _diag_energy_bit_nb(b, di, dsi, dk, dsk, dcr, dci)
-            xr_i = xr[i]; xi_i = xi[i]
-            yr[i] += de_r * xr_i - de_i * xi_i
-            yi[i] += de_r * xi_i + de_i * xr_i
+def set_load_hook(fn) -> None:
+    """Call fn(numba) once the kernels load (right away if they already have); one hook, the latest wins."""
+    global _load_hook
+    if _impl is not None:
+        _load_hook = None
+        fn(_impl.nb)
+    else:
+        _load_hook = fn
 
-        # off-diagonal part
-        T = bi.shape[0]
-        for i in range(B):
-            b = basis_bits[i]
-            xr_i = xr[i]; xi_i = xi[i]
-            for t in range(T):
-                ok1, s1 = _apply_local_nb(b, bk[t], bsl[t], bsk[t])
-                if ok1 == 0:
-                    continue
-                ok2, s2 = _apply_local_nb(s1, bi[t], bsj[t], bsi[t])
-                if ok2 == 0:
-                    continue
-                pos = _binsearch(sorted_bits, s2)
-                if pos < 0:
-                    continue
-                j = invperm[pos]
-                cr = bcr[t]; ci = bci[t]
-                yr[j] += cr * xr_i - ci * xi_i
-                yi[j] += cr * xi_i + ci * xr_i
+def load_kernels():
+    """Import numba + _nbimpl once (NUMBA_CACHE_DIR defaults to default_cache_dir())."""
+    global _impl, NUMBA_OK, _load_hook
+    if _impl is None and NUMBA_OK:
+        os.environ.setdefault("NUMBA_CACHE_DIR", default_cache_dir())
+        try:
+            from . import _nbimpl
+            _impl = _nbimpl
+        except Exception:
+            NUMBA_OK = False
+        else:
+            hook, _load_hook = _load_hook, None
+            if hook is not None:
+                hook(_impl.nb)
+    return _impl
 
-        return yr, yi
+def _unavailable(*args, **kwargs):
+    # ---- Numbaが無い場合：インポートだけ通すスタブ ----
+    raise RuntimeError("Numba acceleration is unavailable (NUMBA_OK=False).")
 
-    # 並列要求が来ても、ここでは安全にシリアル関数を使う（原子加算なしで簡潔に）
-    def _h_matvec_nb_par(xr, xi, basis_bits, sorted_bits, invperm,
-                         di, dsi, dk, dsk, dcr, dci,
-                         bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci):
-        return _h_matvec_nb(xr, xi, basis_bits, sorted_bits, invperm,
-                            di, dsi, dk, dsk, dcr, dci,
-                            bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci)
+def __getattr__(name):
+    if name in KERNELS:
+        impl = load_kernels()
+        return getattr(impl, name) if impl is not None else _unavailable
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-else:
-    # ---- Numbaが無い場合：インポートだけ通すスタブ ----
-    def _h_matvec_nb(*args, **kwargs):
-        raise RuntimeError("Numba acceleration is unavailable (NUMBA_OK=False).")
+def nnz_row_bounds(indptr, parts: int) -> np.ndarray:
+    """Row boundaries splitting a CSR matrix into `parts` pieces of ~equal nnz."""
+    n = indptr.shape[0] - 1
+    parts = max(1, min(int(parts), n))
+    marks = np.linspace(0, indptr[-1], parts + 1)
+    b = np.searchsorted(indptr, marks, side="left").astype(np.int64)
+    b[0] = 0; b[-1] = n
+    return np.maximum.accumulate(b)
 
-    def _h_matvec_nb_par(*args, **kwargs):
-        raise RuntimeError("Numba acceleration is unavailable (NUMBA_OK=False).")
+def num_threads() -> int:
+    if load_kernels() is None:
+        return 1
+    return _impl.nb.get_num_threads()
 
 # ---- Packing helpers (Numbaの有無に関係なく使用) ----------------------------
 def pack_terms_arrays(diag_terms, bilinear_terms):
@@ -125,10 +89,11 @@ def pack_terms_arrays(diag_terms, bilinear_terms):
         dcr = vals.real.astype(np.float64, copy=False)
         dci = vals.imag.astype(np.float64, copy=False)
 
-    # bilinear
+    # bilinear (bh=1: the term also applies its Hermitian conjugate, see io.canonicalize_terms)
     if len(bilinear_terms) == 0:
         bi = bsi = bj = bsj = bk = bsk = bl = bsl = np.empty(0, dtype=np.int32)
         bcr = bci = np.empty(0, dtype=np.float64)
+        bh = np.empty(0, dtype=np.int8)
     else:
         T = len(bilinear_terms)
         bi  = np.empty(T, dtype=np.int32)
@@ -141,8 +106,9 @@ def pack_terms_arrays(diag_terms, bilinear_terms):
         bsl = np.empty(T, dtype=np.int32)
         bcr = np.empty(T, dtype=np.float64)
         bci = np.empty(T, dtype=np.float64)
+        bh  = np.zeros(T, dtype=np.int8)
         for t, row in enumerate(bilinear_terms):
-            # row = (ii,si,jj,sj, kk,sk,ll,sl, c)
+            # row = (ii,si,jj,sj, kk,sk,ll,sl, c[, herm])
             bi[t]  = int(row[0]); bsi[t] = int(row[1])
             bj[t]  = int(row[2]); bsj[t] = int(row[3])
             bk[t]  = int(row[4]); bsk[t] = int(row[5])
@@ -150,4 +116,6 @@ def pack_terms_arrays(diag_terms, bilinear_terms):
             c = row[8]
             bcr[t] = float(np.real(c))
             bci[t] = float(np.imag(c))
-    return di, dsi, dk, dsk, dcr, dci, bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci
+            if len(row) > 9 and row[9]:
+                bh[t] = 1
+    return di, dsi, dk, dsk, dcr, dci, bi, bsi, bj, bsj, bk, bsk, bl, bsl, bcr, bci, bh
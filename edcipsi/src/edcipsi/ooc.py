@@ -0,0 +1,177 @@
+"""Out-of-core (disk-backed) CSR Hamiltonian.
+
+indptr (int64), indices (int32) and data live in raw files under a scratch
+directory and are opened as np.memmap. The builder generates the
+Hermitian-closed terms (hbuilder.hermitian_terms) row block by row block (with
+Numba: the count/fill CSR kernels of hbuilder.csr_rows_nb, else vectorized COO
+pieces over a process pool) and appends each finished block, so only one block
+is ever held in RAM.
+MemmapCSR streams row chunks of ~chunk_nnz entries through matvec; the next
+chunk is read by a background thread while the current one is multiplied.
+Point --ooc-dir at fast node-local storage (NVMe); the page cache does the rest.
+"""
+from __future__ import annotations
+import os, shutil, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import LinearOperator
+from .hbuilder import hermitian_terms, _coo_block_packed, _build_range_block_shm, _PACKED_KEYS, csr_rows_nb, nb_build_ok
+from . import nbkernels as nbk
+from .nbkernels import pack_terms_arrays
+from .io import hamiltonian_dtype
+from .shm import SharedArrays, take_arrays, discard_segment, process_pool
+from .utils import fmt_bytes
+
+CHUNK_NNZ = 1 << 22   # entries per streamed row chunk (~48 MiB complex)
+
+class MemmapCSR:
+    """Read-only CSR matrix backed by memmapped files in `path` (see build_csr_memmap)."""
+    def __init__(self, path: str, shape, dtype, nnz: int, chunk_nnz: int = CHUNK_NNZ, owner: bool = True):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.nnz = int(nnz)
+        self.owner = owner
+        B = self.shape[0]
+        self.indptr = np.memmap(os.path.join(path, "indptr.bin"), dtype=np.int64, mode="r", shape=(B+1,))
+        if self.nnz:
+            self.indices = np.memmap(os.path.join(path, "indices.bin"), dtype=np.int32, mode="r", shape=(self.nnz,))
+            self.data = np.memmap(os.path.join(path, "data.bin"), dtype=self.dtype, mode="r", shape=(self.nnz,))
+        else:
+            self.indices = np.empty(0, np.int32); self.data = np.empty(0, self.dtype)
+        # row chunk boundaries with roughly chunk_nnz entries each
+        ip = np.asarray(self.indptr)
+        marks = np.arange(0, self.nnz, max(1, int(chunk_nnz)), dtype=np.int64)
+        cuts = np.unique(np.concatenate(([0], np.searchsorted(ip, marks, side="right") - 1, [B])))
+        self.chunks = [(int(a), int(b)) for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.nnz * (4 + self.dtype.itemsize)
+
+    def _load(self, k: int):
+        r0, r1 = self.chunks[k]
+        a, b = int(self.indptr[r0]), int(self.indptr[r1])
+        ip = np.array(self.indptr[r0:r1+1]) - a
+        # np.array copies → forces the read here, in the read-ahead thread
+        return r0, r1, ip, np.array(self.indices[a:b]), np.array(self.data[a:b])
+
+    def matvec(self, x):
+        x = np.asarray(x).reshape(-1)
+        y = np.zeros(self.shape[0], dtype=np.result_type(self.dtype, x.dtype))
+        if not self.chunks:
+            return y
+        nxt = self._pool.submit(self._load, 0)
+        for k in range(len(self.chunks)):
+            r0, r1, ip, idx, dat = nxt.result()
+            if k + 1 < len(self.chunks):
+                nxt = self._pool.submit(self._load, k + 1)
+            y[r0:r1] = csr_matrix((dat, idx, ip), shape=(r1 - r0, self.shape[1]), copy=False) @ x
+        return y
+
+    def __matmul__(self, x):
+        return self.matvec(x)
+
+    def as_linear_operator(self, metrics=None) -> LinearOperator:
+        def _mv(x):
+            if metrics is not None:
+                metrics.add("matvecs")
+            return self.matvec(x)
+        return LinearOperator(self.shape, matvec=_mv, dtype=self.dtype)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self.indptr = self.indices = self.data = None
+        if self.owner and self.path and os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _iter_row_blocks(basis_arr, packed, ranges, real, procs, nb_build=True):
+    """Yield (lo, hi, csr block of rows [lo,hi)) of the Hermitian-closed terms, in block order.
+
+    COO pieces are generated as columns [lo,hi) and transposed+conjugated: for
+    Hermitian-closed terms row i is conj(column i).
+    """
+    order = np.argsort(basis_arr, kind="stable")
+    sorted_bits = basis_arr[order]
+    B = basis_arr.size
+    if nb_build_ok(nb_build):
+        for (lo, hi) in ranges:
+            ip, idx, dat = csr_rows_nb(lo, hi, basis_arr, sorted_bits, order, packed, real)
+            yield lo, hi, csr_matrix((dat, idx, ip), shape=(hi - lo, B), copy=False)
+        return
+    def _rowwise(lo, hi, r, c, d):
+        blk = csr_matrix(((d if real else d.conj()), (c - lo, r)), shape=(hi - lo, B))  # sums duplicates
+        blk.eliminate_zeros(); blk.sort_indices()
+        return lo, hi, blk
+    if not procs or len(ranges) < 2:
+        for (lo, hi) in ranges:
+            r, c, d = _coo_block_packed(lo, hi, basis_arr, sorted_bits, order, packed, real=real)
+            yield _rowwise(lo, hi, r, c, d)
+        return
+    arrays = {"basis": basis_arr, "sorted_bits": sorted_bits, "order": order}
+    arrays.update(zip(_PACKED_KEYS, packed))
+    with SharedArrays(arrays) as sa, process_pool(procs) as ex:
+        # keep at most 2*procs blocks in flight so finished pieces do not pile up in /dev/shm
+        pending = {}; nxt = 0
+        try:
+            for k in range(len(ranges)):
+                while nxt < len(ranges) and nxt < k + 2 * procs:
+                    lo, hi = ranges[nxt]
+                    pending[nxt] = ex.submit(_build_range_block_shm, lo, hi, sa.spec, real)
+                    nxt += 1
+                (name, layout), n = pending.pop(k).result()
+                r, c, d = take_arrays(name, layout)
+                yield _rowwise(*ranges[k], r, c, d)
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+            for f in pending.values():
+                if f.done() and not f.cancelled() and f.exception() is None:
+                    discard_segment(f.result()[0][0])
+
+def build_csr_memmap(basis_bits, N, diag_terms, bilinear_terms, directory: Optional[str] = None,
+                     block_size: int = 4096, procs: int = 0, chunk_nnz: int = CHUNK_NNZ,
+                     verbose: bool = True, nb_build: bool = True) -> MemmapCSR:
+    """Assemble (H + H^H)/2 into memmapped CSR files under a fresh subdirectory of `directory`."""
+    dtype = np.dtype(hamiltonian_dtype(diag_terms, bilinear_terms))
+    real = dtype == np.float64
+    diag_h, bil_h = hermitian_terms(diag_terms, bilinear_terms)
+    packed = pack_terms_arrays(diag_h, bil_h)
+    basis_arr = np.array(basis_bits, dtype=np.int64)
+    B = basis_arr.size
+    ranges = [(s, min(s+block_size, B)) for s in range(0, B, block_size)]
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    path = tempfile.mkdtemp(prefix="edcipsi_ooc_", dir=directory)
+    if verbose:
+        how = f"numba threads={nbk.num_threads()}" if nb_build_ok(nb_build) else f"procs={procs}"
+        print(f"[OOC] Building memmap CSR: B={B}, blocks={len(ranges)}, block_size={block_size}, "
+              f"{how}, dir={path}")
+    indptr = np.memmap(os.path.join(path, "indptr.bin"), dtype=np.int64, mode="w+", shape=(B+1,))
+    indptr[0] = 0
+    nnz = 0
+    try:
+        with open(os.path.join(path, "indices.bin"), "wb") as fi, open(os.path.join(path, "data.bin"), "wb") as fd:
+            for (lo, hi, blk) in _iter_row_blocks(basis_arr, packed, ranges, real, procs, nb_build):
+                fi.write(np.ascontiguousarray(blk.indices, dtype=np.int32).tobytes())
+                fd.write(np.ascontiguousarray(blk.data, dtype=dtype).tobytes())
+                indptr[lo+1:hi+1] = nnz + blk.indptr[1:]
+                nnz += int(blk.nnz)
+        indptr.flush()
+        del indptr
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    M = MemmapCSR(path, (B, B), dtype, nnz, chunk_nnz=chunk_nnz)
+    if verbose:
+        print(f"[OOC] nnz={nnz} on disk={fmt_bytes(M.nbytes)} chunks={len(M.chunks)}")
+    return M
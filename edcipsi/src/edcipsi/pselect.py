@@ -0,0 +1,159 @@
+"""Hash-partitioned multi-process CIPSI selection (single node, shared memory).
+
+Phase 1: each worker takes a slice of the basis, generates the connected
+determinants with their amplitude contributions, pre-reduces them and routes
+every target bitstring to owner = hash(bit) % P inside one shared segment.
+Phase 2: owner o gathers its routed pieces from all slices, reduces M, drops
+internal determinants, scores |M|^2/|E-H_aa| and returns its local top-K.
+The parent only merges P short top-K lists, so no process ever holds all of M.
+"""
+from __future__ import annotations
+from typing import List
+import numpy as np
+from .basis import diag_energy_vec
+from .termtable import TermTable
+from .nbkernels import pack_terms_arrays
+from .shm import SharedArrays, attach_arrays, detach, export_arrays, view_exported, discard_segment, process_pool
+
+_HASH_MUL = np.uint64(0x9E3779B97F4A7C15)  # Fibonacci hashing
+
+_KEYS = ("di","dsi","dk","dsk","dcr","dci", "bi","bsi","bj","bsj","bk","bsk","bl","bsl","bcr","bci","bh")
+
+def owner_of(bits: np.ndarray, nparts: int) -> np.ndarray:
+    h = bits.astype(np.uint64) * _HASH_MUL
+    return ((h >> np.uint64(32)) % np.uint64(nparts)).astype(np.int64)
+
+def _reduce_by_bit(tgt, ar, ai):
+    u, inv = np.unique(tgt, return_inverse=True)
+    return (u, np.bincount(inv, weights=ar, minlength=u.size),
+               np.bincount(inv, weights=ai, minlength=u.size))
+
+def generate_slice(bits, coeffs, packed, hb_gamma=None, max_abs_coeff=None, stats=None, table=None):
+    """Vectorized connected_amplitudes over one basis slice → (target bits, Re M, Im M), reduced."""
+    table = table or TermTable.from_packed(packed)
+    real = not np.iscomplexobj(coeffs) and table.real
+    abs_c = np.abs(coeffs)
+    keep = abs_c >= 1e-16
+    if hb_gamma is not None and max_abs_coeff and max_abs_coeff > 0:
+        keep &= abs_c >= hb_gamma / max_abs_coeff
+    bits = bits[keep]; coeffs = coeffs[keep]; abs_c = abs_c[keep]
+    r, tgt, val = table.connections(bits, abs_c, hb_gamma)
+    if stats is not None:
+        stats["terms_tried"] = stats.get("terms_tried", 0) + table.n_tried(abs_c, hb_gamma)
+        stats["terms_hit"] = stats.get("terms_hit", 0) + int(r.size)
+    if not r.size:
+        return np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.float64)
+    amp = val * coeffs[r]
+    if real:
+        u, inv = np.unique(tgt, return_inverse=True)
+        return u, np.bincount(inv, weights=amp, minlength=u.size), np.zeros(u.size)
+    return _reduce_by_bit(tgt, amp.real.copy(), amp.imag.copy())
+
+def _gen_worker(lo:int, hi:int, spec, nparts:int, hb_gamma, max_abs_coeff):
+    shms, a = attach_arrays(spec)
+    try:
+        packed = tuple(a[k] for k in _KEYS)
+        coeffs = a["cr"][lo:hi] + 1j * a["ci"][lo:hi] if "ci" in a else a["cr"][lo:hi]
+        stats = {}
+        u, mr, mi = generate_slice(a["basis"][lo:hi], coeffs, packed, hb_gamma, max_abs_coeff, stats=stats)
+    finally:
+        del a
+        detach(shms)
+    own = owner_of(u, nparts)
+    order = np.argsort(own, kind="stable")
+    counts = np.bincount(own, minlength=nparts)
+    name, layout = export_arrays(u[order], mr[order], mi[order])
+    return name, layout, counts.tolist(), int(u.size), stats
+
+def _owner_worker(pieces, spec, E, eps, delta, k, level_shift=0.0):
+    """pieces: [(segment name, layout, offset, count)] routed to this owner."""
+    tg = []; ar = []; ai = []
+    for (name, layout, off, n) in pieces:
+        if n == 0: continue
+        shm, (u, mr, mi) = view_exported(name, layout)
+        try:
+            tg.append(u[off:off+n].copy()); ar.append(mr[off:off+n].copy()); ai.append(mi[off:off+n].copy())
+        finally:
+            del u, mr, mi
+            shm.close()
+    if not tg:
+        return np.empty(0, np.float64), np.empty(0, np.int64), 0, 0, 0.0, 0.0, np.empty(0, np.float64)
+    u, mr, mi = _reduce_by_bit(np.concatenate(tg), np.concatenate(ar), np.concatenate(ai))
+    shms, a = attach_arrays(spec)
+    try:
+        sb = a["sorted_bits"]
+        if sb.size:
+            pos = np.searchsorted(sb, u); pos[pos >= sb.size] = 0
+            ext = sb[pos] != u
+            u, mr, mi = u[ext], mr[ext], mi[ext]
+        haa = diag_energy_vec(u, *(a[key] for key in _KEYS[:6]), real=not a["dci"].any())
+    finally:
+        del a
+        detach(shms)
+    n_ext = int(u.size)
+    m2 = mr*mr + mi*mi
+    den = E - haa
+    w = m2 / np.maximum(np.abs(den), delta)
+    if level_shift:
+        den = den + np.where(den.real >= 0, level_shift, -level_shift)
+    e2 = np.zeros(u.size)
+    nz = np.abs(den) >= 1e-16
+    e2[nz] = np.real(m2[nz] / den[nz])
+    pt2 = float(e2.sum())
+    sel = np.nonzero(w >= eps)[0]
+    n_cand = int(sel.size)
+    if sel.size > k:
+        sel = sel[np.argpartition(-w[sel], k-1)[:k]]
+    return w[sel], u[sel], n_ext, n_cand, float(w.sum()), pt2, e2[sel]
+
+def select_new_configs_mp(E, basis_bits, coeffs, diag_terms, bilinear_terms, add_max:int, eps:float,
+                          procs:int, hb_gamma=None, max_abs_coeff=None, delta=1e-12, verbose=True,
+                          stats=None, growth=None, level_shift=0.0) -> List[int]:
+    """Drop-in for connected_amplitudes + select_new_configs using `procs` local processes."""
+    basis_arr = np.array(basis_bits, dtype=np.int64)
+    vec = np.asarray(coeffs)
+    arrays = {"basis": basis_arr, "sorted_bits": np.sort(basis_arr), "cr": np.ascontiguousarray(vec.real, dtype=np.float64)}
+    if np.iscomplexobj(vec):
+        arrays["ci"] = np.ascontiguousarray(vec.imag, dtype=np.float64)
+    arrays.update(zip(_KEYS, pack_terms_arrays(diag_terms, bilinear_terms)))
+    B = basis_arr.size
+    step = -(-B // procs) if B else 1
+    slices = [(s, min(s+step, B)) for s in range(0, B, step)]
+    gen_futs = []
+    with SharedArrays(arrays) as sa, process_pool(procs) as ex:
+        try:
+            gen_futs = [ex.submit(_gen_worker, lo, hi, sa.spec, procs, hb_gamma, max_abs_coeff) for (lo,hi) in slices]
+            gens = [f.result() for f in gen_futs]
+            routed = [[] for _ in range(procs)]
+            for (name, layout, counts, _, _) in gens:
+                off = 0
+                for o, n in enumerate(counts):
+                    routed[o].append((name, layout, off, n)); off += n
+            futs = [ex.submit(_owner_worker, routed[o], sa.spec, E, eps, delta, add_max, level_shift)
+                    for o in range(procs)]
+            tops = [f.result() for f in futs]
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+            for f in gen_futs:
+                if f.done() and not f.cancelled() and f.exception() is None:
+                    discard_segment(f.result()[0])
+    n_gen = sum(g[3] for g in gens)
+    n_ext = sum(t[2] for t in tops)
+    w = np.concatenate([t[0] for t in tops]) if tops else np.empty(0)
+    bits = np.concatenate([t[1] for t in tops]) if tops else np.empty(0, np.int64)
+    e2 = np.concatenate([t[6] for t in tops]) if tops else np.empty(0)
+    order = np.argsort(-w, kind="stable")[:add_max]
+    if growth is not None:
+        n_add = growth.count(w[order], sum(t[4] for t in tops), add_max, B)
+        order = order[:n_add]
+    if stats is not None:
+        stats["terms_tried"] = stats.get("terms_tried", 0) + sum(g[4].get("terms_tried", 0) for g in gens)
+        stats["terms_hit"] = stats.get("terms_hit", 0) + sum(g[4].get("terms_hit", 0) for g in gens)
+        stats["external_routed"] = n_gen
+        stats["external"] = n_ext
+        stats["candidates"] = sum(t[3] for t in tops)
+        stats["pt2"] = sum(t[5] for t in tops)
+        stats["pt2_rest"] = stats["pt2"] - float(e2[order].sum())
+    if verbose:
+        print(f"[Select-MP] procs={procs} routed={n_gen} external={n_ext} picked={order.size}")
+    return [int(b) for b in bits[order]]
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from typing import Dict, List, Tuple
+import numpy as np
+from multiprocessing import shared_memory
+
+# (segment name, shape, dtype.str) — picklable description of one shared array
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+class SharedArrays:
+    """Copy a dict of ndarrays into shared memory once; workers attach by spec.
+
+    The owner unlinks every segment on close(); workers only attach/detach.
+    """
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self._shms: List[shared_memory.SharedMemory] = []
+        self.spec: Dict[str, ArraySpec] = {}
+        try:
+            for key, a in arrays.items():
+                a = np.ascontiguousarray(a)
+                shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+                self._shms.append(shm)
+                np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+                self.spec[key] = (shm.name, a.shape, a.dtype.str)
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.size for s in self._shms)
+
+    def close(self) -> None:
+        for shm in self._shms:
+            try: shm.close()
+            except Exception: pass
+            try: shm.unlink()
+            except FileNotFoundError: pass
+        self._shms = []
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+_WORKER_MODULES = ["numpy", "edcipsi.shm", "edcipsi.threads", "edcipsi.hbuilder", "edcipsi.pselect", "edcipsi.ooc"]
+
+def process_pool(max_workers: int):
+    """ProcessPoolExecutor for the shared-memory workers, started from a forkserver.
+
+    Plain fork() of a process whose Numba thread pool is already running (any
+    parallel kernel, numba.get_num_threads()) leaves the parent hanging at exit.
+    Each worker runs with threads.worker_threads() BLAS/Numba threads.
+    """
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
+    from .threads import init_worker, worker_threads
+    init = dict(initializer=init_worker, initargs=(worker_threads(),))
+    if "forkserver" not in mp.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=max_workers, **init)
+    ctx = mp.get_context("forkserver")
+    ctx.set_forkserver_preload(_WORKER_MODULES)
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, **init)
+
+def attach_arrays(spec: Dict[str, ArraySpec]):
+    """Zero-copy views onto segments described by `spec`. Keep `shms` alive while using the views."""
+    shms = []; out = {}
+    for key, (name, shape, dt) in spec.items():
+        shm = shared_memory.SharedMemory(name=name)
+        shms.append(shm)
+        out[key] = np.ndarray(shape, dtype=np.dtype(dt), buffer=shm.buf)
+    return shms, out
+
+def detach(shms) -> None:
+    for shm in shms:
+        try: shm.close()
+        except Exception: pass
+
+def export_arrays(*arrays: np.ndarray):
+    """Worker side: pack result arrays back-to-back into one new segment.
+
+    Returns (segment name, [(shape, dtype.str), ...]); the receiver must call take_arrays().
+    """
+    arrays = [np.ascontiguousarray(a) for a in arrays]
+    total = sum(a.nbytes for a in arrays)
+    shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+    off = 0; layout = []
+    for a in arrays:
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf, offset=off)[...] = a
+        layout.append((a.shape, a.dtype.str))
+        off += a.nbytes
+    name = shm.name
+    shm.close()
+    return name, layout
+
+def take_arrays(name: str, layout, outs=None):
+    """Receiver side of export_arrays(): copy out (or into `outs`), then unlink the segment."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        off = 0; res = []
+        for n, (shape, dt) in enumerate(layout):
+            dt = np.dtype(dt)
+            view = np.ndarray(shape, dtype=dt, buffer=shm.buf, offset=off)
+            if outs is not None and outs[n] is not None:
+                outs[n][...] = view
+                res.append(outs[n])
+            else:
+                res.append(view.copy())
+            off += view.nbytes
+            del view
+        return res
+    finally:
+        shm.close()
+        shm.unlink()
+
+def view_exported(name: str, layout):
+    """Attach to an export_arrays() segment without consuming it → (shm, [views]). Caller detaches."""
+    shm = shared_memory.SharedMemory(name=name)
+    off = 0; views = []
+    for shape, dt in layout:
+        v = np.ndarray(shape, dtype=np.dtype(dt), buffer=shm.buf, offset=off)
+        views.append(v)
+        off += v.nbytes
+    return shm, views
+
+def discard_segment(name: str) -> None:
+    """Unlink a segment produced by export_arrays() without reading it."""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
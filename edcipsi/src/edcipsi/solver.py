@@ -1,44 +1,195 @@
 from __future__ import annotations
 import numpy as np
-from scipy.sparse.linalg import eigsh, LinearOperator
-from .hbuilder import build_subspace_matrix, build_subspace_matrix_blocked
-from .nbkernels import NUMBA_OK, _h_matvec_nb, _h_matvec_nb_par, pack_terms_arrays  # type: ignore
+from .hbuilder import build_subspace_matrix, build_subspace_matrix_blocked, HermitianCSR
+from . import nbkernels as nbk
+from .nbkernels import pack_terms_arrays, nnz_row_bounds, num_threads
+from .io import hamiltonian_dtype
+from .engine import choose_engine
+from .utils import fmt_bytes
+from .metrics import NULL_METRICS
 
-def lowest_eigpair(H):
-    w, v = eigsh(H, k=1, which='SA', tol=1e-8, maxiter=5000)
+def csr_operator(H, metrics=None) -> LinearOperator:
+    """Assembled CSR (or HermitianCSR) → LinearOperator with the Numba multithreaded SpMV (rows split by nnz)."""
+    from scipy.sparse.linalg import LinearOperator
+    m = metrics or NULL_METRICS
+    if isinstance(H, HermitianCSR):
+        kern, A = nbk._csr_herm_matvec_nb_par, H.U
+    else:
+        kern, A = nbk._csr_matvec_nb, H
+    indptr, indices, data = A.indptr, A.indices, A.data
+    bounds = nnz_row_bounds(indptr, num_threads())
+    def _matvec(v):
+        m.add("matvecs")
+        x = np.asarray(v).reshape(-1)
+        x = np.ascontiguousarray(x, dtype=np.result_type(data.dtype, x.dtype))
+        return kern(indptr, indices, data, x, np.zeros(H.shape[0], dtype=x.dtype), bounds)
+    return LinearOperator(H.shape, matvec=_matvec, dtype=H.dtype)
+
+def as_operator(H, metrics=None, par_spmv=True):
+    """Assembled H (csr_matrix / HermitianCSR) → what eigsh/Lanczos should multiply with (matvecs counted)."""
+    from scipy.sparse.linalg import LinearOperator
+    m = metrics or NULL_METRICS
+    if par_spmv and nbk.NUMBA_OK and num_threads() > 1:
+        return csr_operator(H, metrics=m)
+    if isinstance(H, HermitianCSR):
+        A = H
+        def _herm(x):
+            m.add("matvecs"); return A.matvec(x)
+        return LinearOperator(A.shape, matvec=_herm, dtype=A.dtype)
+    if m.enabled:
+        # count H·x calls without touching the matrix itself
+        A = H
+        def _counted(x):
+            m.add("matvecs"); return A @ x
+        return LinearOperator(A.shape, matvec=_counted, dtype=A.dtype)
+    return H
+
+def lowest_eigpair(H, metrics=None, par_spmv=True):
+    """par_spmv: use the Numba parallel CSR matvec when Numba has more than one thread."""
+    from scipy.sparse.linalg import eigsh
+    m = metrics or NULL_METRICS
+    H = as_operator(H, metrics=m, par_spmv=par_spmv)
+    with m.phase("eigsh"):
+        w, v = eigsh(H, k=1, which='SA', tol=1e-8, maxiter=5000)
     return w[0], v[:,0]
 
-def solve_ground(basis, N, diag_terms, bilinear_terms,
-                 use_nb=False, use_nb_parallel=False,
-                 build_blocked=False, block_size=4096, build_procs=0):
-    """Numba LinearOperator → 失敗時CSRのフォールバック"""
-    if use_nb and NUMBA_OK:
-        (di,dsi,dk,dsk,dcr,dci, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci) = pack_terms_arrays(diag_terms, bilinear_terms)
-        basis_arr = np.array(basis, dtype=np.int64)
-        sort_idx = np.argsort(basis_arr)
-        sorted_bits = basis_arr[sort_idx]
-        invperm = np.empty_like(sort_idx); invperm[sort_idx] = np.arange(sort_idx.size)
+def hash_index(basis_arr):
+    """Open-addressing table (keys, vals, shift) of basis bits → index, >= 2B slots."""
+    log2size = max(4, int(basis_arr.size).bit_length() + 1)
+    keys, vals = nbk._hash_build_nb(basis_arr, log2size)
+    return keys, vals, 64 - log2size
+
+def matfree_operator(basis, diag_terms, bilinear_terms, parallel=False, metrics=None, lookup="bsearch"):
+    """Numba matrix-free H·x on `basis` as a LinearOperator (complex x on a real H is split into Re/Im).
+
+    lookup: 'bsearch' (sorted bits + binary search) or 'hash' (open-addressing table, O(1) probes)."""
+    from scipy.sparse.linalg import LinearOperator
+    m = metrics or NULL_METRICS
+    dtype = hamiltonian_dtype(diag_terms, bilinear_terms)
+    (di,dsi,dk,dsk,dcr,dci, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh) = pack_terms_arrays(diag_terms, bilinear_terms)
+    basis_arr = np.array(basis, dtype=np.int64)
+    if lookup == "hash":
+        keys, vals, shift = hash_index(basis_arr)
+        index = (keys, vals, shift)
+    else:
+        order = np.argsort(basis_arr)          # sorted position -> basis index
+        index = (basis_arr[order], order)
+    if dtype is np.float64:
+        if lookup == "hash":
+            kern = nbk._h_matvec_nb_real_hash
+        else:
+            kern = nbk._h_matvec_nb_real_par if parallel else nbk._h_matvec_nb_real
+        def _hx(x):
+            return kern(np.ascontiguousarray(x, dtype=np.float64), basis_arr, *index,
+                        di,dsi,dk,dsk,dcr,
+                        bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bh)
+        def _matvec(v):
+            m.add("matvecs")
+            v = np.asarray(v).reshape(-1)
+            return _hx(v.real) + 1j*_hx(v.imag) if np.iscomplexobj(v) else _hx(v)
+        op_dtype = np.float64
+    else:
+        if lookup == "hash":
+            kern = nbk._h_matvec_nb_hash
+        else:
+            kern = nbk._h_matvec_nb_par if parallel else nbk._h_matvec_nb
         def _matvec(v):
-            xr = np.asarray(v).real.astype(np.float64, copy=False)
-            xi = np.asarray(v).imag.astype(np.float64, copy=False)
-            if use_nb_parallel:
-                yr, yi = _h_matvec_nb_par(xr, xi, basis_arr, sorted_bits, invperm,
-                                          di,dsi,dk,dsk,dcr,dci,
-                                          bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci)
-            else:
-                yr, yi = _h_matvec_nb(xr, xi, basis_arr, sorted_bits, invperm,
-                                      di,dsi,dk,dsk,dcr,dci,
-                                      bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci)
+            m.add("matvecs")
+            v = np.asarray(v).reshape(-1)
+            xr = np.ascontiguousarray(v.real, dtype=np.float64)
+            xi = np.ascontiguousarray(v.imag, dtype=np.float64)
+            yr, yi = kern(xr, xi, basis_arr, *index,
+                          di,dsi,dk,dsk,dcr,dci,
+                          bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh)
             return yr + 1j*yi
-        Lop = LinearOperator((len(basis), len(basis)), matvec=_matvec, dtype=np.complex128)
+        op_dtype = np.complex128
+    return LinearOperator((basis_arr.size, basis_arr.size), matvec=_matvec, dtype=op_dtype)
+
+def hamiltonian_operator(basis, N, diag_terms, bilinear_terms, engine="csr", use_nb_parallel=False,
+                         block_size=4096, build_procs=0, metrics=None, ooc_dir=None,
+                         par_spmv=True, csr_half=False, nb_build=True, lookup="bsearch"):
+    """H on `basis` for a concrete engine ('matfree'|'csr'|'blocked'|'ooc') → (LinearOperator-like, close)."""
+    m = metrics or NULL_METRICS
+    if engine == "ooc":
+        from .ooc import build_csr_memmap
+        with m.phase("build"):
+            Hm = build_csr_memmap(basis, N, diag_terms, bilinear_terms, directory=ooc_dir,
+                                  block_size=block_size, procs=build_procs, verbose=True, nb_build=nb_build)
+        m.set("nnz", Hm.nnz)
+        return Hm.as_linear_operator(m), Hm.close
+    if engine == "matfree" and nbk.NUMBA_OK:
+        with m.phase("build"):
+            Lop = matfree_operator(basis, diag_terms, bilinear_terms, parallel=use_nb_parallel, metrics=m,
+                                   lookup=lookup)
+        return Lop, (lambda: None)
+    with m.phase("build"):
+        H = (build_subspace_matrix_blocked(basis, N, diag_terms, bilinear_terms, block_size=block_size,
+                                           procs=build_procs, verbose=True, nb_build=nb_build)
+             if engine == "blocked" else
+             build_subspace_matrix(basis, N, diag_terms, bilinear_terms, half=csr_half, block_size=block_size,
+                                   nb_build=nb_build))
+    m.set("nnz", int(H.nnz))
+    return as_operator(H, metrics=m, par_spmv=par_spmv), (lambda: None)
+
+def resolve_engine(engine, basis, diag_terms, bilinear_terms, mem_budget=None, build_procs=0, metrics=None):
+    """engine='auto' → concrete engine via the cost model in engine.py (decision is logged)."""
+    if engine != "auto":
+        return engine
+    eng, est, reason = choose_engine(basis, diag_terms, bilinear_terms, mem_budget,
+                                     procs=build_procs, numba_ok=nbk.NUMBA_OK)
+    budget = fmt_bytes(mem_budget) if mem_budget is not None else "none"
+    print(f"[Engine] auto -> {eng} ({reason}; budget={budget}) {est.describe()}")
+    m = metrics or NULL_METRICS
+    m.set("engine", eng); m.set("est_nnz", est.nnz)
+    # with --build-procs the in-memory CSR comes from the parallel blocked builder
+    return "blocked" if eng == "csr" and build_procs > 0 else eng
+
+def solve_ground(basis, N, diag_terms, bilinear_terms,
+                 use_nb=False, use_nb_parallel=False,
+                 build_blocked=False, block_size=4096, build_procs=0, metrics=None,
+                 engine=None, mem_budget=None, ooc_dir=None, par_spmv=True, csr_half=False, nb_build=True,
+                 lookup="bsearch"):
+    """Numba LinearOperator → 失敗時CSRのフォールバック
+
+    Realified terms (see io.realify_terms) select the float64 path end to end.
+    engine: None (legacy flags) | 'auto' | 'matfree' | 'csr' | 'blocked' | 'ooc'.
+    ooc_dir: scratch directory for the memmapped CSR of engine 'ooc' (default: system temp dir).
+    par_spmv: Numba multithreaded SpMV for assembled CSR (False → SciPy's serial matvec).
+    csr_half: store only the upper triangle of the directly assembled CSR (HermitianCSR).
+    nb_build: assemble CSR with the threaded Numba count/fill kernels (False → NumPy/process-pool builders).
+    lookup: basis index of the matrix-free matvec, 'bsearch' | 'hash' (see matfree_operator).
+    """
+    from scipy.sparse.linalg import eigsh
+    m = metrics or NULL_METRICS
+    if engine is not None:
+        engine = resolve_engine(engine, basis, diag_terms, bilinear_terms, mem_budget, build_procs, m)
+        use_nb = engine == "matfree"
+        build_blocked = engine == "blocked"
+    if engine == "ooc":
+        Hop, close = hamiltonian_operator(basis, N, diag_terms, bilinear_terms, "ooc", block_size=block_size,
+                                          build_procs=build_procs, metrics=m, ooc_dir=ooc_dir, nb_build=nb_build)
+        try:
+            with m.phase("eigsh"):
+                w, v = eigsh(Hop, k=1, which='SA', tol=1e-8, maxiter=5000)
+        finally:
+            close()
+        return w[0], v[:,0]
+    if use_nb and nbk.NUMBA_OK:
+        with m.phase("build"):
+            Lop = matfree_operator(basis, diag_terms, bilinear_terms, parallel=use_nb_parallel, metrics=m,
+                                   lookup=lookup)
         try:
-            w, v = eigsh(Lop, k=1, which='SA', tol=1e-8, maxiter=5000)
+            with m.phase("eigsh"):
+                w, v = eigsh(Lop, k=1, which='SA', tol=1e-8, maxiter=5000)
             return w[0], v[:,0]
         except Exception:
             pass
     # fallback CSR
-    H = (build_subspace_matrix_blocked(basis, N, diag_terms, bilinear_terms,
-                                       block_size=block_size, procs=build_procs, verbose=True)
-         if build_blocked else
-         build_subspace_matrix(basis, N, diag_terms, bilinear_terms))
-    return lowest_eigpair(H)
+    with m.phase("build"):
+        H = (build_subspace_matrix_blocked(basis, N, diag_terms, bilinear_terms, block_size=block_size,
+                                           procs=build_procs, verbose=True, nb_build=nb_build)
+             if build_blocked else
+             build_subspace_matrix(basis, N, diag_terms, bilinear_terms, half=csr_half, block_size=block_size,
+                                   nb_build=nb_build))
+    m.set("nnz", int(H.nnz))
+    return lowest_eigpair(H, metrics=m, par_spmv=par_spmv)
@@ -0,0 +1,132 @@
+"""Bilinear terms indexed by the occupation they need (Heat-Bath candidate generation).
+
+An operator direction (a canonical term, or the Hermitian partner of a flagged
+one) touches one or two sites and applies to a determinant b exactly when
+b & mask == want; the result is (b & ~mask) | out. Directions are grouped by
+mask (their sites), inside a group by `want`, so a determinant reads the
+occupation of each group once and only meets the directions that apply to it;
+impossible and diagonal (out == want) directions are dropped. Entries are kept
+in descending |c| inside each pattern and groups in descending max|c|, so the
+Heat-Bath cutoff |c_b|·|c| < Γ ends a pattern, and the whole scan, at the first
+entry / group below it. Generation is proportional to the connections made,
+not to determinants × terms.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .io import is_herm
+
+def _direction(ops) -> Optional[Tuple[int, int, int]]:
+    """[(site, s_from, s_to), ...] applied in order → (mask, want, out), or None if never applicable."""
+    req: Dict[int, int] = {}; cur: Dict[int, int] = {}
+    for (site, s_from, s_to) in ops:
+        need = 1 if s_from == 0 else 0          # bit set = up = spin 0
+        if site in cur:
+            if cur[site] != need:
+                return None
+        else:
+            req[site] = need
+        cur[site] = 1 if s_to == 0 else 0
+    mask = want = out = 0
+    for site in req:
+        mask |= 1 << site
+        want |= req[site] << site
+        out |= cur[site] << site
+    return mask, want, out
+
+class TermTable:
+    def __init__(self, bilinear_terms, real: Optional[bool] = None):
+        if real is None:
+            real = all(complex(t[8]).imag == 0 for t in bilinear_terms)
+        self.real = real
+        per_mask: Dict[int, Dict[int, list]] = {}
+        dir_abs = []
+        for t in bilinear_terms:
+            (ii,si,jj,sj, kk,sk,ll,sl, c) = t[:9]
+            c = complex(c)
+            dirs = [([(kk, sl, sk), (ii, sj, si)], c)]
+            if is_herm(t):
+                dirs.append(([(ii, si, sj), (kk, sk, sl)], c.conjugate()))
+            for ops, cd in dirs:
+                dir_abs.append(abs(cd))
+                d = _direction(ops)
+                if d is None or d[1] == d[2]:
+                    continue
+                mask, want, out = d
+                per_mask.setdefault(mask, {}).setdefault(want, []).append((abs(cd), out, cd.real if real else cd))
+        # |c| of every direction (as counted by terms_tried), ascending
+        self.dir_abs = np.sort(np.asarray(dir_abs, dtype=float))
+        # groups: (mask, max|c|, {want: [(|c|, out, c), ...] by descending |c|}), by descending max|c|
+        self.groups: List[tuple] = []
+        for mask, pats in per_mask.items():
+            for ent in pats.values():
+                ent.sort(key=lambda e: -e[0])
+            self.groups.append((mask, max(ent[0][0] for ent in pats.values()), pats))
+        self.groups.sort(key=lambda g: -g[1])
+        self.entries = sum(len(ent) for (_, _, pats) in self.groups for ent in pats.values())
+
+    @classmethod
+    def from_packed(cls, packed) -> "TermTable":
+        """From nbkernels.pack_terms_arrays output (what the selection workers receive)."""
+        (_,_,_,_,_,_, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh) = packed
+        terms = [(int(bi[t]), int(bsi[t]), int(bj[t]), int(bsj[t]), int(bk[t]), int(bsk[t]), int(bl[t]), int(bsl[t]),
+                  complex(bcr[t], bci[t]), bool(bh[t])) for t in range(bi.shape[0])]
+        return cls(terms, real=not bci.any())
+
+    def n_tried(self, abs_coeffs: np.ndarray, hb_gamma=None) -> int:
+        """Directions passing the Heat-Bath test (all of them without Γ) summed over |c_b| in abs_coeffs."""
+        if hb_gamma is None:
+            return int(abs_coeffs.size) * int(self.dir_abs.size)
+        return int((self.dir_abs.size - np.searchsorted(self.dir_abs, hb_gamma / abs_coeffs)).sum())
+
+    def apply(self, b: int, abs_cb: float = 0.0, hb_gamma=None):
+        """Off-diagonal connections of one determinant → [(target, c), ...] (|c_b|·|c| >= Γ with hb_gamma)."""
+        out = []
+        for (mask, cmax, pats) in self.groups:
+            if hb_gamma is not None and abs_cb * cmax < hb_gamma:
+                break
+            ent = pats.get(b & mask)
+            if ent is None:
+                continue
+            base = b & ~mask
+            for (a, o, c) in ent:
+                if hb_gamma is not None and abs_cb * a < hb_gamma:
+                    break
+                out.append((base | o, c))
+        return out
+
+    def connections(self, bits: np.ndarray, weight: Optional[np.ndarray] = None, hb_gamma=None):
+        """Vectorized apply over `bits` → (row index, target, coefficient) arrays.
+
+        weight (|c_b| per row) with hb_gamma keeps only the entries with weight·|c| >= Γ."""
+        rows = []; tgt = []; val = []
+        screen = hb_gamma is not None and weight is not None
+        wmax = float(weight.max()) if screen and weight.size else 0.0
+        for (mask, cmax, pats) in self.groups:
+            if screen and wmax * cmax < hb_gamma:
+                break
+            occ = bits & mask
+            for want, ent in pats.items():
+                r = np.flatnonzero(occ == want)
+                if screen and r.size:
+                    r = r[weight[r] * ent[0][0] >= hb_gamma]
+                if not r.size:
+                    continue
+                base = bits[r] & ~mask
+                for (a, o, c) in ent:
+                    if screen:
+                        r_ok = weight[r] * a >= hb_gamma
+                        if not r_ok.any():
+                            break
+                        rr, bb = r[r_ok], base[r_ok]
+                    else:
+                        rr, bb = r, base
+                    rows.append(rr); tgt.append(bb | o)
+                    val.append(np.full(rr.size, c, dtype=np.float64 if self.real else np.complex128))
+        if not rows:
+            return (np.empty(0, np.int64), np.empty(0, np.int64),
+                    np.empty(0, np.float64 if self.real else np.complex128))
+        return np.concatenate(rows), np.concatenate(tgt), np.concatenate(val)
+
+    def describe(self) -> str:
+        return f"{self.entries} directions in {len(self.groups)} site groups"
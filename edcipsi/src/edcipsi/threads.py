@@ -0,0 +1,174 @@
+"""Runtime thread control for BLAS, Numba and the worker process pools, per phase.
+
+OMP_NUM_THREADS & co. only take effect if they are set before NumPy loads its
+BLAS, so cli applies --threads to them first thing (early_env). After that BLAS
+is resized at runtime through threadpoolctl (optional dependency; without it
+the import-time count stays) and Numba through numba.set_num_threads.
+--phase-threads gives a phase its own count (e.g. a BLAS-heavy eigensolve vs a
+Numba-parallel selection); Metrics.phase() switches to it on entry and back on
+exit. Worker processes (--build-procs/--select-procs) run with --worker-threads each.
+Numba is never imported here: until the kernels load (nbkernels.load_kernels)
+the wanted count is only recorded, and applied and reported on load.
+"""
+from __future__ import annotations
+import os, sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+PHASES = ("build", "eigsh", "selection", "observables")
+# Metrics phase name → thread phase
+PHASE_OF = {"build": "build", "eigsh": "eigsh", "dynamics": "eigsh",
+            "selection": "selection", "amplitudes": "selection", "pt2": "selection", "prune": "selection",
+            "observables": "observables"}
+
+_worker_threads = 1
+
+def early_env(argv) -> Optional[int]:
+    """--threads N in argv → thread env vars; effective only while NumPy is not yet imported."""
+    n = None
+    for k, a in enumerate(argv):
+        if a == "--threads" and k + 1 < len(argv):
+            n = argv[k + 1]
+        elif a.startswith("--threads="):
+            n = a.split("=", 1)[1]
+    try:
+        n = int(n) if n is not None else None
+    except ValueError:
+        return None        # argparse reports it
+    if n and n > 0:
+        for v in THREAD_VARS:
+            os.environ[v] = str(n)
+    return n
+
+def parse_phase_threads(spec) -> Dict[str, int]:
+    """'eigsh=8,selection=4' → {'eigsh': 8, 'selection': 4}."""
+    out: Dict[str, int] = {}
+    for tok in str(spec or "").replace(" ", "").split(","):
+        if not tok:
+            continue
+        key, _, val = tok.partition("=")
+        key = {"select": "selection", "solve": "eigsh", "obs": "observables"}.get(key, key)
+        if key not in PHASES or not val:
+            raise ValueError(f"--phase-threads: expected PHASE=N with PHASE in {','.join(PHASES)}, got {tok!r}")
+        out[key] = max(1, int(val))
+    return out
+
+def _threadpoolctl():
+    try:
+        import threadpoolctl
+        return threadpoolctl
+    except ImportError:
+        return None
+
+def _numba():
+    """The numba module if the kernels have been loaded, else None (never imports it)."""
+    from . import nbkernels as nbk
+    return nbk._impl.nb if nbk._impl is not None else None
+
+def worker_threads() -> int:
+    return _worker_threads
+
+def init_worker(n: int) -> None:
+    """Process-pool initializer: cap BLAS/Numba threads of a worker (and of its children)."""
+    for v in THREAD_VARS:
+        os.environ[v] = str(n)
+    tp = _threadpoolctl()
+    if tp is not None:
+        tp.threadpool_limits(limits=n)
+    if "numba" in sys.modules:
+        import numba
+        numba.set_num_threads(max(1, min(n, numba.config.NUMBA_NUM_THREADS)))
+
+@dataclass
+class ThreadControl:
+    threads: Optional[int] = None                      # --threads: every phase unless overridden
+    per_phase: Dict[str, int] = field(default_factory=dict)
+    workers: int = 1                                   # threads per worker process
+    _ctl: object = None
+    _numba_target: Optional[int] = None                # count Numba should run with now (None: its default)
+    _numba_default: Optional[int] = None
+
+    def __post_init__(self):
+        global _worker_threads
+        from . import nbkernels as nbk
+        _worker_threads = max(1, int(self.workers))
+        tp = _threadpoolctl()
+        self._ctl = tp.ThreadpoolController() if tp is not None else None
+        if self.threads:
+            self._set_blas(self.threads)
+        nb = _numba()
+        if nb is not None:
+            self._numba_default = nb.get_num_threads()
+        else:
+            nbk.set_load_hook(self._on_numba_load)      # report and apply when a kernel is first needed
+        if self.threads:
+            self._set_numba(self.threads)
+
+    def count(self, phase: str) -> Optional[int]:
+        return self.per_phase.get(PHASE_OF.get(phase, phase), self.threads)
+
+    def _set_blas(self, n: int):
+        """→ limiter to restore the previous counts (None without threadpoolctl)."""
+        if self._ctl is None:
+            return None
+        return self._ctl.limit(limits=n, user_api="blas")
+
+    def _set_numba(self, n: Optional[int]) -> Optional[int]:
+        """Want n Numba threads (None: the default) → the previous target; applied now if loaded, else on load."""
+        prev, self._numba_target = self._numba_target, n
+        nb = _numba()
+        if nb is not None:
+            want = n if n is not None else (self._numba_default or nb.config.NUMBA_NUM_THREADS)
+            nb.set_num_threads(max(1, min(int(want), nb.config.NUMBA_NUM_THREADS)))
+        return prev
+
+    def _on_numba_load(self, nb) -> None:
+        self._numba_default = nb.get_num_threads()
+        self._set_numba(self._numba_target)
+        print(f"[Threads] {self.numba_line()}")
+
+    @contextmanager
+    def phase(self, name: str):
+        n = self.per_phase.get(PHASE_OF.get(name, name))
+        if n is None:
+            yield
+            return
+        lim = self._set_blas(n)
+        prev = self._set_numba(n)
+        try:
+            yield
+        finally:
+            if lim is not None:
+                lim.restore_original_limits()
+            self._set_numba(prev)
+
+    # ---- report ----------------------------------------------------------------
+    def blas_lines(self) -> List[str]:
+        if self._ctl is None:
+            env = " ".join(f"{v}={os.environ[v]}" for v in THREAD_VARS[:3] if v in os.environ) or "library default"
+            return [f"blas: fixed at import ({env}); install threadpoolctl for runtime/per-phase control"]
+        libs = [lib.info() for lib in self._ctl.lib_controllers if lib.info().get("user_api") == "blas"]
+        return [f"blas: {d.get('internal_api')} {d.get('version') or ''} threads={d.get('num_threads')} "
+                f"({os.path.basename(str(d.get('filepath', '')))})" for d in libs] or ["blas: no BLAS library loaded"]
+
+    def numba_line(self) -> str:
+        from . import nbkernels as nbk
+        nb = _numba()
+        if nb is None:
+            if not nbk.NUMBA_OK:
+                return "numba: unavailable"
+            return (f"numba: not loaded (threads={self._numba_target or 'default'} will apply on load)")
+        try:
+            layer = nb.threading_layer()
+        except ValueError:
+            layer = "not started"
+        return f"numba: threads={nb.get_num_threads()}/{nb.config.NUMBA_NUM_THREADS} layer={layer}"
+
+    def report(self) -> None:
+        plan = " ".join(f"{p}={self.count(p) or 'default'}" for p in PHASES)
+        print(f"[Threads] cores={os.cpu_count()} --threads={self.threads or 'default'} phases: {plan} "
+              f"worker processes: {_worker_threads} thread(s) each")
+        for line in self.blas_lines() + [self.numba_line()]:
+            print(f"[Threads] {line}")
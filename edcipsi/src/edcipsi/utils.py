@@ -1,6 +1,6 @@
 from __future__ import annotations
 from datetime import datetime
-import io, os
+import io, os, re
 
 class TeeWithTimestamp(io.TextIOBase):
     """stdout/stderr"""
@@ -45,3 +45,47 @@ def _log_read(path: str):
         ap = str(path)
     print(f"[READ] {ap}")
 
+_BYTE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+def parse_bytes(s) -> int:
+    """'512M', '8G', '1.5TiB', '1000000' → bytes (binary units)."""
+    m = re.fullmatch(r"\s*([0-9.]+(?:E[+-]?[0-9]+)?)\s*([KMGT]?)(?:I?B)?\s*", str(s).upper())
+    try:
+        return int(float(m.group(1)) * _BYTE_UNITS[m.group(2)])
+    except (AttributeError, ValueError):
+        raise ValueError(f"byte size parse error: {s}") from None
+
+def fmt_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024:
+            return f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TiB"
+
+def available_memory() -> int | None:
+    """MemAvailable from /proc/meminfo (bytes), or None if unknown."""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    return None
+
+
+def current_rss() -> int | None:
+    """Resident set size of this process (bytes), from /proc/self/statm."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+def peak_rss() -> int | None:
+    """High-water RSS of this process so far (bytes)."""
+    try:
+        import resource
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+    except Exception:
+        return None
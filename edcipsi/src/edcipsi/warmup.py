@@ -0,0 +1,117 @@
+"""edcipsi warmup: compile every Numba kernel signature into the on-disk cache.
+
+Run once per installation (or per CPU type) before a scan; later runs load the
+machine code from NUMBA_CACHE_DIR instead of JIT-compiling on their first call.
+The cache directory defaults to nbkernels.default_cache_dir()
+(~/.cache/edcipsi/numba, or $EDCIPSI_CACHE_DIR/numba); put it on a shared
+filesystem to reuse it across nodes.
+
+    edcipsi warmup [--cache-dir DIR]
+"""
+from __future__ import annotations
+import argparse, os, time
+import numpy as np
+
+def _tiny_problem():
+    """4-site XXZ ring, Sz=0 basis, canonicalized and packed as the solvers pass it."""
+    from .nbkernels import pack_terms_arrays
+    from .io import canonicalize_terms
+    N = 4
+    diag = {}; bil = []
+    for i in range(N):
+        j = (i + 1) % N
+        for s in (0, 1):
+            for t in (0, 1):
+                diag[(i, s, j, t)] = diag.get((i, s, j, t), 0.0) + (0.25 if s == t else -0.25)
+        bil.append((i, 0, i, 1, j, 1, j, 0, 0.5))
+        bil.append((j, 0, j, 1, i, 1, i, 0, 0.5))
+    diag, bil, _ = canonicalize_terms(diag, bil)
+    basis = np.array([b for b in range(1 << N) if bin(b).count("1") == N // 2], dtype=np.int64)
+    return N, diag, bil, basis, pack_terms_arrays(diag, bil)
+
+def _signatures():
+    """(kernel name, zero-arg call) for every argument-type combination used by the solvers."""
+    from . import nbkernels as nbk
+    from .nbkernels import nnz_row_bounds
+    N, diag, bil, basis, packed = _tiny_problem()
+    (di,dsi,dk,dsk,dcr,dci, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh) = packed
+    order = np.argsort(basis); sorted_bits = basis[order]
+    B = basis.size
+    x = np.ones(B)
+    calls = [
+        ("_h_matvec_nb", lambda: nbk._h_matvec_nb(x, x, basis, sorted_bits, order, *packed)),
+        ("_h_matvec_nb_real", lambda: nbk._h_matvec_nb_real(x, basis, sorted_bits, order,
+                                                            di,dsi,dk,dsk,dcr, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bh)),
+        ("_h_matvec_nb_par", lambda: nbk._h_matvec_nb_par(x, x, basis, sorted_bits, order, *packed)),
+        ("_h_matvec_nb_real_par", lambda: nbk._h_matvec_nb_real_par(x, basis, sorted_bits, order,
+                                                                    di,dsi,dk,dsk,dcr, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bh)),
+    ]
+    # hash-indexed matfree (lookup="hash", picked by --autotune or --lookup hash)
+    keys, vals = nbk._hash_build_nb(basis, 6)
+    calls += [
+        ("_hash_build_nb", lambda: nbk._hash_build_nb(basis, 6)),
+        ("_h_matvec_nb_hash", lambda: nbk._h_matvec_nb_hash(x, x, basis, keys, vals, 58, *packed)),
+        ("_h_matvec_nb_real_hash", lambda: nbk._h_matvec_nb_real_hash(x, basis, keys, vals, 58,
+                                                                      di,dsi,dk,dsk,dcr, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bh)),
+    ]
+    # direct CSR assembly (hbuilder.csr_rows_nb): count pass, then the real/complex fill pass
+    counts = nbk._csr_count_nb(0, B, basis, sorted_bits, order, *packed, False)
+    ip = np.zeros(B + 1, dtype=np.int64); np.cumsum(counts, out=ip[1:])
+    calls.append(("_csr_count_nb", lambda: nbk._csr_count_nb(0, B, basis, sorted_bits, order, *packed, False)))
+    for name, ddt in (("_csr_fill_nb", np.complex128), ("_csr_fill_nb_real", np.float64)):
+        calls.append((name, lambda name=name, ddt=ddt: getattr(nbk, name)(
+            0, B, basis, sorted_bits, order, *packed, False, ip,
+            np.empty(int(ip[-1]), np.int32), np.empty(int(ip[-1]), ddt))))
+    # full ED on a complete sector (fulled.py): enumeration + rank-based matvec
+    from .fulled import binomial_table
+    C = binomial_table(N)
+    calls.append(("_sector_states_nb", lambda: nbk._sector_states_nb(N // 2, B)))
+    calls.append(("_sector_matvec_nb", lambda: nbk._sector_matvec_nb(
+        x.astype(np.complex128), basis, C, False, x, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bci,bh)))
+    calls.append(("_sector_matvec_nb_real", lambda: nbk._sector_matvec_nb_real(
+        x, basis, C, False, x, bi,bsi,bj,bsj,bk,bsk,bl,bsl,bcr,bh)))
+    # small dense-ish CSR (upper triangle is a valid CSR too)
+    rows, cols = np.nonzero(np.ones((B, B)))
+    for itype in (np.int32, np.int64):
+        indptr = np.arange(0, B * B + 1, B, dtype=itype)
+        indices = cols.astype(np.int32)
+        bounds = nnz_row_bounds(indptr, 2)
+        for ddt, xdt in ((np.float64, np.float64), (np.float64, np.complex128), (np.complex128, np.complex128)):
+            data = np.ones(B * B, dtype=ddt); xv = np.ones(B, dtype=xdt)
+            tag = f"[{np.dtype(itype).name},{np.dtype(ddt).name},{np.dtype(xdt).name}]"
+            calls.append(("_csr_matvec_nb" + tag,
+                          lambda ip=indptr, d=data, v=xv, bd=bounds: nbk._csr_matvec_nb(ip, indices, d, v, np.zeros_like(v), bd)))
+            calls.append(("_csr_herm_matvec_nb" + tag,
+                          lambda ip=indptr, d=data, v=xv: nbk._csr_herm_matvec_nb(ip, indices, d, v, np.zeros_like(v))))
+            calls.append(("_csr_herm_matvec_nb_par" + tag,
+                          lambda ip=indptr, d=data, v=xv, bd=bounds: nbk._csr_herm_matvec_nb_par(ip, indices, d, v, np.zeros_like(v), bd)))
+    return calls
+
+def warmup(cache_dir: str | None = None, verbose: bool = True) -> float:
+    from . import nbkernels as nbk
+    if cache_dir:
+        os.environ["NUMBA_CACHE_DIR"] = os.path.abspath(cache_dir)
+    if not nbk.NUMBA_OK or nbk.load_kernels() is None:
+        print("[Warmup] Numba is not available; nothing to compile")
+        return 0.0
+    path = os.environ["NUMBA_CACHE_DIR"]
+    os.makedirs(path, exist_ok=True)
+    if verbose:
+        print(f"[Warmup] NUMBA_CACHE_DIR={path}")
+    t_all = time.perf_counter()
+    for name, call in _signatures():
+        t0 = time.perf_counter(); call()
+        if verbose:
+            print(f"[Warmup] {name:48s} {time.perf_counter()-t0:7.3f}s")
+    dt = time.perf_counter() - t_all
+    print(f"[Warmup] done in {dt:.2f}s")
+    return dt
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="edcipsi warmup", description="Precompile the Numba kernels into the on-disk cache.")
+    ap.add_argument("--cache-dir", default=None,
+                    help="cache directory (default: $NUMBA_CACHE_DIR, else ~/.cache/edcipsi/numba or $EDCIPSI_CACHE_DIR/numba)")
+    ap.add_argument("--quiet", action="store_true")
+    args = ap.parse_args(argv)
+    warmup(args.cache_dir, verbose=not args.quiet)
+    return 0